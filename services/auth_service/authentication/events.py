@@ -0,0 +1,52 @@
+"""
+Auth events published to Redis for other services.
+
+Downstream services cache verified tokens; these events let them drop a
+revoked token or a changed user right away instead of waiting for the
+cache TTL. Tokens are identified by their SHA-256 digest only.
+"""
+import hashlib
+import json
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _client
+
+
+def hash_token(token_key):
+    return hashlib.sha256(token_key.encode('utf-8')).hexdigest()
+
+
+def publish_auth_event(event):
+    """Publish an event; failures are logged, never raised to the caller"""
+    try:
+        get_redis().publish(settings.AUTH_EVENTS_CHANNEL, json.dumps(event))
+    except redis.RedisError as e:
+        logger.error(f"Failed to publish auth event {event['type']}: {e}")
+
+
+def publish_token_revoked(token_key, user_id):
+    publish_auth_event({
+        'type': 'token_revoked',
+        'token_hash': hash_token(token_key),
+        'user_id': str(user_id),
+    })
+
+
+def publish_user_changed(user_id, reason):
+    publish_auth_event({
+        'type': 'user_changed',
+        'user_id': str(user_id),
+        'reason': reason,
+    })
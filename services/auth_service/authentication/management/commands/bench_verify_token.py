@@ -0,0 +1,86 @@
+import os
+import secrets
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from authentication.models import User
+from authentication.tokens import build_user_claims, lookup_token_claims
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 latency of the legacy and fast verify-token lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Users (with tokens) to create')
+        parser.add_argument('--iterations', type=int, default=2000, help='Lookups per variant')
+        parser.add_argument(
+            '--picture-bytes', type=int, default=256 * 1024,
+            help='Size of each user\'s stored profile picture'
+        )
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                token_keys = self._create_users(options['users'], options['picture_bytes'])
+                self._run(token_keys, options['iterations'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_users(self, count, picture_bytes):
+        picture = os.urandom(picture_bytes)
+        token_keys = []
+        for _ in range(count):
+            suffix = secrets.token_hex(8)
+            user = User.objects.create(
+                username=f'bench-{suffix}',
+                email=f'bench-{suffix}@example.com',
+                first_name='Bench',
+                last_name=suffix,
+                profile_picture_data=picture,
+                profile_picture_content_type='image/png',
+            )
+            token_keys.append(Token.objects.create(user=user).key)
+        return token_keys
+
+    def _run(self, token_keys, iterations):
+        authentication = TokenAuthentication()
+
+        def legacy(token_key):
+            # What verify-token did before: full user row, then the claims
+            user, _ = authentication.authenticate_credentials(token_key)
+            return build_user_claims(user)
+
+        variants = [
+            ('legacy (TokenAuthentication)', legacy),
+            ('fast (projected query)', lambda token_key: lookup_token_claims(token_key, use_cache=False)),
+            ('fast (claims cache)', lookup_token_claims),
+        ]
+
+        self.stdout.write(f"{'variant':<32}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for label, lookup in variants:
+            for token_key in token_keys:  # warm up connections and caches
+                lookup(token_key)
+            samples = []
+            for i in range(iterations):
+                token_key = token_keys[i % len(token_keys)]
+                start = time.perf_counter()
+                lookup(token_key)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            self.stdout.write(
+                f'{label:<32}'
+                f'{samples[len(samples) // 2]:>10.3f}'
+                f'{samples[min(len(samples) - 1, int(len(samples) * 0.99))]:>10.3f}'
+                f'{statistics.mean(samples):>10.3f}'
+            )
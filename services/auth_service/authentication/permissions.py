@@ -0,0 +1,16 @@
+import secrets
+
+from django.conf import settings
+from rest_framework import permissions
+
+
+class IsInternalService(permissions.BasePermission):
+    """
+    Allow requests from other Prismeet services, identified by the shared
+    INTERNAL_SERVICE_TOKEN in the X-Service-Token header
+    """
+
+    def has_permission(self, request, view):
+        expected = settings.INTERNAL_SERVICE_TOKEN
+        provided = request.META.get('HTTP_X_SERVICE_TOKEN', '')
+        return bool(expected) and secrets.compare_digest(provided, expected)
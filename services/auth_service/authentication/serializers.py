@@ -363,4 +363,21 @@ class EmailVerificationSerializer(serializers.Serializer):
                 raise serializers.ValidationError("Email is already verified.")
         except User.DoesNotExist:
             raise serializers.ValidationError("Invalid verification token.")
-        return value
\ No newline at end of file
+        return value
+
+
+class TokenBatchVerifySerializer(serializers.Serializer):
+    """
+    Serializer for batch token verification
+    """
+    tokens = serializers.ListField(
+        child=serializers.CharField(max_length=64),
+        allow_empty=False,
+    )
+
+    def validate_tokens(self, value):
+        max_size = settings.VERIFY_TOKEN_BATCH_MAX_SIZE
+        if len(value) > max_size:
+            raise serializers.ValidationError(f"At most {max_size} tokens can be verified at once.")
+        # Keep the caller's order but drop duplicates
+        return list(dict.fromkeys(value))
@@ -1,8 +1,12 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in
 from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from .events import publish_token_revoked, publish_user_changed
 from .models import User, UserProfile
+from .tokens import CLAIM_FIELDS, invalidate_token_claims
 
 
 @receiver(post_save, sender=User)
@@ -29,4 +33,56 @@ def update_last_login(sender, user, request, **kwargs):
     Update last login timestamp when user logs in
     """
     user.last_login_at = timezone.now()
-    user.save(update_fields=['last_login_at'])
\ No newline at end of file
+    user.save(update_fields=['last_login_at'])
+
+
+@receiver(post_delete, sender=Token)
+def publish_token_revocation(sender, instance, **kwargs):
+    """
+    Tell other services a token is gone (logout, password change, user deletion)
+    """
+    token_key, user_id = instance.key, instance.user_id
+
+    def on_commit():
+        invalidate_token_claims([token_key])
+        publish_token_revoked(token_key, user_id)
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(pre_save, sender=User)
+def track_claim_changes(sender, instance, update_fields=None, **kwargs):
+    """
+    Remember whether this save changes any user claims shared with other services
+    """
+    instance._claims_change_reason = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & set(CLAIM_FIELDS):
+        return
+
+    previous = User.objects.filter(pk=instance.pk).values(*CLAIM_FIELDS).first()
+    if previous is None:
+        return
+    if previous['is_active'] and not instance.is_active:
+        instance._claims_change_reason = 'deactivated'
+    elif any(previous[field] != getattr(instance, field) for field in CLAIM_FIELDS):
+        instance._claims_change_reason = 'updated'
+
+
+@receiver(post_save, sender=User)
+def publish_user_change(sender, instance, created, **kwargs):
+    """
+    Drop cached claims for a user whose claims changed, here and in other services
+    """
+    reason = getattr(instance, '_claims_change_reason', None)
+    if reason:
+        instance._claims_change_reason = None
+        user_id = instance.pk
+        token_keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+        def on_commit():
+            invalidate_token_claims(token_keys)
+            publish_user_changed(user_id, reason)
+
+        transaction.on_commit(on_commit)
@@ -1,3 +1,137 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import User
+from .tokens import build_user_claims
+
+
+class AuthServiceTestCase(TestCase):
+
+    def setUp(self):
+        # Auth events go to Redis, which the tests do not need
+        for name in ('publish_token_revoked', 'publish_user_changed'):
+            patcher = mock.patch(f'authentication.signals.{name}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = self.create_user('ada@example.com')
+        self.token = Token.objects.create(user=self.user)
+
+    def create_user(self, email, **fields):
+        return User.objects.create_user(
+            email=email, username=email, first_name='Ada', last_name='Lovelace', password='secret-password', **fields
+        )
+
+
+class AccessTokenTests(AuthServiceTestCase):
+
+    def test_access_token_carries_user_claims(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post('/api/auth/token/access/')
+
+        self.assertEqual(response.status_code, 200)
+        claims = AccessToken(response.data['access_token']).payload
+        self.assertEqual(claims['user_id'], str(self.user.id))
+        self.assertEqual(claims['email'], 'ada@example.com')
+        self.assertEqual(claims['full_name'], 'Ada Lovelace')
+        self.assertTrue(claims['is_active'])
+        self.assertNotIn('id', claims)
+        self.assertEqual(
+            response.data['access_token_expires_in'], settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds()
+        )
+
+    def test_access_token_requires_authentication(self):
+        self.assertEqual(APIClient().post('/api/auth/token/access/').status_code, 403)
+
+
+@override_settings(INTERNAL_SERVICE_TOKEN='service-secret', VERIFY_TOKEN_BATCH_MAX_SIZE=3)
+class VerifyTokenBatchTests(AuthServiceTestCase):
+
+    def verify(self, tokens, service_token='service-secret'):
+        return APIClient().post(
+            '/api/auth/verify-token/batch/', {'tokens': tokens}, format='json', HTTP_X_SERVICE_TOKEN=service_token
+        )
+
+    def test_valid_and_invalid_tokens_are_split(self):
+        inactive = self.create_user('grace@example.com', is_active=False)
+        inactive_token = Token.objects.create(user=inactive)
+
+        response = self.verify([self.token.key, 'unknown', inactive_token.key])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results']), [self.token.key])
+        self.assertEqual(response.data['results'][self.token.key]['id'], str(self.user.id))
+        self.assertEqual(response.data['invalid'], ['unknown', inactive_token.key])
+
+    def test_batch_is_one_query_without_duplicates(self):
+        with self.assertNumQueries(1):
+            response = self.verify(['unknown', self.token.key, 'unknown'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results']), [self.token.key])
+        self.assertEqual(response.data['invalid'], ['unknown'])
+
+    def test_batch_size_is_bounded(self):
+        self.assertEqual(self.verify(['a', 'b', 'c', 'd']).status_code, 400)
+
+    def test_requires_service_token(self):
+        self.assertEqual(self.verify([self.token.key], service_token='wrong').status_code, 403)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'claims': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'claims'},
+})
+class VerifyTokenTests(AuthServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['claims'].clear()
+
+    def verify(self, token_key):
+        return APIClient().get('/api/auth/verify-token/', HTTP_AUTHORIZATION=f'Token {token_key}')
+
+    def test_claims_come_from_one_query_then_the_cache(self):
+        with self.assertNumQueries(1):
+            response = self.verify(self.token.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), build_user_claims(self.user))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify(self.token.key).json(), build_user_claims(self.user))
+
+    def test_unknown_and_missing_tokens_are_refused(self):
+        self.assertEqual(self.verify('unknown').status_code, 401)
+        self.assertEqual(APIClient().get('/api/auth/verify-token/').status_code, 401)
+
+    def test_deactivation_drops_cached_claims(self):
+        self.verify(self.token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertEqual(self.verify(self.token.key).status_code, 401)
+
+    def test_claim_change_is_served_fresh(self):
+        self.verify(self.token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Augusta'
+            self.user.save()
+
+        self.assertEqual(self.verify(self.token.key).json()['first_name'], 'Augusta')
+
+    def test_deleted_token_drops_cached_claims(self):
+        self.verify(self.token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+
+        self.assertEqual(self.verify(self.token.key).status_code, 401)
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from redis.exceptions import RedisError
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = logging.getLogger(__name__)
+
+# User fields that end up in build_user_claims(); changing any of them
+# invalidates what other services have cached for the user
+CLAIM_FIELDS = ('email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+# The only columns read when resolving a token to claims: the token's primary
+# key lookup joined to these user fields, never the binary profile picture
+TOKEN_CLAIM_COLUMNS = ('key', 'user_id') + tuple(f'user__{field}' for field in CLAIM_FIELDS)
+
+
+def build_user_claims(user):
+    """
+    User data shared with other services, both by the verify-token
+    endpoint and inside signed access tokens
+    """
+    return {
+        'id': str(user.id),
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'full_name': user.get_full_name(),
+        'is_active': user.is_active,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+    }
+
+
+def issue_access_token(user):
+    """
+    Issue a short-lived signed access token carrying the user's claims.
+
+    Other services can verify it locally against the shared signing key
+    instead of calling verify-token/ on every request.
+    """
+    token = AccessToken.for_user(user)
+    for claim, value in build_user_claims(user).items():
+        if claim != 'id':  # carried as the user_id claim
+            token[claim] = value
+
+    return {
+        'access_token': str(token),
+        'access_token_expires_in': int(settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds()),
+    }
+
+
+def _claims_from_row(row):
+    """build_user_claims() for a TOKEN_CLAIM_COLUMNS row"""
+    first_name, last_name = row['user__first_name'], row['user__last_name']
+    return {
+        'id': str(row['user_id']),
+        'email': row['user__email'],
+        'first_name': first_name,
+        'last_name': last_name,
+        'full_name': f'{first_name} {last_name}'.strip(),
+        'is_active': row['user__is_active'],
+        'is_staff': row['user__is_staff'],
+        'is_superuser': row['user__is_superuser'],
+    }
+
+
+def _claims_cache_key(token_key):
+    return 'verify-token:' + hashlib.sha256(token_key.encode('utf-8')).hexdigest()
+
+
+def _claims_cache():
+    options = settings.VERIFY_TOKEN_CACHE
+    return caches[options['ALIAS']] if options['ENABLED'] else None
+
+
+def lookup_token_claims(token_key, use_cache=True):
+    """
+    Resolve an opaque DRF token to its user's claims, or None if the token
+    is unknown or the user inactive.
+
+    Claims are served from the VERIFY_TOKEN_CACHE when enabled; otherwise a
+    single projected query by token key is made.
+    """
+    cache = _claims_cache() if use_cache else None
+    if cache is not None:
+        try:
+            claims = cache.get(_claims_cache_key(token_key))
+        except RedisError as e:
+            logger.warning(f"Token claims cache unavailable: {e}")
+            cache = None
+        else:
+            if claims is not None:
+                return claims
+
+    row = Token.objects.filter(key=token_key).values(*TOKEN_CLAIM_COLUMNS).first()
+    if row is None or not row['user__is_active']:
+        return None
+
+    claims = _claims_from_row(row)
+    if cache is not None:
+        try:
+            cache.set(_claims_cache_key(token_key), claims, settings.VERIFY_TOKEN_CACHE['TIMEOUT'])
+        except RedisError as e:
+            logger.warning(f"Token claims cache unavailable: {e}")
+    return claims
+
+
+def lookup_tokens_claims(token_keys):
+    """Batch lookup_token_claims() in one query; returns token -> claims for valid tokens"""
+    rows = Token.objects.filter(key__in=token_keys).values(*TOKEN_CLAIM_COLUMNS)
+    return {row['key']: _claims_from_row(row) for row in rows if row['user__is_active']}
+
+
+def invalidate_token_claims(token_keys):
+    """Drop cached claims for these tokens"""
+    cache = _claims_cache()
+    if cache is None or not token_keys:
+        return
+    try:
+        cache.delete_many([_claims_cache_key(token_key) for token_key in token_keys])
+    except RedisError as e:
+        logger.error(f"Failed to invalidate cached token claims: {e}")
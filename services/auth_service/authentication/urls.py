@@ -32,4 +32,8 @@ urlpatterns = [
 
     # Token verification for inter-service communication
     path('verify-token/', views.verify_token, name='verify_token'),
+    path('verify-token/batch/', views.verify_token_batch, name='verify_token_batch'),
+
+    # Short-lived signed access token, verified locally by other services
+    path('token/access/', views.access_token, name='access_token'),
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
@@ -27,8 +27,10 @@ from .serializers import (
     PasswordResetConfirmSerializer,
     EmailVerificationSerializer,
     ProfilePictureUploadSerializer,
-    UserSerializer
+    TokenBatchVerifySerializer,
 )
+from .permissions import IsInternalService
+from .tokens import issue_access_token, lookup_token_claims, lookup_tokens_claims
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +74,8 @@ def register(request):
             return Response({
                 'message': 'Registration successful. Please check your email to verify your account.',
                 'user': UserProfileSerializer(user).data,
-                'token': token.key
+                'token': token.key,
+                **issue_access_token(user)
             }, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -107,7 +110,8 @@ def login_view(request):
         return Response({
             'message': 'Login successful',
             'user': UserProfileSerializer(user).data,
-            'token': token.key
+            'token': token.key,
+            **issue_access_token(user)
         }, status=status.HTTP_200_OK)
 
     # Log failed attempt
@@ -204,7 +208,8 @@ def google_auth(request):
             return Response({
                 'message': 'Google authentication successful',
                 'user': UserProfileSerializer(user).data,
-                'token': token.key
+                'token': token.key,
+                **issue_access_token(user)
             }, status=status.HTTP_200_OK)
 
         except ValueError as e:
@@ -347,7 +352,8 @@ def change_password(request):
 
         return Response({
             'message': 'Password changed successfully',
-            'token': token.key
+            'token': token.key,
+            **issue_access_token(user)
         }, status=status.HTTP_200_OK)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -538,32 +544,51 @@ def health_check(request):
     })
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@require_http_methods(["GET"])
 def verify_token(request):
     """
-    Verify Google OAuth token and return user data for inter-service communication
+    Verify a token and return user data for inter-service communication.
+
+    Called for every meeting-service request that misses its token cache, so
+    it bypasses DRF authentication: the token is resolved with one indexed,
+    projected query (or from the claims cache) instead of loading the full
+    user row.
     """
-    try:
-        user_data = {
-            'id': str(request.user.id),
-            'email': request.user.email,
-            'first_name': request.user.first_name,
-            'last_name': request.user.last_name,
-            'full_name': request.user.get_full_name(),
-            'is_active': request.user.is_active,
-            'is_staff': request.user.is_staff,
-            'is_superuser': request.user.is_superuser,
-        }
-        
-        # Add profile picture if available
-        if hasattr(request.user, 'profile') and request.user.profile.profile_picture:
-            user_data['profile_picture'] = request.user.profile.profile_picture.url
-            
-        return Response(user_data, status=status.HTTP_200_OK)
-        
-    except Exception as e:
-        return Response(
-            {'error': 'Failed to verify token'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
\ No newline at end of file
+    keyword, _, token_key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if keyword not in ('Bearer', 'Token') or not token_key:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    claims = lookup_token_claims(token_key.strip())
+    if claims is None:
+        return JsonResponse({'detail': 'Invalid token.'}, status=401)
+    return JsonResponse(claims)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([IsInternalService])
+def verify_token_batch(request):
+    """
+    Verify many tokens in one round trip for inter-service communication.
+
+    Returns a token -> user data map for valid tokens of active users and
+    lists the rest as invalid.
+    """
+    serializer = TokenBatchVerifySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    tokens = serializer.validated_data['tokens']
+
+    results = lookup_tokens_claims(tokens)
+    return Response({
+        'results': results,
+        'invalid': [token for token in tokens if token not in results],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def access_token(request):
+    """
+    Issue a fresh short-lived signed access token for the current user
+    """
+    return Response(issue_access_token(request.user), status=status.HTTP_200_OK)
@@ -186,11 +186,58 @@ if not DEBUG:
     MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-# Token Authentication Settings
-REST_FRAMEWORK_SIMPLEJWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
+# Signed access tokens for inter-service communication.
+# Downstream services verify these locally with the shared JWT_SECRET_KEY,
+# so they are kept short-lived; the opaque DRF token stays the long-lived credential.
+JWT_SETTINGS = {
+    'ALGORITHM': config('JWT_ALGORITHM', default='HS256'),
+    'SECRET_KEY': config('JWT_SECRET_KEY', default=SECRET_KEY),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=config('JWT_ACCESS_TOKEN_MINUTES', default=15, cast=int)),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
-    'ROTATE_REFRESH_TOKENS': True,
+    'ISSUER': config('JWT_ISSUER', default='prismeet-auth'),
+}
+
+# Shared secret other services send in X-Service-Token for internal-only endpoints
+INTERNAL_SERVICE_TOKEN = config('INTERNAL_SERVICE_TOKEN', default='')
+
+# Redis pub/sub channel for token revocation and user change events.
+# Downstream services evict cached token verifications when these arrive.
+REDIS_URL = config('REDIS_URL', default='redis://redis:6379/0')
+AUTH_EVENTS_CHANNEL = config('AUTH_EVENTS_CHANNEL', default='prismeet:auth:events')
+
+# Claims cache for verify-token/, invalidated when a token is deleted or a user's claims change
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'claims': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'auth',
+        'OPTIONS': {
+            'socket_timeout': 0.5,
+            'socket_connect_timeout': 0.5,
+        },
+    },
+}
+
+VERIFY_TOKEN_CACHE = {
+    'ENABLED': config('VERIFY_TOKEN_CACHE_ENABLED', default=True, cast=bool),
+    'ALIAS': 'claims',
+    'TIMEOUT': config('VERIFY_TOKEN_CACHE_TIMEOUT', default=300, cast=int),  # seconds
+}
+
+# Upper bound on tokens accepted by verify-token/batch/
+VERIFY_TOKEN_BATCH_MAX_SIZE = config('VERIFY_TOKEN_BATCH_MAX_SIZE', default=500, cast=int)
+
+SIMPLE_JWT = {
+    'ALGORITHM': JWT_SETTINGS['ALGORITHM'],
+    'SIGNING_KEY': JWT_SETTINGS['SECRET_KEY'],
+    'ACCESS_TOKEN_LIFETIME': JWT_SETTINGS['ACCESS_TOKEN_LIFETIME'],
+    'REFRESH_TOKEN_LIFETIME': JWT_SETTINGS['REFRESH_TOKEN_LIFETIME'],
+    'ISSUER': JWT_SETTINGS['ISSUER'],
+    'USER_ID_FIELD': 'id',
+    'USER_ID_CLAIM': 'user_id',
 }
 
 # Session Settings
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "meetings.middleware.AuthStaleHeaderMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -96,11 +97,47 @@ JWT_SETTINGS = {
     'SECRET_KEY': config('JWT_SECRET_KEY'),
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'ISSUER': config('JWT_ISSUER', default='prismeet-auth'),
+    'LEEWAY': timedelta(seconds=config('JWT_LEEWAY_SECONDS', default=5, cast=int)),
+}
+
+# Signed access tokens issued by the auth service are verified locally
+# (signature + expiry) by meetings.authentication.SignedClaimsAuthentication
+SIMPLE_JWT = {
+    'ALGORITHM': JWT_SETTINGS['ALGORITHM'],
+    'SIGNING_KEY': JWT_SETTINGS['SECRET_KEY'],
+    'ACCESS_TOKEN_LIFETIME': JWT_SETTINGS['ACCESS_TOKEN_LIFETIME'],
+    'REFRESH_TOKEN_LIFETIME': JWT_SETTINGS['REFRESH_TOKEN_LIFETIME'],
+    'ISSUER': JWT_SETTINGS['ISSUER'],
+    'LEEWAY': JWT_SETTINGS['LEEWAY'],
+    'AUTH_HEADER_TYPES': ('Bearer', 'Token'),
+    'USER_ID_CLAIM': 'user_id',
 }
 
 # Auth service configuration
 AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://auth_service:8001')
 
+# Pooled keep-alive clients for calls to other services (meetings.service_client).
+# Timeouts are in seconds; retries only apply to idempotent requests.
+SERVICE_CLIENTS = {
+    'auth': {
+        'BASE_URL': AUTH_SERVICE_URL,
+        'CONNECT_TIMEOUT': config('AUTH_SERVICE_CONNECT_TIMEOUT', default=1.0, cast=float),
+        'READ_TIMEOUT': config('AUTH_SERVICE_READ_TIMEOUT', default=3.0, cast=float),
+        'MAX_RETRIES': config('AUTH_SERVICE_MAX_RETRIES', default=2, cast=int),
+        'POOL_MAXSIZE': config('AUTH_SERVICE_POOL_MAXSIZE', default=32, cast=int),
+        'HEADERS': {'X-Service-Token': config('INTERNAL_SERVICE_TOKEN', default='')},
+        # Fail fast instead of queueing behind timeouts while the auth service is down
+        'CIRCUIT_BREAKER': {
+            'FAILURE_THRESHOLD': config('AUTH_SERVICE_BREAKER_THRESHOLD', default=5, cast=int),
+            'RESET_TIMEOUT': config('AUTH_SERVICE_BREAKER_RESET_TIMEOUT', default=10.0, cast=float),  # seconds
+        },
+    },
+}
+
+# Tokens per request to the auth service's verify-token/batch/ endpoint
+VERIFY_TOKEN_BATCH_SIZE = config('VERIFY_TOKEN_BATCH_SIZE', default=500, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -137,6 +174,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
+        "meetings.authentication.SignedClaimsAuthentication",
+        "meetings.authentication.GuestTokenAuthentication",
         "meetings.authentication.GoogleOAuthAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
@@ -158,6 +197,8 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Response headers the frontend reads (stale auth fallback, meeting placement hint)
+CORS_EXPOSE_HEADERS = ['X-Auth-Stale', 'X-Meeting-Node']
 
 # Allow both authenticated and anonymous users for meeting joins
 ALLOW_ANONYMOUS_MEETING_JOIN = True
@@ -168,13 +209,65 @@ REDIS_URL = config('REDIS_URL', default='redis://redis:6379/0')
 # Channels Configuration for WebSocket support
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        # Redis channel layer sharded over a hash ring that delivers
+        # process-local group traffic in memory
+        "BACKEND": "meetings.channel_layers.LocalFastPathChannelLayer",
         "CONFIG": {
-            "hosts": [REDIS_URL],
+            # Adding a shard moves only the groups that land on its ring points
+            "hosts": config('CHANNEL_REDIS_HOSTS', default=REDIS_URL, cast=Csv()),
+            # One lane per class, received control first, each holding up to
+            # `capacity` messages per process for at most `expiry` seconds
+            "message_classes": {
+                'signaling': {'capacity': 1000, 'expiry': 10},
+                'chat': {'capacity': 500, 'expiry': 30},
+                'control': {'capacity': 2000, 'expiry': 60},
+            },
         },
     },
 }
 
+# Meeting websocket tunables (see meetings/realtime.py)
+REALTIME_SETTINGS = {
+    'CHANNEL_REGISTRY_TTL': 60 * 60 * 12,  # seconds
+    'ICE_COALESCE_WINDOW': config('ICE_COALESCE_WINDOW', default=0.01, cast=float),  # seconds, 0 disables
+    'ICE_COALESCE_MAX_BATCH': 32,
+    'LIVE_STATE_TTL': 60 * 60 * 24,  # seconds
+    'LIVE_STATE_FLUSH_INTERVAL': config('LIVE_STATE_FLUSH_INTERVAL', default=5.0, cast=float),  # seconds
+    'LIVE_STATE_FLUSH_BATCH': 200,  # meetings per flush pass
+    'ROSTER_TTL': 60 * 60 * 24,  # seconds
+    'ROSTER_LOG_SIZE': config('ROSTER_LOG_SIZE', default=256, cast=int),  # changes kept for delta sync
+    'OUTBOUND_QUEUE_MAX_DEPTH': config('OUTBOUND_QUEUE_MAX_DEPTH', default=256, cast=int),  # frames per socket
+    'OUTBOUND_OVER_BUDGET_GRACE': 5.0,  # seconds over the depth before disconnecting
+    'RATE_LIMITS': {  # message type -> (frames per second, burst); '*' covers every frame
+        '*': (50.0, 200),
+        'ping': (1.0, 5),
+        'join_room': (0.5, 5),
+        'resume': (0.5, 5),
+        'webrtc_offer': (5.0, 20),
+        'webrtc_answer': (5.0, 20),
+        'ice_candidate': (50.0, 200),
+        'media_control': (5.0, 20),
+        'screen_share': (1.0, 5),
+        'chat_message': (config('CHAT_MESSAGES_PER_SECOND', default=2.0, cast=float), 10),
+        'connection_stats': (1.0, 5),
+    },
+    'RATE_LIMIT_VIOLATIONS': (1.0, 20),  # throttled frames tolerated before disconnecting
+    'HEARTBEAT_INTERVAL': 15,  # seconds between client pings
+    'PRESENCE_TTL': config('PRESENCE_TTL', default=45, cast=int),  # seconds without a ping before reaping
+    'REAPER_INTERVAL': 5.0,  # seconds
+    'REAPER_BATCH': 500,  # sockets per reaper round trip
+    'DRAIN_TIMEOUT': 10.0,  # seconds to flush sockets on worker shutdown
+    'DRAIN_RECONNECT_SPREAD': 5.0,  # seconds clients spread reconnects over
+    'NODE_ID': config('MEETING_NODE_ID', default=''),  # defaults to the hostname
+    'NODE_ADDRESS': config('MEETING_NODE_ADDRESS', default=''),  # host:port the gateway can reach this node on
+    'NODE_HEARTBEAT_INTERVAL': 5.0,  # seconds
+    'NODE_TTL': 15,  # seconds without a heartbeat before a node stops receiving meetings
+    'NODE_CACHE_TTL': 2.0,  # seconds a process reuses its view of the live nodes
+    'RESUME_GRACE': config('RESUME_GRACE', default=30, cast=int),  # seconds a dropped socket can resume, 0 disables
+    'RESUME_TOKEN_MAX_AGE': 60 * 60 * 12,  # seconds
+    'SESSION_RECHECK_INTERVAL': config('SESSION_RECHECK_INTERVAL', default=300, cast=int),  # seconds, 0 disables
+}
+
 # WebRTC Configuration
 WEBRTC_SETTINGS = {
     'STUN_SERVERS': config('WEBRTC_STUN_SERVERS', default='stun:stun.l.google.com:19302', cast=Csv()),
@@ -193,6 +286,7 @@ MEETING_SETTINGS = {
     'MEETING_ID_LENGTH': 9,  # Based on your generate_meeting_id method
     'PASSCODE_LENGTH': 6,    # Based on your generate_passcode method
     'INVITATION_EXPIRY_DAYS': 7,  # Based on your invitation logic
+    'GUEST_TOKEN_MAX_AGE': config('GUEST_TOKEN_MAX_AGE', default=60 * 60 * 12, cast=int),  # seconds
 }
 
 # Frontend URL
@@ -288,6 +382,24 @@ CACHES = {
     }
 }
 
+# Verified-token cache in front of the auth service (hashed token -> user data)
+TOKEN_CACHE_SETTINGS = {
+    'ENABLED': config('TOKEN_CACHE_ENABLED', default=True, cast=bool),
+    'LOCAL_MAX_ENTRIES': config('TOKEN_CACHE_LOCAL_MAX_ENTRIES', default=10000, cast=int),
+    # Revocations and user changes are pushed by the auth service on REVOCATION_CHANNEL,
+    # so cached entries can live for many minutes
+    'LOCAL_TTL': config('TOKEN_CACHE_LOCAL_TTL', default=300, cast=int),  # seconds, in-process tier
+    'SHARED_TTL': config('TOKEN_CACHE_SHARED_TTL', default=900, cast=int),  # seconds, Redis tier
+    # Verified identities are still accepted this long past expiry while the auth service is down
+    'STALE_TTL': config('TOKEN_CACHE_STALE_TTL', default=300, cast=int),  # seconds
+    'NEGATIVE_TTL': config('TOKEN_CACHE_NEGATIVE_TTL', default=30, cast=int),  # seconds, rejected tokens
+    'LISTEN_FOR_REVOCATIONS': config('TOKEN_CACHE_LISTEN_FOR_REVOCATIONS', default=True, cast=bool),
+    'REVOCATION_CHANNEL': config('AUTH_EVENTS_CHANNEL', default='prismeet:auth:events'),
+    # Cross-process single-flight: one process verifies a token while the others wait for it
+    'FILL_LOCK_TTL': 5,  # seconds
+    'FILL_LOCK_WAIT': 1.0,  # seconds
+}
+
 # Celery Configuration for background tasks (optional)
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
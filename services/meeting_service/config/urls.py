@@ -8,7 +8,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
 
     # Meeting service URLs
-    path('', include('meeting_service.urls')),
+    path('', include('meetings.urls')),
 
 ]
 
@@ -0,0 +1,77 @@
+"""
+Gunicorn worker serving the ASGI application (HTTP and websockets) with uvicorn.
+
+The stock UvicornWorker closes every websocket with 1012 as soon as it is
+asked to stop. MeetingUvicornWorker drains them first (meetings/shutdown.py):
+clients are told to reconnect with jitter and queued frames go out before
+the sockets close, then uvicorn's own shutdown runs. While it serves, the
+worker also heartbeats its node into the placement registry
+(meetings/placement.py) and re-checks the sessions behind its sockets
+(meetings/sessions.py).
+"""
+import asyncio
+import logging
+import sys
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn.workers import UvicornWorker
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(Server):
+    _heartbeat = None
+    _session_recheck = None
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        # Imported here: the app (and Django) is only loaded once the worker runs
+        from meetings.placement import run_node_heartbeat
+        from meetings.sessions import run_session_recheck
+
+        self._heartbeat = asyncio.ensure_future(run_node_heartbeat())
+        self._session_recheck = asyncio.ensure_future(run_session_recheck())
+
+    async def shutdown(self, sockets=None):
+        from meetings.placement import leave_placement
+        from meetings.shutdown import drain_sockets
+
+        # Stop accepting first so no new socket lands here while draining, and
+        # stop new meetings from being placed on this node
+        for server in self.servers:
+            server.close()
+        if self._session_recheck is not None:
+            self._session_recheck.cancel()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await leave_placement()
+            except Exception as e:
+                logger.warning(f"Could not leave the node registry: {e}")
+        await drain_sockets()
+        await super().shutdown(sockets=sockets)
+
+
+class MeetingUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        'loop': 'auto',
+        'http': 'auto',
+        'ws': 'websockets',
+        # ProtocolTypeRouter in config/asgi.py has no lifespan handler
+        'lifespan': 'off',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Leave time for disconnect handlers after the drain, within gunicorn's graceful_timeout
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - 5)
+
+    async def _serve(self):
+        # UvicornWorker._serve with the draining server
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
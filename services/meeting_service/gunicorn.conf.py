@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for serving the meeting service over ASGI:
+
+    gunicorn config.asgi:application -c gunicorn.conf.py
+
+One uvicorn worker by default. Meetings are placed on nodes
+(meetings/placement.py) and a room's group sends only skip Redis when all
+of its sockets share a process, so a node is one serving process; scale
+out by running more nodes, each with its own MEETING_NODE_ID and
+MEETING_NODE_ADDRESS. WEB_CONCURRENCY > 1 still works, with room traffic
+between the workers going through the channel layer.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'config.workers.MeetingUvicornWorker'
+
+# Websockets are long-lived, so no max_requests recycling; the worker
+# timeout only catches a blocked event loop
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# Long enough for the socket drain plus disconnect handlers
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+backlog = 2048
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -1,13 +1,27 @@
 import requests
 from django.conf import settings
+from django.core import signing
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth.models import AnonymousUser
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 import logging
 
+from .service_client import get_service_client
+from .singleflight import SingleFlight
+from .token_cache import INVALID_TOKEN, get_token_cache, hash_token
+from .tokens import verify_guest_token
+
 logger = logging.getLogger(__name__)
 
+# Concurrent verifications of the same token within this process share one upstream call
+token_verifications = SingleFlight('token_verification')
+
+
+class AuthServiceUnavailable(AuthenticationFailed):
+    """The auth service could not give a verdict (down, erroring or circuit open)"""
+
 
 class GoogleOAuthUser:
     """
@@ -24,6 +38,8 @@ class GoogleOAuthUser:
         self.is_staff = user_data.get('is_staff', False)
         self.is_superuser = user_data.get('is_superuser', False)
         self.profile_picture = user_data.get('profile_picture')
+        # Identity served from an expired cache entry during an auth service outage
+        self.auth_stale = user_data.get('auth_stale', False)
         
     def get_full_name(self):
         return self.full_name
@@ -35,6 +51,187 @@ class GoogleOAuthUser:
         return self.email
 
 
+def is_signed_token(token):
+    """Signed access tokens are JWTs; legacy DRF tokens are opaque hex keys"""
+    if isinstance(token, bytes):
+        return token.count(b'.') == 2
+    return token.count('.') == 2
+
+
+def user_data_from_claims(claims):
+    """Map signed access token claims to the verify-token user data shape"""
+    return {
+        'id': claims.get('user_id'),
+        'email': claims.get('email'),
+        'first_name': claims.get('first_name', ''),
+        'last_name': claims.get('last_name', ''),
+        'full_name': claims.get('full_name', ''),
+        'is_active': claims.get('is_active', True),
+        'is_staff': claims.get('is_staff', False),
+        'is_superuser': claims.get('is_superuser', False),
+    }
+
+
+def verify_token_with_auth_service(token):
+    """
+    Resolve a bearer token to the auth service's user data.
+
+    Verified tokens are served from the two-tier token cache; only misses
+    make the round trip to the auth service's verify-token endpoint, and
+    concurrent misses for the same token share a single round trip.
+    Raises AuthenticationFailed when the token is rejected or the auth
+    service cannot be reached.
+
+    During an outage a token verified within the cache's stale grace period
+    is still accepted; its user data then carries auth_stale=True.
+    """
+    token_cache = get_token_cache()
+    user_data = token_cache.get(token)
+    if user_data is INVALID_TOKEN:
+        raise AuthenticationFailed('Invalid or expired token')
+    if user_data is not None:
+        return user_data
+
+    try:
+        return token_verifications.do(hash_token(token), lambda: _verify_and_cache(token))
+    except AuthServiceUnavailable:
+        user_data = token_cache.get_stale(token)
+        if user_data is None:
+            raise
+        logger.warning("Auth service unavailable, accepting a stale cached identity")
+        return {**user_data, 'auth_stale': True}
+
+
+def _verify_and_cache(token):
+    """
+    Verify a token upstream, coordinating with other processes.
+
+    Only the holder of the token's fill lock calls the auth service; other
+    processes wait briefly for it to fill the shared tier before falling
+    back to their own request. Rejected tokens are negatively cached.
+    """
+    # Don't wait on the fill lock for a call that would be refused anyway
+    if get_service_client('auth').breaker.is_open():
+        raise AuthServiceUnavailable('Authentication service unavailable')
+
+    token_cache = get_token_cache()
+    lock = token_cache.acquire_fill_lock(token)
+    if lock is None:
+        user_data = token_cache.wait_for_fill(token)
+        if user_data is INVALID_TOKEN:
+            raise AuthenticationFailed('Invalid or expired token')
+        if user_data is not None:
+            return user_data
+
+    try:
+        try:
+            user_data = _request_user_data(token)
+        except AuthServiceUnavailable:
+            raise
+        except AuthenticationFailed:
+            token_cache.set_invalid(token)
+            raise
+        token_cache.set(token, user_data)
+        return user_data
+    finally:
+        if lock is not None:
+            token_cache.release_fill_lock(lock)
+
+
+def verify_tokens_batch(tokens):
+    """
+    Resolve many opaque tokens at once, e.g. to re-check open sockets' sessions.
+
+    Cached tokens are answered locally; the rest are sent to the auth
+    service's batch endpoint in chunks and cached. Returns a
+    token -> user data map containing only the valid tokens.
+    """
+    token_cache = get_token_cache()
+    results = {}
+    misses = []
+    for token in dict.fromkeys(tokens):
+        user_data = token_cache.get(token)
+        if user_data is None:
+            misses.append(token)
+        elif user_data is not INVALID_TOKEN:
+            results[token] = user_data
+
+    chunk_size = settings.VERIFY_TOKEN_BATCH_SIZE
+    for start in range(0, len(misses), chunk_size):
+        try:
+            response = get_service_client('auth').post(
+                '/api/auth/verify-token/batch/',
+                json={'tokens': misses[start:start + chunk_size]},
+                retry=True
+            )
+        except requests.RequestException as e:
+            logger.error(f"Auth service batch request failed: {e}")
+            raise AuthServiceUnavailable('Authentication service unavailable')
+
+        if response.status_code != 200:
+            logger.error(f"Auth service batch verify returned {response.status_code}")
+            raise AuthServiceUnavailable('Authentication service error')
+
+        body = response.json()
+        for token, user_data in body['results'].items():
+            token_cache.set(token, user_data)
+            results[token] = user_data
+        for token in body['invalid']:
+            token_cache.set_invalid(token)
+
+    return results
+
+
+def _request_user_data(token):
+    try:
+        response = get_service_client('auth').get(
+            '/api/auth/verify-token/',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    except requests.RequestException as e:
+        logger.error(f"Auth service request failed: {e}")
+        raise AuthServiceUnavailable('Authentication service unavailable')
+
+    if response.status_code == 200:
+        return response.json()
+    elif response.status_code == 401:
+        raise AuthenticationFailed('Invalid or expired token')
+    else:
+        # Only a 401 is a verdict on the token; a 429, 403 or 5xx is the
+        # auth service failing to give one, so nothing is negatively cached
+        logger.error(f"Auth service returned {response.status_code}")
+        raise AuthServiceUnavailable('Authentication service error')
+
+
+class SignedClaimsAuthentication(JWTAuthentication):
+    """
+    Authentication class for signed access tokens issued by the auth service.
+
+    Signature and expiry are checked locally, so there is no network hop.
+    Opaque DRF tokens are left to GoogleOAuthAuthentication.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None or not is_signed_token(raw_token):
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_data = user_data_from_claims(validated_token.payload)
+        if not user_data['id']:
+            raise AuthenticationFailed('Token contained no recognizable user identification')
+        if not user_data['is_active']:
+            raise AuthenticationFailed('User is inactive')
+        return GoogleOAuthUser(user_data)
+
+
 class GoogleOAuthAuthentication(BaseAuthentication):
     """
     Authentication class for Google OAuth tokens via auth service
@@ -55,26 +252,13 @@ class GoogleOAuthAuthentication(BaseAuthentication):
             return None
             
         try:
-            # Verify token with auth service
-            response = requests.get(
-                f"{settings.AUTH_SERVICE_URL}/api/auth/verify-token/",
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                user = GoogleOAuthUser(user_data)
-                return (user, token)
-            elif response.status_code == 401:
-                raise AuthenticationFailed('Invalid or expired token')
-            else:
-                logger.error(f"Auth service returned {response.status_code}")
-                raise AuthenticationFailed('Authentication service error')
-                
-        except requests.RequestException as e:
-            logger.error(f"Auth service request failed: {e}")
-            raise AuthenticationFailed('Authentication service unavailable')
+            user = GoogleOAuthUser(verify_token_with_auth_service(token))
+            if user.auth_stale:
+                # Picked up by AuthStaleHeaderMiddleware
+                request._request.auth_stale = True
+            return (user, token)
+        except AuthenticationFailed:
+            raise
         except Exception as e:
             logger.error(f"Authentication error: {e}")
             raise AuthenticationFailed('Authentication failed')
@@ -83,6 +267,33 @@ class GoogleOAuthAuthentication(BaseAuthentication):
         return 'Bearer'
 
 
+class GuestTokenAuthentication(BaseAuthentication):
+    """
+    Authentication class for guest tokens issued by JoinMeetingView.
+
+    Expects ``Authorization: Guest <token>``. The token is verified in
+    memory; request.user becomes a GuestIdentity, which is not
+    is_authenticated, so guests only pass AllowAny views.
+    """
+    keyword = 'Guest'
+
+    def authenticate(self, request):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not auth_header.startswith(f'{self.keyword} '):
+            return None
+
+        token = auth_header[len(self.keyword) + 1:].strip()
+        try:
+            return (verify_guest_token(token), token)
+        except signing.SignatureExpired:
+            raise AuthenticationFailed('Guest token expired')
+        except signing.BadSignature:
+            raise AuthenticationFailed('Invalid guest token')
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
 class GoogleOAuthBackend(BaseBackend):
     """
     Authentication backend for Google OAuth
@@ -93,15 +304,11 @@ class GoogleOAuthBackend(BaseBackend):
             return None
             
         try:
-            response = requests.get(
-                f"{settings.AUTH_SERVICE_URL}/api/auth/verify-token/",
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                return GoogleOAuthUser(user_data)
+            if is_signed_token(token):
+                authenticator = SignedClaimsAuthentication()
+                return authenticator.get_user(authenticator.get_validated_token(token))
+            user_data = verify_token_with_auth_service(token)
+            return GoogleOAuthUser(user_data)
         except Exception as e:
             logger.error(f"Backend authentication error: {e}")
             
@@ -119,12 +326,11 @@ class OptionalAuthentication(BaseAuthentication):
     """
     
     def authenticate(self, request):
-        # Try Google OAuth first
-        oauth_auth = GoogleOAuthAuthentication()
-        result = oauth_auth.authenticate(request)
-        
-        if result:
-            return result
+        # Try locally verified signed and guest tokens first, then Google OAuth
+        for authenticator in (SignedClaimsAuthentication(), GuestTokenAuthentication(), GoogleOAuthAuthentication()):
+            result = authenticator.authenticate(request)
+            if result:
+                return result
             
         # Return None to allow anonymous access
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,428 @@
+"""
+Channel layers for the meeting websockets.
+
+ShardedChannelLayer spreads groups and channels over several Redis hosts.
+RedisChannelLayer maps keys to hosts with crc32 modulo the host count, so
+adding a host remaps almost every meeting group, and its send() hashes a
+different name than receive() for process-local channels once there is
+more than one host. Here every group (``meeting_<id>``) and every process
+channel is placed on a consistent hash ring with virtual nodes: adding a
+shard only moves the keys that land on its points. A publish writes to
+each shard holding a receiver in one script call, with all shards in
+parallel.
+
+Messages are classed as signaling, chat or control by the frame they
+carry, and each class is a lane: every channel has one Redis queue per
+lane, with its own capacity and expiry. The receiver pops from the lanes
+in priority order (control, then signaling, then chat), so a meeting
+ending or a moderator's action is never queued behind a room's chat, a
+chat flood only fills the chat lane, and signaling nobody consumed in
+time is dropped instead of delivered late. The per-channel receive
+buffers in process are laned the same way: each lane is bounded on its
+own and drained control first, so a burst of chat evicts older chat,
+never a control event waiting behind it.
+
+LocalFastPathChannelLayer also tracks which group members live in this
+process. When a group_send finds every member local (the common case once
+meetings are placed on one node, see meetings/placement.py), it hands the
+message straight to the receivers' buffers after a single membership
+read, and a send() to a local channel never touches Redis.
+
+RedisChannelLayer.receive() has one consumer at a time wait on Redis for
+the whole process while the others wait on their buffers, and that
+consumer does not watch its own buffer while it waits. Local deliveries
+wake it so it can pick up what was put in its buffer; the Redis read it
+was waiting on keeps running for the next consumer to take over, since
+cancelling it could lose a message already popped.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from functools import partial
+from urllib.parse import urlsplit
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SIGNALING = 'signaling'
+CHAT = 'chat'
+CONTROL = 'control'
+
+# frame (or event) type -> message class; anything else is control
+FRAME_CLASSES = {
+    'webrtc_offer': SIGNALING,
+    'webrtc_answer': SIGNALING,
+    'ice_candidate': SIGNALING,
+    'ice_candidates': SIGNALING,
+    'webrtc_signaling': SIGNALING,
+    'chat_message': CHAT,
+    # Stats are as expendable as chat: a newer report makes a lost one moot
+    'connection_stats': CHAT,
+}
+
+# Lanes in the order receivers pop them
+LANES = (CONTROL, SIGNALING, CHAT)
+
+DEFAULT_MESSAGE_CLASSES = {
+    SIGNALING: {'capacity': 1000, 'expiry': 10},
+    CHAT: {'capacity': 500, 'expiry': 30},
+    CONTROL: {'capacity': 2000, 'expiry': 60},
+}
+
+# Set on messages written to Redis, stripped again on receive
+EXPIRES_AT = '__expires_at__'
+
+# KEYS: lane keys on one shard; ARGV: one message per key, then now and
+# the expiry and capacity of the lane
+_PUBLISH_SCRIPT = """
+local now = tonumber(ARGV[#ARGV - 2])
+local expiry = tonumber(ARGV[#ARGV - 1])
+local capacity = tonumber(ARGV[#ARGV])
+local over_capacity = 0
+for i = 1, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, now - expiry)
+    if redis.call('ZCARD', KEYS[i]) < capacity then
+        redis.call('ZADD', KEYS[i], now, ARGV[i])
+        redis.call('EXPIRE', KEYS[i], expiry)
+    else
+        over_capacity = over_capacity + 1
+    end
+end
+return over_capacity
+"""
+
+# KEYS: a channel's lane keys; moves each lane's backup queue back into it
+_RESTORE_LANES_SCRIPT = """
+for i = 1, #KEYS do
+    local backup = KEYS[i] .. '$inflight'
+    local backed_up = redis.call('ZRANGE', backup, 0, -1, 'WITHSCORES')
+    for j = #backed_up, 1, -2 do
+        redis.call('ZADD', KEYS[i], backed_up[j], backed_up[j - 1])
+    end
+    redis.call('DEL', backup)
+end
+"""
+
+
+def frame_class(frame):
+    return FRAME_CLASSES.get(frame.get('type'), CONTROL)
+
+
+def message_class(message):
+    """Class of a channel-layer message: set by envelope(), else from its event type"""
+    return message.get('message_class') or FRAME_CLASSES.get(message.get('type'), CONTROL)
+
+
+def _ring_hash(value):
+    if isinstance(value, str):
+        value = value.encode('utf8')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+def shard_name(host):
+    """Stable ring identity of a decoded channels_redis host entry (credentials left out)"""
+    if 'address' in host:
+        address = urlsplit(host['address'])
+        return f'{address.hostname}:{address.port or 6379}{address.path or "/0"}'
+    if 'master_name' in host:
+        return f"sentinel:{host['master_name']}"
+    return f"{host.get('host', 'localhost')}:{host.get('port', 6379)}"
+
+
+class HashRing:
+    """Consistent hash ring of shard indexes, each placed at `vnodes` points"""
+
+    def __init__(self, names, vnodes=160):
+        points = sorted(
+            (_ring_hash(f'{name}#{point}'), index)
+            for index, name in enumerate(names)
+            for point in range(vnodes)
+        )
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._indexes = [index for _, index in points]
+        self.size = len(names)
+
+    def index_for(self, value):
+        if self.size == 1:
+            return 0
+        position = bisect.bisect(self._hashes, _ring_hash(value)) % len(self._hashes)
+        return self._indexes[position]
+
+
+class LaneBuffer(asyncio.Queue):
+    """
+    Receive buffer of one channel with a bounded FIFO per lane.
+
+    Stands in for channels_redis' BoundedQueue, which holds `capacity`
+    messages in one FIFO and evicts the oldest when full. Here a full lane
+    evicts its own oldest message, and gets pop the highest lane first.
+    """
+
+    def __init__(self, capacity, lane_of):
+        self._capacity = capacity
+        self._lane_of = lane_of
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = {lane: deque() for lane in LANES}
+
+    def _qsize(self):
+        return sum(len(queue) for queue in self._queue.values())
+
+    def empty(self):
+        return not any(self._queue.values())
+
+    def _put(self, item):
+        queue = self._queue[self._lane_of(item)]
+        if len(queue) >= self._capacity:
+            # The consumer has stopped reading; drop rather than grow forever
+            queue.popleft()
+            metrics.incr('channel_layer.buffer_dropped')
+        queue.append(item)
+
+    def _get(self):
+        for lane in LANES:
+            if self._queue[lane]:
+                return self._queue[lane].popleft()
+
+
+class ShardedChannelLayer(RedisChannelLayer):
+
+    def __init__(self, *args, message_classes=None, ring_vnodes=160, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.receive_buffer = defaultdict(partial(LaneBuffer, self.capacity, self._lane))
+        self.ring = HashRing([shard_name(host) for host in self.hosts], ring_vnodes)
+        self.message_classes = {
+            name: {**options, **(message_classes or {}).get(name, {})}
+            for name, options in DEFAULT_MESSAGE_CLASSES.items()
+        }
+        # Messages wait at most as long as the longest lived lane
+        self.expiry = max(self.expiry, *(options['expiry'] for options in self.message_classes.values()))
+
+    def consistent_hash(self, value):
+        return self.ring.index_for(value)
+
+    def _lane(self, message):
+        lane = message_class(message)
+        return lane if lane in self.message_classes else CONTROL
+
+    @staticmethod
+    def _lane_key(channel_key, lane):
+        # The control lane is the plain channel key RedisChannelLayer uses
+        return channel_key if lane == CONTROL else f'{channel_key}:{lane}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        lane = self._lane(message)
+        options = self.message_classes[lane]
+        message = dict(message)
+        message[EXPIRES_AT] = time.time() + options['expiry']
+        if '!' in channel:
+            message['__asgi_channel__'] = channel
+            channel = self.non_local_name(channel)
+            # The shard receive_single() reads this process's channels from
+            index = self.consistent_hash(channel)
+        else:
+            index = next(self._send_index_generator)
+        over_capacity = await self.connection(index).eval(
+            _PUBLISH_SCRIPT, 1, self._lane_key(self.prefix + channel, lane), self.serialize(message),
+            time.time(), options['expiry'], options['capacity']
+        )
+        if over_capacity:
+            metrics.incr('channel_layer.over_capacity')
+            raise ChannelFull()
+
+    async def _pop_lanes(self, index, lane_keys, timeout):
+        """
+        BZPOPMIN across a channel's lanes, highest priority first.
+
+        Like RedisChannelLayer._brpop_with_clean(), the popped message is kept
+        in its lane's backup queue until processed, and backups left by a
+        cancelled receive are put back first.
+        """
+        connection = self.connection(index)
+        await connection.eval(_RESTORE_LANES_SCRIPT, len(lane_keys), *lane_keys)
+        result = await connection.bzpopmin(lane_keys, timeout=timeout)
+        if result is None:
+            return None, None
+        lane_key, member, score = result
+        lane_key = lane_key.decode('utf8')
+        await connection.zadd(self._backup_channel_name(lane_key), {member: float(score)})
+        return lane_key, member
+
+    async def receive_single(self, channel):
+        assert self.valid_channel_name(channel, receive=True), "Channel name invalid"
+        if '!' in channel:
+            assert channel.endswith('!')
+            index = self.consistent_hash(channel)
+        else:
+            index = next(self._receive_index_generator)
+        channel_key = self.prefix + channel
+        lane_keys = [self._lane_key(channel_key, lane) for lane in LANES]
+
+        while True:
+            content = None
+            await self.receive_clean_locks.acquire(channel_key)
+            try:
+                while content is None:
+                    lane_key, content = await self._pop_lanes(index, lane_keys, self.brpop_timeout)
+                cleaner = asyncio.ensure_future(self._clean_receive_backup(index, lane_key))
+                self.receive_cleaners.append(cleaner)
+
+                def _cleanup_done(cleaner):
+                    self.receive_cleaners.remove(cleaner)
+                    self.receive_clean_locks.release(channel_key)
+
+                cleaner.add_done_callback(_cleanup_done)
+            except BaseException:
+                self.receive_clean_locks.release(channel_key)
+                raise
+
+            message = self.deserialize(content)
+            expires_at = message.pop(EXPIRES_AT, None)
+            if expires_at is not None and expires_at < time.time():
+                metrics.incr('channel_layer.expired')
+                continue
+            message_channel = message.pop('__asgi_channel__', channel)
+            return message_channel, message
+
+    async def _group_channels(self, group):
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        pipe = connection.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, min=0, max=int(time.time()) - self.group_expiry)
+        pipe.zrange(key, 0, -1)
+        _, members = await pipe.execute()
+        return [member.decode('utf8') for member in members]
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        await self._publish(group, await self._group_channels(group), message)
+
+    async def _publish(self, group, channel_names, message):
+        """Write message to every channel, one script call per shard, shards in parallel"""
+        if not channel_names:
+            return
+        lane = self._lane(message)
+        options = self.message_classes[lane]
+        now = time.time()
+        message = dict(message)
+        message[EXPIRES_AT] = now + options['expiry']
+        connection_to_channel_keys, channel_keys_to_message, _ = self._map_channel_keys_to_connection(
+            channel_names, message
+        )
+        results = await asyncio.gather(*(
+            self.connection(index).eval(
+                _PUBLISH_SCRIPT, len(channel_keys), *(self._lane_key(key, lane) for key in channel_keys),
+                *(channel_keys_to_message[channel_key] for channel_key in channel_keys),
+                now, options['expiry'], options['capacity']
+            )
+            for index, channel_keys in connection_to_channel_keys.items()
+        ))
+        over_capacity = sum(results)
+        if over_capacity:
+            metrics.incr('channel_layer.over_capacity', over_capacity)
+            logger.info(
+                f"{over_capacity} of {len(channel_names)} channels over capacity in group {group}"
+            )
+
+
+class LocalFastPathChannelLayer(ShardedChannelLayer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # group -> channels of this process that joined it, and for each such
+        # channel the number of groups it is in
+        self._local_members = defaultdict(set)
+        self._local_channels = Counter()
+        # Redis read of this process's channels outliving local wakeups, and
+        # the event a local delivery sets to wake the consumer waiting on it
+        self._pending_receive = None
+        self._local_wakeup = None
+
+    def _is_local(self, channel):
+        return '!' in channel and self.non_local_name(channel).endswith(self.client_prefix + '!')
+
+    def _deliver_local(self, channel, message):
+        # What receive() would have buffered after popping it from Redis
+        self.receive_buffer[channel].put_nowait(dict(message))
+        if self._local_wakeup is not None:
+            self._local_wakeup.set()
+
+    async def receive_single(self, channel):
+        if '!' not in channel:
+            return await super().receive_single(channel)
+        if self._pending_receive is None:
+            self._pending_receive = asyncio.ensure_future(super().receive_single(channel))
+        self._local_wakeup = asyncio.Event()
+        wakeup = asyncio.ensure_future(self._local_wakeup.wait())
+        try:
+            await asyncio.wait([self._pending_receive, wakeup], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            wakeup.cancel()
+            self._local_wakeup = None
+        if not self._pending_receive.done():
+            # Nothing from Redis yet; receive() re-checks the buffers
+            return [], None
+        pending, self._pending_receive = self._pending_receive, None
+        return pending.result()
+
+    async def send(self, channel, message):
+        # Only channels still in a group are known to have a live consumer here
+        if channel in self._local_channels:
+            assert isinstance(message, dict), "message is not a dict"
+            assert self.valid_channel_name(channel), "Channel name not valid"
+            assert "__asgi_channel__" not in message
+            self._deliver_local(channel, message)
+            metrics.incr('channel_layer.local_sends')
+            return
+        await super().send(channel, message)
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self._is_local(channel) and channel not in self._local_members[group]:
+            self._local_members[group].add(channel)
+            self._local_channels[channel] += 1
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        members = self._local_members.get(group)
+        if members is not None and channel in members:
+            members.discard(channel)
+            if not members:
+                del self._local_members[group]
+            self._local_channels[channel] -= 1
+            if self._local_channels[channel] <= 0:
+                del self._local_channels[channel]
+
+    async def flush(self):
+        self._local_members.clear()
+        self._local_channels.clear()
+        if self._pending_receive is not None:
+            self._pending_receive.cancel()
+            self._pending_receive = None
+        await super().flush()
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        channel_names = await self._group_channels(group)
+        local_members = self._local_members.get(group)
+
+        if not local_members or any(channel not in local_members for channel in channel_names):
+            # At least one member on another process (or a stale local entry)
+            metrics.incr('channel_layer.remote_group_sends')
+            await self._publish(group, channel_names, message)
+            return
+
+        for channel in channel_names:
+            self._deliver_local(channel, message)
+        metrics.incr('channel_layer.local_group_sends')
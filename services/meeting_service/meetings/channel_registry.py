@@ -0,0 +1,60 @@
+"""
+Participant -> channel_name registry for directed websocket delivery.
+
+Each meeting has one Redis hash, ``meeting:<meeting_id>:channels``, mapping
+a participant id to the channel name of the socket bound to it. Signaling
+aimed at one peer is sent to that channel alone instead of the meeting
+group.
+"""
+from redis.exceptions import RedisError
+
+from .redis_client import get_async_redis
+from .realtime import get_realtime_settings
+
+# Only remove the mapping if it still points at the disconnecting socket,
+# so a participant who already reconnected elsewhere keeps their entry
+_UNREGISTER_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def registry_key(meeting_id):
+    return f'meeting:{meeting_id}:channels'
+
+
+async def register_channel(meeting_id, participant_id, channel_name):
+    """Point participant_id at channel_name"""
+    key = registry_key(meeting_id)
+    pipe = get_async_redis().pipeline(transaction=False)
+    pipe.hset(key, participant_id, channel_name)
+    pipe.expire(key, get_realtime_settings()['CHANNEL_REGISTRY_TTL'])
+    await pipe.execute()
+
+
+async def unregister_channel(meeting_id, participant_id, channel_name):
+    """
+    Drop participant_id's entry if it still belongs to channel_name.
+
+    Returns False when the participant has meanwhile been registered from another socket.
+    """
+    removed = await get_async_redis().eval(
+        _UNREGISTER_SCRIPT, 1, registry_key(meeting_id), participant_id, channel_name
+    )
+    return bool(removed)
+
+
+def queue_unregister_channel(pipe, meeting_id, participant_id, channel_name):
+    """unregister_channel on a pipeline; its result is 1 if the entry was removed"""
+    pipe.eval(_UNREGISTER_SCRIPT, 1, registry_key(meeting_id), participant_id, channel_name)
+
+
+async def lookup_channel(meeting_id, participant_id):
+    """Channel name of the participant's socket, or None"""
+    try:
+        channel_name = await get_async_redis().hget(registry_key(meeting_id), participant_id)
+    except RedisError:
+        return None
+    return channel_name.decode() if channel_name is not None else None
@@ -0,0 +1,113 @@
+"""
+Circuit breaker for calls to other services.
+
+After FAILURE_THRESHOLD consecutive failures the circuit opens and calls are
+rejected immediately for RESET_TIMEOUT seconds instead of waiting on
+timeouts. It then half-opens and lets HALF_OPEN_MAX_CALLS probes through:
+a successful probe closes it again, a failed one re-opens it.
+"""
+import threading
+import time
+
+import requests
+
+from .metrics import metrics
+
+CIRCUIT_BREAKER_DEFAULTS = {
+    'ENABLED': True,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 10.0,
+    'HALF_OPEN_MAX_CALLS': 1,
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Per-process consecutive-failure breaker
+    """
+
+    def __init__(self, name, options=None):
+        self.name = name
+        self.options = dict(CIRCUIT_BREAKER_DEFAULTS)
+        self.options.update(options or {})
+        self.enabled = self.options['ENABLED']
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    def _metric(self, suffix):
+        return f'circuit_breaker.{self.name}.{suffix}'
+
+    def _refresh(self, now):
+        # Caller holds the lock
+        if self._state == OPEN and now - self._opened_at >= self.options['RESET_TIMEOUT']:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def is_open(self):
+        """True while calls would be rejected, without claiming a probe slot"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == HALF_OPEN:
+                return self._half_open_calls >= self.options['HALF_OPEN_MAX_CALLS']
+            return self._state == OPEN
+
+    def allow_request(self):
+        """Claim permission for one call; False means fail fast"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.options['HALF_OPEN_MAX_CALLS']:
+                self._half_open_calls += 1
+                return True
+        metrics.incr(self._metric('rejected'))
+        return False
+
+    def record_success(self):
+        with self._lock:
+            closing = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+        if closing:
+            metrics.incr(self._metric('closed'))
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            tripping = self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.options['FAILURE_THRESHOLD']
+            )
+            if tripping:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+        if tripping:
+            metrics.incr(self._metric('opened'))
+
+    def stats(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+            }
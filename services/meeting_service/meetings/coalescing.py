@@ -0,0 +1,98 @@
+"""
+Trickle-ICE candidate coalescing for a single websocket.
+
+Candidates a client sends for the same (from, to) pair within a short
+window are collected and flushed together as one message, so call setup
+costs one channel-layer publish per burst instead of one per candidate.
+Candidates already forwarded for a pair are dropped.
+"""
+import asyncio
+import json
+import logging
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self):
+        self.candidates = []
+        self.task = None
+
+
+class IceCandidateCoalescer:
+    """
+    Per-socket buffer of outgoing ICE candidates keyed by (from, to) pair.
+
+    flush_callback(from_participant, to_participant, candidates) is awaited
+    with the candidates of a pair, in arrival order, when its window closes,
+    the batch reaches max_batch, or flush() is called.
+    """
+
+    def __init__(self, flush_callback, window, max_batch, max_seen=512):
+        self.flush_callback = flush_callback
+        self.window = window
+        self.max_batch = max_batch
+        self.max_seen = max_seen
+        self._batches = {}
+        self._seen = {}
+
+    def _is_duplicate(self, pair, candidate):
+        seen = self._seen.setdefault(pair, set())
+        fingerprint = json.dumps(candidate, sort_keys=True)
+        if fingerprint in seen:
+            return True
+        if len(seen) >= self.max_seen:
+            seen.clear()
+        seen.add(fingerprint)
+        return False
+
+    async def add(self, from_participant, to_participant, candidate):
+        """Queue a candidate; flushes right away if the window is disabled or the batch is full"""
+        pair = (from_participant, to_participant)
+        metrics.incr('signaling.ice_candidates_received')
+        if self._is_duplicate(pair, candidate):
+            metrics.incr('signaling.ice_duplicates_dropped')
+            return
+
+        batch = self._batches.get(pair)
+        if batch is None:
+            batch = self._batches[pair] = _Batch()
+        batch.candidates.append(candidate)
+
+        if self.window <= 0 or len(batch.candidates) >= self.max_batch:
+            await self.flush(pair)
+        elif batch.task is None:
+            batch.task = asyncio.ensure_future(self._flush_later(pair))
+
+    async def _flush_later(self, pair):
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush(pair, from_timer=True)
+        except Exception as e:
+            logger.error(f"Failed to flush ICE candidates for {pair}: {e}")
+
+    async def flush(self, pair, from_timer=False):
+        """Send the pending candidates of a pair now"""
+        batch = self._batches.pop(pair, None)
+        if batch is None:
+            return
+        if batch.task is not None and not from_timer:
+            batch.task.cancel()
+        metrics.incr('signaling.ice_batches_sent')
+        await self.flush_callback(pair[0], pair[1], batch.candidates)
+
+    async def flush_to(self, to_participant):
+        """Flush every pending pair aimed at a participant (e.g. before an offer or answer)"""
+        for pair in [pair for pair in self._batches if pair[1] == to_participant]:
+            await self.flush(pair)
+
+    async def flush_all(self):
+        for pair in list(self._batches):
+            await self.flush(pair)
+
+    def forget(self, participant_id):
+        """Drop duplicate tracking for pairs involving a participant that left or rejoined"""
+        for pair in [pair for pair in self._seen if participant_id in pair]:
+            del self._seen[pair]
@@ -1,12 +1,46 @@
-import json
 import logging
+import random
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.core import signing
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
+from redis.exceptions import RedisError
+from .channel_registry import lookup_channel, register_channel, unregister_channel
+from .coalescing import IceCandidateCoalescer
+from .envelopes import encoded_frame, envelope
+from .live_state import aget_participant_state, aset_participant_state
+from .metrics import metrics
+from .middleware import CREDENTIAL_SUBPROTOCOL_PREFIXES
 from .models import Meeting, MeetingParticipant
+from .outbound import CONTROL, OutboundQueue, frame_policy
+from .placement import aplacement_for, get_node_id
+from .presence import claim_resume, clear_presence, touch_presence
+from .ratelimit import ALLOW, DISCONNECT, THROTTLE, ConnectionRateLimiter
+from .shutdown import SERVICE_RESTART_CLOSE_CODE, is_draining, track_socket, untrack_socket
+from .realtime import get_realtime_settings
+from .roster import (
+    ROSTER_MEDIA_FIELDS, add_to_roster, get_roster, get_roster_changes, remove_from_roster, roster_entry
+)
+from .tokens import issue_resume_token, verify_resume_token
+from .wire import (
+    MSGPACK, MSGPACK_SUBPROTOCOL, FrameDecodeError, decode_frame, encode_json, encode_msgpack, negotiate_codec
+)
 
 logger = logging.getLogger(__name__)
 
+# Close code of a deliberate hang-up; the participant leaves at once
+NORMAL_CLOSE_CODE = 1000
+# Close code for sockets whose outbound queue stayed over budget
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# Close code for sockets that kept sending after being rate limited
+RATE_LIMITED_CLOSE_CODE = 4029
+# Close code for sockets the reaper found without a recent heartbeat
+PRESENCE_EXPIRED_CLOSE_CODE = 4408
+
+# Numeric connection quality figures a client may share with the room
+CONNECTION_STATS_FIELDS = ('rtt_ms', 'jitter_ms', 'packet_loss', 'bitrate_kbps')
+
 
 class MeetingConsumer(AsyncWebsocketConsumer):
     """
@@ -18,6 +52,48 @@ class MeetingConsumer(AsyncWebsocketConsumer):
         self.meeting_id = self.scope['url_route']['kwargs']['meeting_id']
         self.room_group_name = f'meeting_{self.meeting_id}'
         self.participant_id = None
+        # Set by an explicit leave frame: skip the resume hold on disconnect
+        self.leaving = False
+        # participant_id -> channel_name of peers this socket has signaled,
+        # dropped when the peer leaves or rejoins
+        self.peer_channels = {}
+        realtime_settings = get_realtime_settings()
+        self.ice_coalescer = IceCandidateCoalescer(
+            self.send_ice_candidates,
+            window=realtime_settings['ICE_COALESCE_WINDOW'],
+            max_batch=realtime_settings['ICE_COALESCE_MAX_BATCH'],
+        )
+        # Wire format: JSON text unless the client negotiated MessagePack
+        self.codec = negotiate_codec(self.scope.get('subprotocols', []))
+        # Frames for the client go through a bounded queue so a slow socket
+        # never holds up this consumer's channel-layer handlers
+        self.outbound = OutboundQueue(
+            self.send,
+            max_depth=realtime_settings['OUTBOUND_QUEUE_MAX_DEPTH'],
+            over_budget_grace=realtime_settings['OUTBOUND_OVER_BUDGET_GRACE'],
+        )
+        self.rate_limiter = ConnectionRateLimiter(
+            realtime_settings['RATE_LIMITS'], realtime_settings['RATE_LIMIT_VIOLATIONS']
+        )
+
+        # This worker is shutting down; the client retries and lands on another one
+        if is_draining():
+            await self.close(code=SERVICE_RESTART_CLOSE_CODE)
+            return
+
+        # Reject sockets whose token was refused by TokenAuthMiddleware
+        if self.scope.get('auth_error'):
+            await self.close(code=4401)
+            return
+
+        self.user = self.scope.get('user')
+        self.participant_binding = self.scope.get('participant_binding') or {'user_id': None, 'is_guest': True}
+
+        # A guest token only admits its holder to the meeting it was issued for
+        bound_meeting_id = self.participant_binding.get('meeting_id')
+        if bound_meeting_id is not None and bound_meeting_id != self.meeting_id:
+            await self.close(code=4403)
+            return
 
         # Validate meeting exists
         meeting = await self.get_meeting(self.meeting_id)
@@ -31,31 +107,95 @@ class MeetingConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=self.select_subprotocol())
+        self.outbound.start()
+        track_socket(self)
+        await self.record_placement()
         logger.info(f"WebSocket connected to meeting {self.meeting_id}")
 
+    async def record_placement(self):
+        """Count sockets that reached the node their meeting is placed on, and those that did not"""
+        placement = await aplacement_for(self.meeting_id)
+        if placement is None:
+            return
+        if placement['node_id'] == get_node_id():
+            metrics.incr('placement.local_sockets')
+        else:
+            metrics.incr('placement.misplaced_sockets')
+
+    def select_subprotocol(self):
+        """Accept the negotiated wire format, else the first offered subprotocol that is not a credential"""
+        if self.codec == MSGPACK:
+            return MSGPACK_SUBPROTOCOL
+        for subprotocol in self.scope.get('subprotocols', []):
+            if not subprotocol.startswith(CREDENTIAL_SUBPROTOCOL_PREFIXES):
+                return subprotocol
+        return None
+
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
+        untrack_socket(self)
+        await self.outbound.stop()
+        await self.ice_coalescer.flush_all()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-        # Update participant status if they were connected
+        # Update participant status if they were connected, unless they have
+        # already reconnected from another socket
         if self.participant_id:
-            await self.update_participant_connection_status(self.participant_id, False)
+            try:
+                resume_grace = get_realtime_settings()['RESUME_GRACE']
+                if resume_grace and close_code != NORMAL_CLOSE_CODE and not self.leaving:
+                    # Dropped rather than hung up: stay in the room for a
+                    # reconnect to resume; the reaper finishes the leave if none comes
+                    await touch_presence(self.meeting_id, self.participant_id, self.channel_name, ttl=resume_grace)
+                    metrics.incr('resume.held')
+                else:
+                    await self.leave_room()
+            except RedisError as e:
+                logger.warning(f"Could not clean up after participant {self.participant_id}: {e}")
 
         logger.info(f"WebSocket disconnected from meeting {self.meeting_id}")
 
-    async def receive(self, text_data):
+    async def leave_room(self):
+        """Take the participant out of the room now and tell the others"""
+        await clear_presence(self.meeting_id, self.participant_id, self.channel_name)
+        if await unregister_channel(self.meeting_id, self.participant_id, self.channel_name):
+            await self.update_participant_connection_status(self.participant_id, False)
+            roster_version = await remove_from_roster(self.meeting_id, self.participant_id)
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                envelope({
+                    'type': 'participant_left',
+                    'participant_id': self.participant_id,
+                    'roster_version': roster_version,
+                    'meeting_id': self.meeting_id
+                }, event_type='participant_left', participant_id=self.participant_id)
+            )
+
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle messages from WebSocket"""
         try:
-            data = json.loads(text_data)
+            data = decode_frame(self.codec, text_data, bytes_data)
             message_type = data.get('type')
 
-            if message_type == 'join_room':
+            verdict = self.rate_limiter.check(message_type)
+            if verdict != ALLOW:
+                await self.handle_rate_limited(message_type, verdict)
+                return
+
+            if message_type == 'ping':
+                await self.handle_ping(data)
+            elif message_type == 'join_room':
                 await self.handle_join_room(data)
+            elif message_type == 'resume':
+                await self.handle_resume(data)
+            elif message_type == 'leave':
+                await self.handle_leave(data)
             elif message_type == 'webrtc_offer':
                 await self.handle_webrtc_offer(data)
             elif message_type == 'webrtc_answer':
@@ -68,72 +208,246 @@ class MeetingConsumer(AsyncWebsocketConsumer):
                 await self.handle_chat_message(data)
             elif message_type == 'screen_share':
                 await self.handle_screen_share(data)
+            elif message_type == 'connection_stats':
+                await self.handle_connection_stats(data)
             else:
                 logger.warning(f"Unknown message type: {message_type}")
 
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON received")
+        except FrameDecodeError as e:
+            logger.error(f"Invalid frame received: {e}")
         except Exception as e:
             logger.error(f"Error handling message: {e}")
 
+    async def handle_rate_limited(self, message_type, verdict):
+        """Drop a throttled frame; notify the client once, disconnect it if it keeps going"""
+        if verdict == DISCONNECT:
+            logger.warning(
+                f"Disconnecting participant {self.participant_id} from meeting {self.meeting_id}: rate limit exceeded"
+            )
+            await self.close(code=RATE_LIMITED_CLOSE_CODE)
+        elif verdict == THROTTLE:
+            await self.send_frame({
+                'type': 'rate_limited',
+                'message_type': message_type,
+                'retry_after': self.rate_limiter.retry_after(message_type),
+                'meeting_id': self.meeting_id
+            })
+
+    async def handle_ping(self, data):
+        """Heartbeat: keep the joined participant's presence alive and answer with a pong"""
+        if self.participant_id:
+            await touch_presence(self.meeting_id, self.participant_id, self.channel_name)
+        await self.send_frame({
+            'type': 'pong',
+            'ts': data.get('ts'),
+            'heartbeat_interval': get_realtime_settings()['HEARTBEAT_INTERVAL'],
+            'meeting_id': self.meeting_id
+        })
+
     async def handle_join_room(self, data):
         """Handle participant joining the room"""
-        self.participant_id = data.get('participant_id')
+        participant_id = data.get('participant_id')
         participant_name = data.get('participant_name', 'Unknown')
 
-        # Update participant connection status
+        # Only bind to a participant this socket is allowed to act for
+        participant = await self.get_bound_participant(participant_id)
+        if participant is None:
+            logger.error(f"Participant {participant_id} not found")
+            await self.send_frame({
+                'type': 'error',
+                'message': 'Participant not found',
+                'meeting_id': self.meeting_id
+            })
+            return
+        self.participant_id = str(participant['id'])
         await self.update_participant_connection_status(self.participant_id, True)
+        await register_channel(self.meeting_id, self.participant_id, self.channel_name)
+        await touch_presence(self.meeting_id, self.participant_id, self.channel_name)
+
+        # Media state may have changed since the last flush to the database
+        live_state = await aget_participant_state(self.meeting_id, self.participant_id)
+        participant.update({field: live_state[field] for field in ROSTER_MEDIA_FIELDS if field in live_state})
+        roster_version = await add_to_roster(self.meeting_id, roster_entry(participant))
+
+        # Everything the joiner needs to know about the room, in one frame;
+        # a reconnecting client only gets what changed since its last version
+        await self.send_roster(data.get('roster_version'))
+        await self.send_resume_token()
 
         # Notify other participants
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
+            envelope({
                 'type': 'participant_joined',
                 'participant_id': self.participant_id,
                 'participant_name': participant_name,
+                'roster_version': roster_version,
                 'meeting_id': self.meeting_id
-            }
+            }, event_type='participant_joined', participant_id=self.participant_id)
         )
 
-    async def handle_webrtc_offer(self, data):
-        """Handle WebRTC offer"""
+    async def handle_leave(self, data):
+        """The participant hung up: close the socket and leave the room without a resume hold"""
+        self.leaving = True
+        await self.close(code=NORMAL_CLOSE_CODE)
+
+    async def handle_resume(self, data):
+        """
+        Take over the participant of this client's dropped socket.
+
+        Needs the resume token the old socket was given, within RESUME_GRACE
+        of it dropping. The participant keeps its roster entry and peers are
+        not told it left or joined again, and nothing is written to the
+        database. A client told resume_failed joins again with join_room.
+        """
+        try:
+            claim = verify_resume_token(str(data.get('resume_token') or ''))
+        except signing.BadSignature:
+            claim = None
+        if (
+            claim is None
+            or self.participant_id is not None
+            or claim['meeting_id'] != self.meeting_id
+            or not self.may_resume(claim)
+            or not await claim_resume(
+                self.meeting_id, claim['participant_id'], claim['channel_name'], self.channel_name
+            )
+        ):
+            metrics.incr('resume.rejected')
+            await self.send_frame({'type': 'resume_failed', 'meeting_id': self.meeting_id})
+            return
+
+        self.participant_id = claim['participant_id']
+        await self.update_participant_connection_status(self.participant_id, True)
+        await self.send_roster(data.get('roster_version'))
+        await self.send_resume_token()
+        # Peers that signaled the old socket directly drop its channel
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
+            {'type': 'participant_resumed', 'participant_id': self.participant_id}
+        )
+        metrics.incr('resume.accepted')
+
+    def may_resume(self, claim):
+        """Whether this socket authenticated as the identity the resume token was issued to"""
+        if self.participant_binding.get('participant_id'):
+            return str(self.participant_binding['participant_id']) == claim['participant_id']
+        user_id = self.participant_binding.get('user_id')
+        return user_id is not None and str(user_id) == claim['user_id']
+
+    async def send_resume_token(self):
+        """Give the client a token to resume this socket's participant after a drop"""
+        resume_grace = get_realtime_settings()['RESUME_GRACE']
+        if not resume_grace:
+            return
+        await self.send_frame({
+            'type': 'resume_token',
+            'resume_token': issue_resume_token(
+                self.meeting_id, self.participant_id, self.channel_name, self.participant_binding.get('user_id')
+            ),
+            'resume_grace': resume_grace,
+            'meeting_id': self.meeting_id
+        })
+
+    async def send_roster(self, since=None):
+        """Send the roster changes after version `since`, or the full roster"""
+        if isinstance(since, int) and not isinstance(since, bool) and since >= 0:
+            version, changes = await get_roster_changes(self.meeting_id, since)
+            if changes is not None:
+                metrics.incr('roster.sync.delta')
+                await self.send_frame({
+                    'type': 'roster_delta',
+                    'since': since,
+                    'version': version,
+                    'changes': changes,
+                    'meeting_id': self.meeting_id
+                })
+                return
+
+        metrics.incr('roster.sync.snapshot')
+        version, participants = await get_roster(self.meeting_id)
+        await self.send_frame({
+            'type': 'room_snapshot',
+            'version': version,
+            'participants': participants,
+            'meeting_id': self.meeting_id
+        })
+
+    async def handle_webrtc_offer(self, data):
+        """Handle WebRTC offer"""
+        # Candidates still in the coalescing window must not arrive after the offer
+        await self.ice_coalescer.flush_to(data.get('to_participant'))
+        await self.send_to_participant(
+            data.get('to_participant'),
+            envelope({
                 'type': 'webrtc_offer',
                 'offer': data.get('offer'),
                 'from_participant': data.get('from_participant'),
                 'to_participant': data.get('to_participant'),
                 'meeting_id': self.meeting_id
-            }
+            })
         )
 
     async def handle_webrtc_answer(self, data):
         """Handle WebRTC answer"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
+        await self.ice_coalescer.flush_to(data.get('to_participant'))
+        await self.send_to_participant(
+            data.get('to_participant'),
+            envelope({
                 'type': 'webrtc_answer',
                 'answer': data.get('answer'),
                 'from_participant': data.get('from_participant'),
                 'to_participant': data.get('to_participant'),
                 'meeting_id': self.meeting_id
-            }
+            })
         )
 
     async def handle_ice_candidate(self, data):
-        """Handle ICE candidate"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'ice_candidate',
-                'candidate': data.get('candidate'),
-                'from_participant': data.get('from_participant'),
-                'to_participant': data.get('to_participant'),
-                'meeting_id': self.meeting_id
-            }
+        """Handle ICE candidate; coalesced with others for the same peer pair"""
+        await self.ice_coalescer.add(
+            data.get('from_participant'),
+            data.get('to_participant'),
+            data.get('candidate')
         )
 
+    async def send_ice_candidates(self, from_participant, to_participant, candidates):
+        """Flush coalesced candidates: one as ice_candidate, several as an ice_candidates batch"""
+        if len(candidates) == 1:
+            frame = {'type': 'ice_candidate', 'candidate': candidates[0]}
+        else:
+            frame = {'type': 'ice_candidates', 'candidates': candidates}
+        frame.update({
+            'from_participant': from_participant,
+            'to_participant': to_participant,
+            'meeting_id': self.meeting_id
+        })
+        await self.send_to_participant(to_participant, envelope(frame))
+
+    async def send_to_participant(self, participant_id, event):
+        """
+        Deliver an event to a single participant's socket.
+
+        The channel comes from the meeting's channel registry (cached per
+        socket). Events whose target is missing or not registered yet fall
+        back to the room broadcast, where clients filter on to_participant.
+        """
+        channel_name = None
+        if participant_id:
+            participant_id = str(participant_id)
+            channel_name = self.peer_channels.get(participant_id)
+            if channel_name is None:
+                channel_name = await lookup_channel(self.meeting_id, participant_id)
+                if channel_name is not None:
+                    self.peer_channels[participant_id] = channel_name
+
+        if channel_name is None:
+            metrics.incr('signaling.broadcast_fallbacks')
+            await self.channel_layer.group_send(self.room_group_name, event)
+            return
+
+        metrics.incr('signaling.directed')
+        await self.channel_layer.send(channel_name, event)
+
     async def handle_media_control(self, data):
         """Handle media control (mute/unmute, video on/off)"""
         control_type = data.get('control_type')
@@ -141,18 +455,19 @@ class MeetingConsumer(AsyncWebsocketConsumer):
         enabled = data.get('enabled', False)
 
         # Update participant media status
-        await self.update_participant_media_status(participant_id, control_type, enabled)
+        if not await self.update_participant_media_status(participant_id, control_type, enabled):
+            return
 
         # Notify other participants
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
+            envelope({
                 'type': 'media_control',
                 'control_type': control_type,
                 'participant_id': participant_id,
                 'enabled': enabled,
                 'meeting_id': self.meeting_id
-            }
+            })
         )
 
     async def handle_chat_message(self, data):
@@ -168,14 +483,14 @@ class MeetingConsumer(AsyncWebsocketConsumer):
         # Broadcast to all participants
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
+            envelope({
                 'type': 'chat_message',
                 'message': message,
                 'participant_id': participant_id,
                 'participant_name': participant_name,
                 'timestamp': timestamp,
                 'meeting_id': self.meeting_id
-            }
+            })
         )
 
     async def handle_screen_share(self, data):
@@ -184,123 +499,99 @@ class MeetingConsumer(AsyncWebsocketConsumer):
         participant_id = data.get('participant_id')
 
         # Update participant screen sharing status
-        await self.update_participant_screen_sharing(participant_id, action == 'start')
+        if not await self.update_participant_screen_sharing(participant_id, action == 'start'):
+            return
 
         # Notify other participants
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
+            envelope({
                 'type': 'screen_share',
                 'action': action,
                 'participant_id': participant_id,
                 'meeting_id': self.meeting_id
-            }
+            })
+        )
+
+    async def handle_connection_stats(self, data):
+        """Share the joined participant's connection quality with the room; each report supersedes the last"""
+        stats = data.get('stats')
+        if self.participant_id is None or not isinstance(stats, dict):
+            return
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            envelope({
+                'type': 'connection_stats',
+                'participant_id': self.participant_id,
+                'stats': {
+                    field: stats[field] for field in CONNECTION_STATS_FIELDS
+                    if isinstance(stats.get(field), (int, float))
+                },
+                'meeting_id': self.meeting_id
+            })
         )
 
+    async def send_frame(self, frame):
+        """Encode a frame in this socket's wire format and queue it"""
+        if self.codec == MSGPACK:
+            send_kwargs = {'bytes_data': encode_msgpack(frame)}
+        else:
+            send_kwargs = {'text_data': encode_json(frame)}
+        await self.enqueue(send_kwargs, *frame_policy(frame))
+
+    async def enqueue(self, send_kwargs, policy=CONTROL, coalesce_key=None, lane=None):
+        """Queue a frame for the writer task; closes the socket if it stays over budget"""
+        if not self.outbound.put(send_kwargs, policy, coalesce_key, lane):
+            logger.warning(
+                f"Closing slow socket of participant {self.participant_id} in meeting {self.meeting_id}: "
+                f"{len(self.outbound)} frames queued"
+            )
+            await self.outbound.stop()
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
     # Group message handlers
+    async def relay_frame(self, event):
+        """Forward an envelope's frame to the WebSocket in this socket's wire format"""
+        data = encoded_frame(event, self.codec)
+        if self.codec == MSGPACK:
+            send_kwargs = {'bytes_data': data}
+        else:
+            send_kwargs = {'text_data': data}
+        await self.enqueue(
+            send_kwargs, event.get('policy', CONTROL), event.get('coalesce_key'), event.get('message_class')
+        )
+
     async def participant_joined(self, event):
         """Send participant joined message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'participant_joined',
-            'participant_id': event['participant_id'],
-            'participant_name': event['participant_name'],
-            'meeting_id': event['meeting_id']
-        }))
+        self.peer_channels.pop(event['participant_id'], None)
+        self.ice_coalescer.forget(event['participant_id'])
+        await self.relay_frame(event)
 
     async def participant_left(self, event):
         """Send participant left message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'participant_left',
-            'participant_id': event['participant_id'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def webrtc_offer(self, event):
-        """Send WebRTC offer to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'webrtc_offer',
-            'offer': event['offer'],
-            'from_participant': event['from_participant'],
-            'to_participant': event['to_participant'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def webrtc_answer(self, event):
-        """Send WebRTC answer to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'webrtc_answer',
-            'answer': event['answer'],
-            'from_participant': event['from_participant'],
-            'to_participant': event['to_participant'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def ice_candidate(self, event):
-        """Send ICE candidate to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'ice_candidate',
-            'candidate': event['candidate'],
-            'from_participant': event['from_participant'],
-            'to_participant': event['to_participant'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def media_control(self, event):
-        """Send media control message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'media_control',
-            'control_type': event['control_type'],
-            'participant_id': event['participant_id'],
-            'enabled': event['enabled'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def chat_message(self, event):
-        """Send chat message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'participant_id': event['participant_id'],
-            'participant_name': event['participant_name'],
-            'timestamp': event['timestamp'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def screen_share(self, event):
-        """Send screen share message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'screen_share',
-            'action': event['action'],
-            'participant_id': event['participant_id'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def meeting_status_change(self, event):
-        """Send meeting status change to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'meeting_status_change',
-            'meeting_id': event['meeting_id'],
-            'action': event['action'],
-            'timestamp': event['timestamp']
-        }))
-
-    async def webrtc_signaling(self, event):
-        """Send WebRTC signaling message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'webrtc_signaling',
-            'signaling_data': event['signaling_data'],
-            'meeting_id': event['meeting_id']
-        }))
-
-    async def meeting_control(self, event):
-        """Send meeting control message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'meeting_control',
-            'action': event['action'],
-            'participant_id': event['participant_id'],
-            'target_participant_id': event.get('target_participant_id'),
-            'meeting_id': event['meeting_id']
-        }))
+        self.peer_channels.pop(event['participant_id'], None)
+        self.ice_coalescer.forget(event['participant_id'])
+        await self.relay_frame(event)
+
+    async def participant_resumed(self, event):
+        """A peer moved to a new socket; forget the channel cached for it"""
+        self.peer_channels.pop(event['participant_id'], None)
+
+    async def drain(self, reconnect_spread, deadline):
+        """Worker shutdown: ask the client to reconnect, let queued frames go out, then close"""
+        await self.ice_coalescer.flush_all()
+        await self.send_frame({
+            'type': 'server_draining',
+            'reconnect_after': round(random.uniform(0, reconnect_spread), 2),
+            'meeting_id': self.meeting_id
+        })
+        await self.outbound.wait_drained(deadline)
+        await self.close(code=SERVICE_RESTART_CLOSE_CODE)
+
+    async def presence_expired(self, event):
+        """The reaper gave up on this socket's heartbeat and already cleaned up after it"""
+        self.participant_id = None
+        await self.close(code=PRESENCE_EXPIRED_CLOSE_CODE)
 
     # Database operations
     @database_sync_to_async
@@ -311,38 +602,44 @@ class MeetingConsumer(AsyncWebsocketConsumer):
         except Meeting.DoesNotExist:
             return None
 
-    @database_sync_to_async
-    def update_participant_connection_status(self, participant_id, connected):
-        """Update participant connection status"""
-        try:
-            participant = MeetingParticipant.objects.get(id=participant_id)
-            if connected:
-                participant.socket_id = self.channel_name
-            else:
-                participant.socket_id = None
-            participant.save()
-        except MeetingParticipant.DoesNotExist:
-            logger.error(f"Participant {participant_id} not found")
+    def bound_participants(self):
+        """Participants of this meeting that the socket's binding allows"""
+        queryset = MeetingParticipant.objects.filter(meeting__meeting_id=self.meeting_id)
+        if self.participant_binding.get('participant_id'):
+            return queryset.filter(id=self.participant_binding['participant_id'])
+        if self.participant_binding['is_guest']:
+            # Only a verified guest token names the guest row a socket may act for
+            return queryset.none()
+        return queryset.filter(user_id=self.participant_binding['user_id'])
 
     @database_sync_to_async
-    def update_participant_media_status(self, participant_id, control_type, enabled):
-        """Update participant media status"""
+    def get_bound_participant(self, participant_id):
+        """Roster fields of the participant, if the socket's binding allows acting for it"""
         try:
-            participant = MeetingParticipant.objects.get(id=participant_id)
-            if control_type == 'audio':
-                participant.audio_enabled = enabled
-            elif control_type == 'video':
-                participant.video_enabled = enabled
-            participant.save()
-        except MeetingParticipant.DoesNotExist:
-            logger.error(f"Participant {participant_id} not found")
+            return self.bound_participants().filter(id=participant_id).values(
+                'id', 'name', 'role', 'is_guest', *ROSTER_MEDIA_FIELDS
+            ).first()
+        except ValidationError:
+            return None
 
-    @database_sync_to_async
-    def update_participant_screen_sharing(self, participant_id, sharing):
-        """Update participant screen sharing status"""
-        try:
-            participant = MeetingParticipant.objects.get(id=participant_id)
-            participant.screen_sharing = sharing
-            participant.save()
-        except MeetingParticipant.DoesNotExist:
-            logger.error(f"Participant {participant_id} not found")
\ No newline at end of file
+    async def update_participant_connection_status(self, participant_id, connected):
+        """Update participant connection status"""
+        await aset_participant_state(
+            self.meeting_id, participant_id, socket_id=self.channel_name if connected else None
+        )
+
+    async def update_participant_media_status(self, participant_id, control_type, enabled):
+        """Update participant media status; only for the participant this socket joined as"""
+        if self.participant_id is None or participant_id != self.participant_id or control_type not in ('audio', 'video'):
+            logger.error(f"Ignoring {control_type} control for participant {participant_id}")
+            return False
+        await aset_participant_state(self.meeting_id, participant_id, **{f'{control_type}_enabled': enabled})
+        return True
+
+    async def update_participant_screen_sharing(self, participant_id, sharing):
+        """Update participant screen sharing status; only for the participant this socket joined as"""
+        if self.participant_id is None or participant_id != self.participant_id:
+            logger.error(f"Ignoring screen share for participant {participant_id}")
+            return False
+        await aset_participant_state(self.meeting_id, participant_id, screen_sharing=sharing)
+        return True
@@ -0,0 +1,46 @@
+"""
+Serialize-once envelopes for channel-layer fan-out.
+
+A broadcast used to carry a dict that every receiving consumer re-encoded
+with json.dumps. An envelope carries the outbound frame with a memo of its
+encodings: the first receiver needing a wire format (JSON text or
+MessagePack bytes) encodes it, and the receivers it was delivered to in
+process reuse that, since local delivery copies the event shallowly and
+shares the memo. Only formats some socket negotiated are ever encoded, and
+nothing encoded travels through Redis; a receiver in another process
+encodes for itself. The frame's outbound queue policy travels with it, so
+receivers can coalesce or drop it without decoding, and so does its
+channel-layer message class (see meetings/channel_layers.py).
+"""
+from .channel_layers import frame_class
+from .outbound import frame_policy
+from .wire import encode_frame
+
+RELAY_FRAME = 'relay_frame'
+
+
+def envelope(frame, event_type=RELAY_FRAME, **fields):
+    """
+    Channel-layer event delivering frame verbatim to each receiving socket.
+
+    Extra fields are passed through for handlers (other than relay_frame)
+    that need to act on the event before forwarding it.
+    """
+    policy, coalesce_key = frame_policy(frame)
+    return {
+        'type': event_type,
+        'frame': frame,
+        'encoded': {},
+        'policy': policy,
+        'coalesce_key': coalesce_key,
+        'message_class': frame_class(frame),
+        **fields
+    }
+
+
+def encoded_frame(event, codec):
+    """An envelope's frame in codec's wire format, encoded on first use"""
+    encoded = event['encoded']
+    if codec not in encoded:
+        encoded[codec] = encode_frame(codec, event['frame'])
+    return encoded[codec]
@@ -0,0 +1,256 @@
+"""
+Write-behind store for participants' live media and connection state.
+
+While a meeting runs, audio/video/screen-share flags and the socket's
+channel name live in one Redis hash per meeting, ``meeting:<id>:live``,
+with fields ``<participant_id>:<attribute>``. Toggling them is a single
+pipelined Redis write with no database access; media changes are merged
+into the room roster in the same pipeline. Meetings with unflushed
+changes are tracked in a sorted set scored by the time of their oldest
+unflushed change; flush_participant_state writes them back to Postgres
+with bulk_update, and meeting end flushes and clears the hash.
+"""
+import logging
+import time
+import uuid
+
+from django.db import DatabaseError
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .metrics import metrics
+from .models import MeetingParticipant
+from .realtime import get_realtime_settings
+from .redis_client import get_async_redis
+from .roster import ROSTER_MEDIA_FIELDS, clear_roster, queue_roster_update
+
+logger = logging.getLogger(__name__)
+
+LIVE_FIELDS = ('audio_enabled', 'video_enabled', 'screen_sharing', 'socket_id')
+BOOLEAN_FIELDS = frozenset(['audio_enabled', 'video_enabled', 'screen_sharing'])
+
+DIRTY_KEY = 'meetings:live-state:dirty'
+
+# Atomically take a meeting off the dirty set and read its state, so changes
+# made after the read mark it dirty again instead of being lost
+_TAKE_SNAPSHOT_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return {score, redis.call('HGETALL', KEYS[1])}
+"""
+
+
+def live_state_key(meeting_id):
+    return f'meeting:{meeting_id}:live'
+
+
+def _encode(field, value):
+    if field in BOOLEAN_FIELDS:
+        return '1' if value else '0'
+    return value or ''
+
+
+def _decode(field, raw):
+    raw = raw.decode() if isinstance(raw, bytes) else raw
+    if field in BOOLEAN_FIELDS:
+        return raw == '1'
+    return raw or None
+
+
+def _mapping(participant_id, fields):
+    unknown = set(fields) - set(LIVE_FIELDS)
+    if unknown:
+        raise ValueError(f"Not live participant state: {', '.join(sorted(unknown))}")
+    return {f'{participant_id}:{field}': _encode(field, value) for field, value in fields.items()}
+
+
+def _is_participant_id(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_state(flat):
+    """
+    HGETALL result -> {participant_id: {field: value}}
+
+    Fields whose participant id is not a UUID are skipped, so one stray
+    write cannot make the flush's id__in lookup fail for the whole meeting.
+    """
+    if isinstance(flat, dict):
+        items = flat.items()
+    else:  # flat [field, value, ...] list from a script
+        items = zip(flat[::2], flat[1::2])
+
+    state = {}
+    for name, raw in items:
+        name = name.decode() if isinstance(name, bytes) else name
+        participant_id, _, field = name.rpartition(':')
+        if field in LIVE_FIELDS and _is_participant_id(participant_id):
+            state.setdefault(participant_id, {})[field] = _decode(field, raw)
+    return state
+
+
+def _queue_write(pipe, meeting_id, participant_id, fields):
+    key = live_state_key(meeting_id)
+    pipe.hset(key, mapping=_mapping(participant_id, fields))
+    pipe.expire(key, get_realtime_settings()['LIVE_STATE_TTL'])
+    pipe.zadd(DIRTY_KEY, {meeting_id: time.time()}, nx=True)
+    media_changes = {field: value for field, value in fields.items() if field in ROSTER_MEDIA_FIELDS}
+    if media_changes:
+        queue_roster_update(pipe, meeting_id, participant_id, media_changes)
+
+
+async def aset_participant_state(meeting_id, participant_id, **fields):
+    """Record live state from the event loop"""
+    pipe = get_async_redis().pipeline(transaction=True)
+    _queue_write(pipe, meeting_id, str(participant_id), fields)
+    await pipe.execute()
+
+
+def set_participant_state(meeting_id, participant_id, **fields):
+    """Record live state from synchronous code (views)"""
+    pipe = get_redis_connection('default').pipeline(transaction=True)
+    _queue_write(pipe, meeting_id, str(participant_id), fields)
+    pipe.execute()
+
+
+def save_participant_state(meeting_id, participant, **fields):
+    """
+    Record a MeetingParticipant's live state from synchronous code, saving
+    the fields to the database instead while Redis is unavailable
+    """
+    try:
+        set_participant_state(meeting_id, participant.id, **fields)
+    except RedisError as e:
+        metrics.incr('live_state.write_fallbacks')
+        logger.warning(f"Live participant state unavailable, saving {', '.join(fields)} directly: {e}")
+        for field, value in fields.items():
+            setattr(participant, field, value)
+        participant.save(update_fields=[*fields, 'updated_at'])
+
+
+def queue_participant_state(pipe, meeting_id, participant_id, **fields):
+    """Queue a live state write on a caller's (sync or async) pipeline"""
+    _queue_write(pipe, meeting_id, str(participant_id), fields)
+
+
+async def aget_participant_state(meeting_id, participant_id):
+    """Live state recorded for one participant (only the fields that have been set)"""
+    names = [f'{participant_id}:{field}' for field in LIVE_FIELDS]
+    values = await get_async_redis().hmget(live_state_key(meeting_id), names)
+    return {field: _decode(field, raw) for field, raw in zip(LIVE_FIELDS, values) if raw is not None}
+
+
+def get_meeting_state(meeting_id):
+    """Live state of a meeting's participants: {participant_id: {field: value}}"""
+    try:
+        return _parse_state(get_redis_connection('default').hgetall(live_state_key(meeting_id)))
+    except RedisError as e:
+        logger.warning(f"Live participant state unavailable: {e}")
+        return {}
+
+
+def overlay_live_state(participants, state):
+    """Apply live state onto MeetingParticipant instances in memory (nothing is saved)"""
+    for participant in participants:
+        for field, value in state.get(str(participant.id), {}).items():
+            setattr(participant, field, value)
+    return participants
+
+
+def flush_meeting_state(meeting_id, clear=False):
+    """
+    Write a meeting's live state to Postgres with one bulk_update.
+
+    With clear=True (meeting end) the Redis hash is deleted afterwards.
+    Returns the number of participant rows written.
+    """
+    redis = get_redis_connection('default')
+    key = live_state_key(meeting_id)
+    score, flat = redis.eval(_TAKE_SNAPSHOT_SCRIPT, 2, key, DIRTY_KEY, meeting_id)
+    state = _parse_state(flat)
+
+    written = 0
+    if state:
+        participants = list(
+            MeetingParticipant.objects
+            .filter(meeting__meeting_id=meeting_id, id__in=list(state))
+            .only('id', *LIVE_FIELDS)
+        )
+        now = timezone.now()
+        overlay_live_state(participants, state)
+        for participant in participants:
+            participant.updated_at = now
+        try:
+            written = MeetingParticipant.objects.bulk_update(participants, [*LIVE_FIELDS, 'updated_at'])
+        except DatabaseError:
+            # Put it back on the dirty set with its original age and let the next flush retry
+            if score is not None:
+                redis.zadd(DIRTY_KEY, {meeting_id: float(score)}, nx=True)
+            raise
+
+    if score is not None:
+        lag = time.time() - float(score)
+        metrics.observe('live_state.flush_lag', lag)
+    metrics.incr('live_state.rows_flushed', written)
+    if clear:
+        redis.delete(key)
+    return written
+
+
+def end_meeting_state(meeting_id):
+    """
+    Flush and drop an ended meeting's live state and roster.
+
+    The meeting itself is already saved, so failing to reach Redis (or to
+    write the rows) is logged rather than raised; the meeting stays on the
+    dirty set for the periodic flusher and the keys expire with their TTL.
+    """
+    try:
+        flush_meeting_state(meeting_id, clear=True)
+        clear_roster(meeting_id)
+    except (DatabaseError, RedisError) as e:
+        metrics.incr('live_state.flush_failures')
+        logger.error(f"Failed to flush live state of ended meeting {meeting_id}: {e}")
+
+
+def flush_dirty_meetings(limit=None):
+    """
+    Flush the meetings whose changes have waited longest.
+
+    Returns (meetings flushed, rows written).
+    """
+    limit = limit or get_realtime_settings()['LIVE_STATE_FLUSH_BATCH']
+    meeting_ids = get_redis_connection('default').zrange(DIRTY_KEY, 0, limit - 1)
+
+    meetings = rows = 0
+    for meeting_id in meeting_ids:
+        meeting_id = meeting_id.decode()
+        try:
+            rows += flush_meeting_state(meeting_id)
+            meetings += 1
+        except (DatabaseError, RedisError) as e:
+            logger.error(f"Failed to flush live state of meeting {meeting_id}: {e}")
+    return meetings, rows
+
+
+def live_state_stats():
+    """Backlog of unflushed meetings and the age of the oldest change"""
+    try:
+        redis = get_redis_connection('default')
+        pending = redis.zcard(DIRTY_KEY)
+        oldest = redis.zrange(DIRTY_KEY, 0, 0, withscores=True)
+    except RedisError:
+        return {'available': False}
+    return {
+        'available': True,
+        'dirty_meetings': pending,
+        'flush_lag_seconds': time.time() - oldest[0][1] if oldest else 0.0,
+    }
+
+
+metrics.register_collector('live_state', live_state_stats)
@@ -0,0 +1,118 @@
+import asyncio
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from meetings.channel_layers import CHAT, ShardedChannelLayer
+from meetings.envelopes import envelope
+
+
+def _layer(hosts):
+    # No capacity limit: nothing consumes the benchmark channels
+    return ShardedChannelLayer(hosts=hosts, message_classes={CHAT: {'capacity': 10 ** 9}})
+
+
+def _chat_event(i):
+    return envelope({
+        'type': 'chat_message',
+        'message': f'message {i} lorem ipsum dolor sit amet',
+        'participant_id': '6f1c2a9e-3b7d-4c1e-9a52-0d8e4f7b2c61',
+        'participant_name': 'Benchmark Sender',
+        'meeting_id': 'abc-defg-hij',
+    })
+
+
+async def _setup(hosts, groups, members, receiver_processes):
+    layer = _layer(hosts)
+    await layer.flush()
+    prefixes = [uuid.uuid4().hex for _ in range(receiver_processes)]
+    for group in groups:
+        await asyncio.gather(*(
+            layer.group_add(group, f'specific.{random.choice(prefixes)}!{uuid.uuid4().hex}')
+            for _ in range(members)
+        ))
+    await layer.close_pools()
+
+
+async def _publish(hosts, groups, publishes, concurrency):
+    layer = _layer(hosts)
+    events = [_chat_event(i) for i in range(64)]
+    remaining = iter(range(publishes))
+
+    async def publisher():
+        for i in remaining:
+            await layer.group_send(random.choice(groups), events[i % len(events)])
+
+    await asyncio.gather(*(publisher() for _ in range(concurrency)))
+    await layer.close_pools()
+
+
+def _publish_worker(hosts, groups, publishes, concurrency):
+    asyncio.run(_publish(hosts, groups, publishes, concurrency))
+
+
+async def _flush(hosts):
+    layer = _layer(hosts)
+    await layer.flush()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure channel layer group_send throughput with 1..N Redis shards, '
+        'and how many meeting groups move when a shard is added'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hosts', default=None,
+            help='Comma separated Redis URLs, one per shard (defaults to the configured channel layer hosts)'
+        )
+        parser.add_argument('--groups', type=int, default=1000, help='Meeting groups')
+        parser.add_argument('--members', type=int, default=10, help='Channels per group')
+        parser.add_argument('--receiver-processes', type=int, default=32, help='Distinct receiving processes')
+        parser.add_argument('--publishes', type=int, default=20000, help='group_send calls per shard count')
+        parser.add_argument('--workers', type=int, default=4, help='Publishing processes')
+        parser.add_argument('--concurrency', type=int, default=64, help='Publishes in flight per process')
+
+    def handle(self, *args, **options):
+        if options['hosts']:
+            hosts = options['hosts'].split(',')
+        else:
+            hosts = settings.CHANNEL_LAYERS['default']['CONFIG']['hosts']
+        if not hosts:
+            raise CommandError('No Redis hosts to shard over')
+
+        groups = [f'meeting_{i:09d}' for i in range(options['groups'])]
+        per_worker = options['publishes'] // options['workers']
+        previous = None
+        baseline = None
+        for shards in range(1, len(hosts) + 1):
+            shard_hosts = hosts[:shards]
+            ring = _layer(shard_hosts)
+            placement = {group: ring.consistent_hash(group) for group in groups}
+            moved = ''
+            if previous is not None:
+                changed = sum(1 for group in groups if placement[group] != previous[group])
+                moved = f', {changed / len(groups):.1%} of groups moved (ideal {1 / shards:.1%})'
+            previous = placement
+
+            asyncio.run(_setup(shard_hosts, groups, options['members'], options['receiver_processes']))
+            started = time.perf_counter()
+            with ProcessPoolExecutor(options['workers']) as pool:
+                futures = [
+                    pool.submit(_publish_worker, shard_hosts, groups, per_worker, options['concurrency'])
+                    for _ in range(options['workers'])
+                ]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - started
+            rate = per_worker * options['workers'] / elapsed
+            baseline = baseline or rate
+            self.stdout.write(
+                f'{shards} shard(s): {rate:.0f} group_sends/s ({rate / baseline:.2f}x){moved}'
+            )
+            asyncio.run(_flush(shard_hosts))
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from meetings.consumers import MeetingConsumer
+from meetings.envelopes import envelope
+from meetings.outbound import OutboundQueue
+from meetings.wire import JSON
+
+
+def _chat_frame(i):
+    return {
+        'type': 'chat_message',
+        'message': f'message {i} ' + 'lorem ipsum dolor sit amet ' * 8,
+        'participant_id': '6f1c2a9e-3b7d-4c1e-9a52-0d8e4f7b2c61',
+        'participant_name': 'Benchmark Sender',
+        'timestamp': '2025-01-01T12:00:00.000000+00:00',
+        'meeting_id': 'abc-defg-hij',
+    }
+
+
+async def _legacy_chat_message(consumer, event):
+    # The per-receiver handler envelopes replaced: rebuild the frame and encode
+    # it, then queue it the way every handler now does
+    await consumer.enqueue({'text_data': json.dumps({
+        'type': 'chat_message',
+        'message': event['message'],
+        'participant_id': event['participant_id'],
+        'participant_name': event['participant_name'],
+        'timestamp': event['timestamp'],
+        'meeting_id': event['meeting_id']
+    })})
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU per room broadcast with per-receiver encoding and with envelopes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receivers', type=int, default=100, help='Sockets in the room')
+        parser.add_argument('--broadcasts', type=int, default=500, help='Broadcasts per variant')
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options['receivers'], options['broadcasts']))
+
+    async def _run(self, receivers, broadcasts):
+        sent_bytes = 0
+
+        async def send(text_data=None, bytes_data=None):
+            nonlocal sent_bytes
+            sent_bytes += len(text_data or bytes_data)
+
+        consumers = []
+        for _ in range(receivers):
+            consumer = MeetingConsumer()
+            consumer.send = send
+            consumer.peer_channels = {}
+            consumer.codec = JSON
+            consumer.outbound = OutboundQueue(send, max_depth=broadcasts + 1, over_budget_grace=60.0)
+            consumer.outbound.start()
+            consumers.append(consumer)
+
+        async def drain():
+            # Let the writer tasks hand the frames to the sockets
+            while any(len(consumer.outbound) for consumer in consumers):
+                await asyncio.sleep(0)
+
+        async def legacy(i):
+            event = dict(_chat_frame(i))
+            for consumer in consumers:
+                await _legacy_chat_message(consumer, event)
+            await drain()
+
+        async def enveloped(i):
+            event = envelope(_chat_frame(i))
+            for consumer in consumers:
+                await consumer.relay_frame(event)
+            await drain()
+
+        self.stdout.write(f'{receivers} receivers, {broadcasts} broadcasts per variant')
+        self.stdout.write(f"{'variant':<28}{'CPU us/broadcast':>18}{'bytes/broadcast':>18}")
+        for label, broadcast in (('per-receiver json.dumps', legacy), ('serialize-once envelope', enveloped)):
+            await broadcast(0)  # warm up
+            sent_bytes = 0
+            start = time.process_time()
+            for i in range(broadcasts):
+                await broadcast(i)
+            elapsed = time.process_time() - start
+            self.stdout.write(
+                f'{label:<28}{elapsed / broadcasts * 1e6:>18.1f}{sent_bytes // broadcasts:>18}'
+            )
+        for consumer in consumers:
+            await consumer.outbound.stop()
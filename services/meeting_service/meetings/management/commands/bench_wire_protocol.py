@@ -0,0 +1,89 @@
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+from meetings.wire import encode_json, encode_msgpack
+
+
+def _sample_sdp():
+    """Audio + video offer of roughly browser size"""
+    lines = [
+        'v=0', 'o=- 4611731400430051336 2 IN IP4 127.0.0.1', 's=-', 't=0 0',
+        'a=group:BUNDLE 0 1', 'a=extmap-allow-mixed', 'a=msid-semantic: WMS stream',
+    ]
+    for mid, media in (('0', 'audio'), ('1', 'video')):
+        lines += [
+            f'm={media} 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126',
+            'c=IN IP4 0.0.0.0', 'a=rtcp:9 IN IP4 0.0.0.0',
+            'a=ice-ufrag:Fx2k', 'a=ice-pwd:n4VvQ0kd7qsUq3mHX4pZl9Jr', 'a=ice-options:trickle',
+            'a=fingerprint:sha-256 6B:8B:5D:EA:59:04:20:23:29:C8:87:1C:CD:2E:B8:6E:'
+            '2C:7A:F5:93:51:64:D0:47:A4:E5:13:53:7D:0E:AC:5B',
+            'a=setup:actpass', f'a=mid:{mid}', 'a=sendrecv', 'a=rtcp-mux',
+        ]
+        lines += [f'a=rtpmap:{payload_type} codec{payload_type}/48000/2' for payload_type in range(96, 126)]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+FRAMES = {
+    'webrtc_offer': {
+        'type': 'webrtc_offer',
+        'offer': {'type': 'offer', 'sdp': _sample_sdp()},
+        'from_participant': '6f1c2a9e-3b7d-4c1e-9a52-0d8e4f7b2c61',
+        'to_participant': '0b7e2d4a-91c3-4f58-8e6d-2a9c5b1f7e30',
+        'meeting_id': 'abc-defg-hij',
+    },
+    'ice_candidate': {
+        'type': 'ice_candidate',
+        'candidate': {
+            'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.7 46154 typ srflx '
+                         'raddr 0.0.0.0 rport 0 generation 0 ufrag Fx2k network-cost 999',
+            'sdpMid': '0',
+            'sdpMLineIndex': 0,
+        },
+        'from_participant': '6f1c2a9e-3b7d-4c1e-9a52-0d8e4f7b2c61',
+        'to_participant': '0b7e2d4a-91c3-4f58-8e6d-2a9c5b1f7e30',
+        'meeting_id': 'abc-defg-hij',
+    },
+    'media_control': {
+        'type': 'media_control',
+        'control_type': 'audio',
+        'participant_id': '6f1c2a9e-3b7d-4c1e-9a52-0d8e4f7b2c61',
+        'enabled': False,
+        'meeting_id': 'abc-defg-hij',
+    },
+}
+
+
+def _per_call_us(fn, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Compare frame size and encode/decode cost of the JSON and MessagePack wire formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        decode_msgpack = lambda data: msgpack.unpackb(data, raw=False)  # noqa: E731
+
+        self.stdout.write(
+            f"{'message':<16}{'format':<10}{'bytes':>8}{'encode us':>12}{'decode us':>12}"
+        )
+        for name, frame in FRAMES.items():
+            for label, encode, decode in (
+                ('json', encode_json, json.loads),
+                ('msgpack', encode_msgpack, decode_msgpack),
+            ):
+                data = encode(frame)
+                self.stdout.write(
+                    f'{name:<16}{label:<10}{len(data):>8}'
+                    f'{_per_call_us(encode, frame, iterations):>12.2f}'
+                    f'{_per_call_us(decode, data, iterations):>12.2f}'
+                )
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+import string
+import time
+import uuid
+
+import websockets
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from meetings.models import Meeting, MeetingParticipant
+from meetings.tokens import issue_guest_token
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))] if values else 0.0
+
+
+class _Client:
+    def __init__(self, participant, token):
+        self.participant = participant
+        self.token = token
+        self.socket = None
+        self.chat_messages = 0
+        self.pongs = {}
+        self.snapshot = asyncio.Event()
+        self.reader = None
+
+    async def read(self):
+        try:
+            async for message in self.socket:
+                frame = json.loads(message)
+                if frame['type'] == 'chat_message':
+                    self.chat_messages += 1
+                elif frame['type'] == 'room_snapshot':
+                    self.snapshot.set()
+                elif frame['type'] == 'pong' and frame.get('ts') in self.pongs:
+                    self.pongs[frame['ts']].set_result(time.perf_counter())
+        except websockets.ConnectionClosed:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running meeting service over real websockets: connection ramp, '
+        'join, ping round trips and chat fan-out throughput for one room'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument('--connections', type=int, default=500, help='Sockets in the room')
+        parser.add_argument('--concurrency', type=int, default=100, help='Handshakes in flight at once')
+        parser.add_argument('--senders', type=int, default=10, help='Sockets sending chat messages')
+        parser.add_argument(
+            '--messages', type=int, default=10,
+            help='Chat messages per sender (keep within the chat_message burst limit)'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark meeting afterwards')
+
+    def handle(self, *args, **options):
+        meeting, participants = self._create_meeting(options['connections'])
+        try:
+            asyncio.run(self._run(meeting, participants, options))
+        finally:
+            if not options['keep']:
+                meeting.delete()
+
+    def _create_meeting(self, connections):
+        meeting = Meeting.objects.create(
+            title='Websocket load benchmark',
+            host_id=uuid.uuid4(),
+            host_email='bench@example.com',
+            host_name='Benchmark',
+            meeting_id=''.join(random.choices(string.digits, k=9)),
+            status='ongoing',
+            actual_start=timezone.now(),
+            max_participants=connections,
+        )
+        participants = MeetingParticipant.objects.bulk_create([
+            MeetingParticipant(meeting=meeting, name=f'load-{i}', is_guest=True, status='joined')
+            for i in range(connections)
+        ])
+        return meeting, participants
+
+    async def _run(self, meeting, participants, options):
+        url = f"{options['url'].rstrip('/')}/ws/meetings/{meeting.meeting_id}/"
+        tokens = await sync_to_async(lambda: [issue_guest_token(p) for p in participants])()
+        clients = [_Client(participant, token) for participant, token in zip(participants, tokens)]
+
+        # Connection ramp
+        handshake_times = []
+        failures = 0
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def connect(client):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    client.socket = await websockets.connect(
+                        f'{url}?guest_token={client.token}', open_timeout=30, max_queue=None
+                    )
+                except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+                    failures += 1
+                    return
+                handshake_times.append(time.perf_counter() - started)
+                client.reader = asyncio.ensure_future(client.read())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(client) for client in clients))
+        ramp = time.perf_counter() - started
+        connected = [client for client in clients if client.socket is not None]
+        self.stdout.write(
+            f'connected {len(connected)}/{len(clients)} in {ramp:.2f}s '
+            f'({len(connected) / ramp:.0f}/s), handshake p50 {_percentile(handshake_times, 50) * 1000:.1f}ms '
+            f'p99 {_percentile(handshake_times, 99) * 1000:.1f}ms, {failures} failed'
+        )
+        if not connected:
+            return
+
+        # Join: every socket binds to its participant and waits for its snapshot
+        started = time.perf_counter()
+        for client in connected:
+            await client.socket.send(json.dumps({
+                'type': 'join_room',
+                'participant_id': str(client.participant.id),
+                'participant_name': client.participant.name,
+            }))
+        await asyncio.wait_for(asyncio.gather(*(client.snapshot.wait() for client in connected)), 120)
+        self.stdout.write(f'joined {len(connected)} in {time.perf_counter() - started:.2f}s')
+
+        # Ping round trips with every socket pinging at once
+        async def ping(client):
+            ts = f'{client.participant.id}:{time.perf_counter()}'
+            pong = client.pongs[ts] = asyncio.get_running_loop().create_future()
+            sent = time.perf_counter()
+            await client.socket.send(json.dumps({'type': 'ping', 'ts': ts}))
+            try:
+                return await asyncio.wait_for(pong, 30) - sent
+            finally:
+                client.pongs.pop(ts, None)
+
+        rtts = await asyncio.gather(*(ping(client) for client in connected), return_exceptions=True)
+        rtts = [rtt for rtt in rtts if isinstance(rtt, float)]
+        self.stdout.write(
+            f'ping rtt p50 {_percentile(rtts, 50) * 1000:.1f}ms p99 {_percentile(rtts, 99) * 1000:.1f}ms '
+            f'({len(rtts)} answered)'
+        )
+
+        # Chat fan-out: every message is delivered to every socket in the room
+        senders = connected[:options['senders']]
+        expected = len(senders) * options['messages'] * len(connected)
+        started = time.perf_counter()
+        for i in range(options['messages']):
+            for client in senders:
+                await client.socket.send(json.dumps({
+                    'type': 'chat_message',
+                    'message': f'load message {i}',
+                    'participant_id': str(client.participant.id),
+                    'participant_name': client.participant.name,
+                    'timestamp': timezone.now().isoformat(),
+                }))
+        deadline = time.perf_counter() + 60
+        while sum(client.chat_messages for client in connected) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        delivered = sum(client.chat_messages for client in connected)
+        self.stdout.write(
+            f'fan-out delivered {delivered}/{expected} frames in {elapsed:.2f}s '
+            f'({delivered / elapsed:.0f} frames/s)'
+        )
+
+        await asyncio.gather(*(client.socket.close() for client in connected), return_exceptions=True)
+        for client in connected:
+            client.reader.cancel()
@@ -0,0 +1,37 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from meetings.live_state import flush_dirty_meetings, live_state_stats
+from meetings.realtime import get_realtime_settings
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Write participants\' live media and connection state from Redis back to Postgres'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush the current backlog and exit')
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Seconds between flush passes (default: REALTIME_SETTINGS LIVE_STATE_FLUSH_INTERVAL)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_realtime_settings()['LIVE_STATE_FLUSH_INTERVAL']
+        while True:
+            started = time.monotonic()
+            meetings, rows = flush_dirty_meetings()
+            if meetings:
+                stats = live_state_stats()
+                logger.info(
+                    f"Flushed live state of {meetings} meetings ({rows} rows), "
+                    f"{stats.get('dirty_meetings', 0)} still pending, "
+                    f"lag {stats.get('flush_lag_seconds', 0.0):.2f}s"
+                )
+            if options['once']:
+                self.stdout.write(f'Flushed {meetings} meetings ({rows} participant rows)')
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+import time
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from meetings.presence import reap_until_caught_up
+from meetings.realtime import get_realtime_settings
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Clean up after meeting sockets whose heartbeat expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Reap the current backlog and exit')
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Seconds between reaper passes (default: REALTIME_SETTINGS REAPER_INTERVAL)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_realtime_settings()['REAPER_INTERVAL']
+        asyncio.run(self._run(interval, options['once']))
+
+    async def _run(self, interval, once):
+        channel_layer = get_channel_layer()
+        while True:
+            started = time.monotonic()
+            reaped, left = await reap_until_caught_up(channel_layer)
+            if reaped:
+                logger.info(f"Reaped {reaped} stale sockets, {left} participants left their meetings")
+            if once:
+                self.stdout.write(f'Reaped {reaped} sockets ({left} participants left)')
+                return
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+class MetricsRegistry:
+    """
+    Process-local counters, gauges and latency samples.
+
+    Each worker process keeps its own registry; the snapshot carries the pid
+    so a scraper can aggregate across workers.
+    """
+
+    def __init__(self, sample_size=1024):
+        self._lock = threading.Lock()
+        self._sample_size = sample_size
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._samples = defaultdict(lambda: deque(maxlen=self._sample_size))
+        self._collectors = {}
+
+    def incr(self, name, value=1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def counter(self, name):
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name, value):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """Record a latency sample in seconds"""
+        with self._lock:
+            self._samples[name].append(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the wrapped block and record it as a sample"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def register_collector(self, name, collector):
+        """Register a callable whose dict result is added to every snapshot"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self):
+        """Return a JSON-serialisable view of all metrics"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            samples = {name: list(values) for name, values in self._samples.items()}
+            collectors = dict(self._collectors)
+
+        timings = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            values.sort()
+            timings[name] = {
+                'count': len(values),
+                'p50': _percentile(values, 50),
+                'p99': _percentile(values, 99),
+                'max': values[-1],
+            }
+
+        data = {
+            'pid': os.getpid(),
+            'counters': counters,
+            'gauges': gauges,
+            'timings': timings,
+        }
+        for name, collector in collectors.items():
+            data[name] = collector()
+        return data
+
+    def reset(self):
+        """Clear all recorded values (collectors stay registered)"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._samples.clear()
+
+
+def _percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+metrics = MetricsRegistry()
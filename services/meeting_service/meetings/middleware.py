@@ -0,0 +1,144 @@
+"""
+Request and WebSocket authentication middleware.
+
+TokenAuthMiddleware authenticates the meeting consumer's websockets. The
+token is taken from the ``token`` query parameter or from a
+``bearer.<token>`` entry in the Sec-WebSocket-Protocol header, and verified
+without blocking the event loop: signed access tokens are checked locally,
+opaque tokens go through the token cache, and only a cache miss is handed
+to a worker thread for the auth-service round trip. Guests present their
+guest token as ``guest_token`` or a ``guest.<token>`` subprotocol; it is
+verified in memory.
+
+Stale identities
+----------------
+
+AuthStaleHeaderMiddleware flags HTTP responses served with an identity
+taken from the stale token cache during an auth service outage.
+"""
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import (
+    GoogleOAuthUser, is_signed_token, user_data_from_claims, verify_token_with_auth_service
+)
+from .token_cache import INVALID_TOKEN, get_token_cache
+from .tokens import verify_guest_token
+
+logger = logging.getLogger(__name__)
+
+BEARER_SUBPROTOCOL_PREFIX = 'bearer.'
+GUEST_SUBPROTOCOL_PREFIX = 'guest.'
+CREDENTIAL_SUBPROTOCOL_PREFIXES = (BEARER_SUBPROTOCOL_PREFIX, GUEST_SUBPROTOCOL_PREFIX)
+
+
+class AuthStaleHeaderMiddleware:
+    """
+    Add ``X-Auth-Stale: 1`` when the request was authenticated from a stale
+    cache entry because the auth service was unavailable
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, 'auth_stale', False):
+            response['X-Auth-Stale'] = '1'
+        return response
+
+
+def _get_handshake_credential(scope, query_param, subprotocol_prefix):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    if query.get(query_param):
+        return query[query_param][0]
+
+    for subprotocol in scope.get('subprotocols', []):
+        if subprotocol.startswith(subprotocol_prefix):
+            return subprotocol[len(subprotocol_prefix):]
+    return None
+
+
+def get_scope_token(scope):
+    """Return the bearer token offered in the handshake, if any"""
+    return _get_handshake_credential(scope, 'token', BEARER_SUBPROTOCOL_PREFIX)
+
+
+def get_scope_guest_token(scope):
+    """Return the guest token offered in the handshake, if any"""
+    return _get_handshake_credential(scope, 'guest_token', GUEST_SUBPROTOCOL_PREFIX)
+
+
+async def authenticate_token(token):
+    """Resolve a token to user data without blocking the event loop"""
+    if is_signed_token(token):
+        try:
+            claims = AccessToken(token).payload
+        except TokenError as e:
+            raise AuthenticationFailed(str(e))
+        user_data = user_data_from_claims(claims)
+        if not user_data['id'] or not user_data['is_active']:
+            raise AuthenticationFailed('Invalid or expired token')
+        return user_data
+
+    user_data = await get_token_cache().aget(token)
+    if user_data is INVALID_TOKEN:
+        raise AuthenticationFailed('Invalid or expired token')
+    if user_data is not None:
+        return user_data
+
+    return await sync_to_async(verify_token_with_auth_service, thread_sensitive=False)(token)
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """
+    Populate scope['user'] and scope['participant_binding'] for websockets.
+
+    The binding restricts which MeetingParticipant rows the socket may act
+    for: authenticated users are bound to their own user_id, guests with a
+    guest token to their participant_id and meeting_id, and other anonymous
+    sockets to none. A rejected token is recorded in
+    scope['auth_error'] so the consumer can refuse the handshake.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope['user'] = AnonymousUser()
+        scope['participant_binding'] = {'user_id': None, 'is_guest': True}
+
+        token = get_scope_token(scope)
+        guest_token = get_scope_guest_token(scope)
+        if guest_token and not token:
+            try:
+                guest = verify_guest_token(guest_token)
+                scope['participant_binding'] = {
+                    'user_id': None,
+                    'is_guest': True,
+                    'participant_id': guest.participant_id,
+                    'meeting_id': guest.meeting_id,
+                }
+            except signing.BadSignature as e:
+                logger.info(f"WebSocket guest token rejected: {e}")
+                scope['auth_error'] = 'Invalid guest token'
+        elif token:
+            try:
+                user_data = await authenticate_token(token)
+                scope['user'] = GoogleOAuthUser(user_data)
+                scope['participant_binding'] = {'user_id': scope['user'].id, 'is_guest': False}
+            except AuthenticationFailed as e:
+                logger.info(f"WebSocket authentication rejected: {e.detail}")
+                scope['auth_error'] = str(e.detail)
+
+        return await super().__call__(scope, receive, send)
+
+
+def TokenAuthMiddlewareStack(inner):
+    return TokenAuthMiddleware(inner)
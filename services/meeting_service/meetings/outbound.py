@@ -0,0 +1,200 @@
+"""
+Bounded outbound queue for a single websocket.
+
+Group handlers used to await the socket send inline, so a slow client held
+up its consumer while the channel layer kept buffering events for it. Now
+handlers only enqueue the encoded frame, and a writer task drains the
+queue into the socket. The frame type picks the queue policy:
+
+- control frames (the default) are always queued, in order;
+- coalesced frames (media_control, screen_share) replace a pending frame
+  with the same key, so a slow client only receives the latest value;
+- droppable frames (connection_stats, which clients report periodically)
+  are coalesced too, and are the first to go when the queue is over budget.
+
+Frames also carry the lane of their channel-layer message class (see
+meetings/channel_layers.py), and the writer always sends the highest
+priority lane first, so a meeting ending or a moderator's action does not
+wait behind a socket's backlog of chat.
+
+A socket that stays over OUTBOUND_QUEUE_MAX_DEPTH for longer than
+OUTBOUND_OVER_BUDGET_GRACE seconds is disconnected.
+"""
+import asyncio
+import itertools
+import logging
+import time
+import weakref
+from collections import OrderedDict
+
+from .channel_layers import LANES
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTROL = 'control'
+COALESCE = 'coalesce'
+DROPPABLE = 'droppable'
+
+# frame type -> (policy, frame fields identifying what a frame supersedes)
+FRAME_POLICIES = {
+    'media_control': (COALESCE, ('participant_id', 'control_type')),
+    'screen_share': (COALESCE, ('participant_id',)),
+    'connection_stats': (DROPPABLE, ('participant_id',)),
+}
+
+_live_queues = weakref.WeakSet()
+
+
+def frame_policy(frame):
+    """(policy, coalesce key or None) for an outbound frame"""
+    frame_type = frame.get('type')
+    policy, key_fields = FRAME_POLICIES.get(frame_type, (CONTROL, None))
+    if key_fields is None:
+        return policy, None
+    return policy, ':'.join([frame_type, *(str(frame.get(field)) for field in key_fields)])
+
+
+class OutboundQueue:
+    """
+    Per-socket queue of send() keyword arguments, one per lane, drained
+    highest priority lane first by a writer task.
+
+    put() never blocks; it returns False once the socket has been over
+    budget for too long, and the caller should close it.
+    """
+
+    def __init__(self, send, max_depth, over_budget_grace):
+        self.send = send
+        self.max_depth = max_depth
+        self.over_budget_grace = over_budget_grace
+        # lane -> coalesce key (or a unique sequence number) -> (policy, send kwargs)
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+        self._depth = 0
+        # frames without a (known) lane go out with the highest priority
+        self._first_lane = self._lanes[LANES[0]]
+        self._droppable = 0
+        self._sequence = itertools.count()
+        self._over_budget_since = None
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self._sending = False
+        self.closed = False
+        _live_queues.add(self)
+
+    def __len__(self):
+        return self._depth
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._drain())
+
+    async def stop(self):
+        """Stop the writer; frames still queued are discarded"""
+        self.closed = True
+        for pending in self._lanes.values():
+            pending.clear()
+        self._depth = 0
+        self._droppable = 0
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+
+    async def wait_drained(self, deadline):
+        """Wait until every queued frame has been sent, or the loop time reaches deadline"""
+        loop = asyncio.get_running_loop()
+        while (self._depth or self._sending) and self._writer is not None and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        return not (self._depth or self._sending)
+
+    def put(self, send_kwargs, policy=CONTROL, key=None, lane=None):
+        if self.closed:
+            return True
+
+        pending = self._lanes.get(lane, self._first_lane)
+        if key is not None and key in pending:
+            pending[key] = (policy, send_kwargs)
+            metrics.incr('outbound.coalesced')
+            return True
+
+        if self._depth >= self.max_depth:
+            if policy == DROPPABLE:
+                metrics.incr('outbound.dropped')
+                return self._check_budget()
+            self._drop_oldest_droppable()
+
+        if key is None:
+            key = next(self._sequence)
+        pending[key] = (policy, send_kwargs)
+        self._depth += 1
+        if policy == DROPPABLE:
+            self._droppable += 1
+        self._wakeup.set()
+        return self._check_budget()
+
+    def _drop_oldest_droppable(self):
+        if not self._droppable:
+            return
+        for lane in reversed(LANES):
+            pending = self._lanes[lane]
+            for key, (policy, _) in pending.items():
+                if policy == DROPPABLE:
+                    del pending[key]
+                    self._depth -= 1
+                    self._droppable -= 1
+                    metrics.incr('outbound.dropped')
+                    return
+
+    def _check_budget(self):
+        if self._depth <= self.max_depth:
+            self._over_budget_since = None
+            return True
+        now = time.monotonic()
+        if self._over_budget_since is None:
+            self._over_budget_since = now
+            return True
+        if now - self._over_budget_since < self.over_budget_grace:
+            return True
+        metrics.incr('outbound.disconnects')
+        return False
+
+    async def _drain(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._depth:
+                for pending in self._lanes.values():
+                    if pending:
+                        break
+                _, (policy, send_kwargs) = pending.popitem(last=False)
+                self._depth -= 1
+                if policy == DROPPABLE:
+                    self._droppable -= 1
+                if self._depth <= self.max_depth:
+                    self._over_budget_since = None
+                self._sending = True
+                try:
+                    await self.send(**send_kwargs)
+                except Exception as e:
+                    logger.warning(f"Outbound send failed: {e}")
+                finally:
+                    self._sending = False
+                metrics.incr('outbound.sent')
+
+
+def outbound_stats():
+    """Depth of the outbound queues of this process's open sockets"""
+    depths = [len(queue) for queue in list(_live_queues) if not queue.closed]
+    return {
+        'sockets': len(depths),
+        'queued_frames': sum(depths),
+        'max_depth': max(depths, default=0),
+        'over_budget': sum(1 for queue in list(_live_queues) if queue._over_budget_since is not None),
+    }
+
+
+metrics.register_collector('outbound', outbound_stats)
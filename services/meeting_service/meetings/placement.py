@@ -0,0 +1,182 @@
+"""
+Sticky meeting -> node placement for horizontally scaled websocket nodes.
+
+Every node running the ASGI server heartbeats its id into the
+``meetings:nodes`` sorted set (scored by heartbeat expiry), with its
+address in ``meetings:nodes:addresses``. A meeting is placed on a live
+node by rendezvous hashing its meeting_id over the node ids, so every node
+and the REST API agree on the placement without coordinating, and a node
+joining or leaving only moves the meetings that hashed to it.
+
+The join response carries the placement (``websocket_node`` and the
+``X-Meeting-Node`` header) so a gateway or client can open the socket on
+that node. When all of a room's sockets are in one process, the channel
+layer delivers its group sends in process (meetings/channel_layers.py),
+so a node is meant to be a single serving process (gunicorn.conf.py runs
+one worker); scale out with more nodes, each with its own NODE_ID and
+NODE_ADDRESS.
+
+Each serving process of a node also heartbeats itself into
+``meetings:nodes:<node_id>:workers``, and leaving the registry only takes
+the node out once none of its processes is left, so a node run with
+several workers anyway stays placed while any of them serves.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .metrics import metrics
+from .realtime import get_realtime_settings
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+NODES_KEY = 'meetings:nodes'
+NODE_ADDRESSES_KEY = 'meetings:nodes:addresses'
+
+# KEYS: nodes, this node's workers; ARGV: node id, worker id, now.
+# Takes the worker out, and the node with it once no live worker is left
+_LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+# (fetched_at, {node_id: address}) of the last live node lookup in this process
+_node_cache = (0.0, {})
+
+
+def get_node_id():
+    return get_realtime_settings()['NODE_ID'] or socket.gethostname()
+
+
+def node_workers_key(node_id):
+    return f'meetings:nodes:{node_id}:workers'
+
+
+def get_node_address():
+    return get_realtime_settings()['NODE_ADDRESS'] or ''
+
+
+def _score(node_id, meeting_id):
+    digest = hashlib.blake2b(f'{node_id}|{meeting_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def node_for_meeting(meeting_id, node_ids):
+    """Rendezvous hash: the node with the highest score for this meeting, or None"""
+    if not node_ids:
+        return None
+    return max(node_ids, key=lambda node_id: (_score(node_id, meeting_id), node_id))
+
+
+def _cached_nodes():
+    fetched_at, nodes = _node_cache
+    if time.monotonic() - fetched_at < get_realtime_settings()['NODE_CACHE_TTL']:
+        return nodes
+    return None
+
+
+def _store_nodes(node_ids, addresses):
+    global _node_cache
+    nodes = {
+        node_id.decode(): (address or b'').decode()
+        for node_id, address in zip(node_ids, addresses)
+    }
+    _node_cache = (time.monotonic(), nodes)
+    return nodes
+
+
+def live_nodes():
+    """{node_id: address} of the nodes with a current heartbeat (cached briefly)"""
+    nodes = _cached_nodes()
+    if nodes is not None:
+        return nodes
+    redis = get_redis_connection('default')
+    node_ids = redis.zrangebyscore(NODES_KEY, time.time(), '+inf')
+    addresses = redis.hmget(NODE_ADDRESSES_KEY, node_ids) if node_ids else []
+    return _store_nodes(node_ids, addresses)
+
+
+async def alive_nodes():
+    """live_nodes() from the event loop"""
+    nodes = _cached_nodes()
+    if nodes is not None:
+        return nodes
+    redis = get_async_redis()
+    node_ids = await redis.zrangebyscore(NODES_KEY, time.time(), '+inf')
+    addresses = await redis.hmget(NODE_ADDRESSES_KEY, node_ids) if node_ids else []
+    return _store_nodes(node_ids, addresses)
+
+
+def _placement(meeting_id, nodes):
+    node_id = node_for_meeting(meeting_id, list(nodes))
+    if node_id is None:
+        return None
+    return {'node_id': node_id, 'address': nodes[node_id]}
+
+
+def placement_for(meeting_id):
+    """{'node_id', 'address'} of the node a meeting is placed on, or None without live nodes"""
+    try:
+        return _placement(meeting_id, live_nodes())
+    except RedisError as e:
+        logger.warning(f"Node registry unavailable: {e}")
+        return None
+
+
+async def aplacement_for(meeting_id):
+    try:
+        return _placement(meeting_id, await alive_nodes())
+    except RedisError as e:
+        logger.warning(f"Node registry unavailable: {e}")
+        return None
+
+
+async def heartbeat_node():
+    options = get_realtime_settings()
+    node_id = get_node_id()
+    expires_at = time.time() + options['NODE_TTL']
+    pipe = get_async_redis().pipeline(transaction=False)
+    pipe.zadd(NODES_KEY, {node_id: expires_at})
+    pipe.hset(NODE_ADDRESSES_KEY, node_id, get_node_address())
+    pipe.zadd(node_workers_key(node_id), {os.getpid(): expires_at})
+    pipe.expire(node_workers_key(node_id), options['NODE_TTL'] * 10)
+    # Forget nodes that stopped heartbeating long ago
+    pipe.zremrangebyscore(NODES_KEY, '-inf', time.time() - options['NODE_TTL'] * 10)
+    await pipe.execute()
+
+
+async def leave_placement():
+    """
+    Take this worker out of the node registry (shutdown); new meetings stop
+    being placed on the node once its last worker has left.
+    Returns whether the node left.
+    """
+    node_id = get_node_id()
+    left = await get_async_redis().eval(
+        _LEAVE_SCRIPT, 2, NODES_KEY, node_workers_key(node_id), node_id, os.getpid(), time.time()
+    )
+    return bool(left)
+
+
+async def run_node_heartbeat():
+    """Heartbeat this node into the registry until cancelled"""
+    interval = get_realtime_settings()['NODE_HEARTBEAT_INTERVAL']
+    while True:
+        try:
+            await heartbeat_node()
+        except RedisError as e:
+            metrics.incr('placement.heartbeat_failures')
+            logger.warning(f"Node heartbeat failed: {e}")
+        await asyncio.sleep(interval)
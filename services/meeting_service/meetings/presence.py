@@ -0,0 +1,167 @@
+"""
+Socket presence and the stale-socket reaper.
+
+A joined socket pings every HEARTBEAT_INTERVAL seconds; each ping (and the
+join itself) pushes its entry in the ``meetings:presence`` sorted set out
+to now + PRESENCE_TTL. Clients that vanish without a clean close stop
+pinging, and reap_expired_sockets() later does what their disconnect would
+have done: it unregisters the channel, clears socket_id, removes the
+participant from the roster, drops the channel from the room group and
+broadcasts participant_left. Expired entries are claimed atomically in
+batches, and each batch costs a few pipelined round trips whatever its
+size, so reaping the sockets of a crashed node stays cheap.
+
+A socket that drops after joining keeps its entry for RESUME_GRACE more
+seconds instead of leaving at once; a clean close (1000) or a ``leave``
+frame is a hang-up and leaves at once. A reconnect presenting the socket's
+resume token (meetings/tokens.py) in that window claims the entry with
+claim_resume() and takes over the participant where the old socket left
+off. Otherwise the reaper finishes the leave as above.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from .channel_registry import queue_unregister_channel, registry_key
+from .envelopes import envelope
+from .live_state import queue_participant_state
+from .metrics import metrics
+from .realtime import get_realtime_settings
+from .redis_client import get_async_redis
+from .roster import queue_roster_removal, roster_key
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_KEY = 'meetings:presence'
+
+# Claim up to ARGV[2] entries that expired before ARGV[1]
+_CLAIM_EXPIRED_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+end
+return expired
+"""
+
+# KEYS: presence, the meeting's channel registry and roster. ARGV: the held
+# entry, participant id, its old and new channel, the new entry, now and the
+# new entry's expiry. Hands the participant over to the new channel if the
+# held entry has not expired, the registry still points at the old channel
+# and the participant is still in the roster.
+_CLAIM_RESUME_SCRIPT = """
+local expires_at = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expires_at or tonumber(expires_at) < tonumber(ARGV[6]) then
+    return 0
+end
+if redis.call('HGET', KEYS[2], ARGV[2]) ~= ARGV[3] or redis.call('HEXISTS', KEYS[3], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[4])
+redis.call('ZADD', KEYS[1], ARGV[7], ARGV[5])
+return 1
+"""
+
+
+def _member(meeting_id, participant_id, channel_name):
+    return json.dumps([meeting_id, participant_id, channel_name])
+
+
+async def touch_presence(meeting_id, participant_id, channel_name, ttl=None):
+    """Record that the socket is alive for another PRESENCE_TTL (or ttl) seconds"""
+    expires_at = time.time() + (ttl or get_realtime_settings()['PRESENCE_TTL'])
+    await get_async_redis().zadd(PRESENCE_KEY, {_member(meeting_id, participant_id, channel_name): expires_at})
+
+
+async def clear_presence(meeting_id, participant_id, channel_name):
+    await get_async_redis().zrem(PRESENCE_KEY, _member(meeting_id, participant_id, channel_name))
+
+
+async def claim_resume(meeting_id, participant_id, old_channel_name, channel_name):
+    """
+    Move a participant held for resume from old_channel_name to channel_name.
+
+    Returns False once the grace window has passed, or when the participant
+    has left or joined again from another socket meanwhile.
+    """
+    now = time.time()
+    claimed = await get_async_redis().eval(
+        _CLAIM_RESUME_SCRIPT, 3, PRESENCE_KEY, registry_key(meeting_id), roster_key(meeting_id),
+        _member(meeting_id, participant_id, old_channel_name), participant_id, old_channel_name, channel_name,
+        _member(meeting_id, participant_id, channel_name), now, now + get_realtime_settings()['PRESENCE_TTL'],
+    )
+    return bool(claimed)
+
+
+async def reap_expired_sockets(channel_layer, limit=None):
+    """
+    Clean up after one batch of sockets whose heartbeat expired.
+
+    Returns (sockets reaped, participants that left).
+    """
+    redis = get_async_redis()
+    limit = limit or get_realtime_settings()['REAPER_BATCH']
+    claimed = await redis.eval(_CLAIM_EXPIRED_SCRIPT, 1, PRESENCE_KEY, time.time(), limit)
+    if not claimed:
+        return 0, 0
+    expired = [json.loads(member) for member in claimed]
+
+    # Participants who reconnected from another socket keep their registry entry
+    pipe = redis.pipeline(transaction=False)
+    for meeting_id, participant_id, channel_name in expired:
+        queue_unregister_channel(pipe, meeting_id, participant_id, channel_name)
+    left = [entry for entry, removed in zip(expired, await pipe.execute()) if removed]
+
+    if left:
+        pipe = redis.pipeline(transaction=False)
+        for meeting_id, participant_id, _ in left:
+            queue_participant_state(pipe, meeting_id, participant_id, socket_id=None)
+        await pipe.execute()
+        pipe = redis.pipeline(transaction=False)
+        for meeting_id, participant_id, _ in left:
+            queue_roster_removal(pipe, meeting_id, participant_id)
+        roster_versions = await pipe.execute()
+    else:
+        roster_versions = []
+
+    channel_ops = []
+    for meeting_id, participant_id, channel_name in expired:
+        channel_ops.append(channel_layer.group_discard(f'meeting_{meeting_id}', channel_name))
+        # Closes the socket if its consumer is in fact still around (half-open TCP)
+        channel_ops.append(channel_layer.send(channel_name, {'type': 'presence_expired'}))
+    for (meeting_id, participant_id, _), roster_version in zip(left, roster_versions):
+        channel_ops.append(channel_layer.group_send(
+            f'meeting_{meeting_id}',
+            envelope({
+                'type': 'participant_left',
+                'participant_id': participant_id,
+                'roster_version': roster_version,
+                'meeting_id': meeting_id
+            }, event_type='participant_left', participant_id=participant_id)
+        ))
+    for result in await asyncio.gather(*channel_ops, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.warning(f"Channel layer call failed while reaping sockets: {result}")
+
+    metrics.incr('presence.sockets_reaped', len(expired))
+    metrics.incr('presence.participants_left', len(left))
+    return len(expired), len(left)
+
+
+async def reap_until_caught_up(channel_layer, limit=None):
+    """Reap batches until no expired sockets are left; returns the totals"""
+    reaped = left = 0
+    while True:
+        try:
+            batch_reaped, batch_left = await reap_expired_sockets(channel_layer, limit)
+        except RedisError as e:
+            logger.error(f"Failed to reap stale sockets: {e}")
+            break
+        reaped += batch_reaped
+        left += batch_left
+        if batch_reaped < (limit or get_realtime_settings()['REAPER_BATCH']):
+            break
+    return reaped, left
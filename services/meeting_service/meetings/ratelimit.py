@@ -0,0 +1,103 @@
+"""
+In-memory token buckets for frames received on a websocket.
+
+Every socket has a connection-wide bucket plus one per message type, all
+configured in REALTIME_SETTINGS['RATE_LIMITS'] as (tokens per second,
+burst). A frame is processed only if both buckets have a token. A
+throttled frame is dropped and the client gets one rate_limited notice
+per streak; throttled frames themselves draw from a violations bucket, and
+a socket that drains it is disconnected. None of this does any I/O.
+"""
+import time
+
+from .metrics import metrics
+
+# Key of the connection-wide bucket in RATE_LIMITS
+ALL_MESSAGES = '*'
+
+ALLOW = 'allow'
+THROTTLE = 'throttle'  # drop the frame and tell the client
+DROP = 'drop'  # drop the frame, the client has already been told
+DISCONNECT = 'disconnect'
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def consume(self, now, tokens=1.0):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def retry_after(self, tokens=1.0):
+        """Seconds until `tokens` are available, as of the last consume()"""
+        if self.rate <= 0:
+            return None
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class ConnectionRateLimiter:
+    """
+    Buckets of one socket; check() returns ALLOW, THROTTLE, DROP or DISCONNECT
+    """
+
+    def __init__(self, limits, violations):
+        self.limits = limits
+        self.violations = TokenBucket(*violations)
+        self._buckets = {}
+        self._throttled = set()
+
+    def _bucket(self, message_type):
+        bucket = self._buckets.get(message_type)
+        if bucket is None:
+            limit = self.limits.get(message_type)
+            if limit is None:
+                return None
+            bucket = self._buckets[message_type] = TokenBucket(*limit)
+        return bucket
+
+    def check(self, message_type):
+        now = time.monotonic()
+        # Client-chosen type names only become metric names when configured
+        limited_type = message_type if message_type in self.limits else ALL_MESSAGES
+
+        names = (ALL_MESSAGES,) if limited_type == ALL_MESSAGES else (ALL_MESSAGES, limited_type)
+        allowed = True
+        for name in names:
+            bucket = self._bucket(name)
+            if bucket is not None and not bucket.consume(now):
+                allowed = False
+                break
+        if allowed:
+            self._throttled.discard(limited_type)
+            return ALLOW
+
+        metrics.incr(f'ratelimit.throttled.{limited_type}')
+        if not self.violations.consume(now):
+            metrics.incr('ratelimit.disconnects')
+            return DISCONNECT
+        if limited_type in self._throttled:
+            return DROP
+        self._throttled.add(limited_type)
+        return THROTTLE
+
+    def retry_after(self, message_type):
+        """Seconds until a frame of this type would be accepted again"""
+        waits = [
+            bucket.retry_after() for bucket in (self._bucket(ALL_MESSAGES), self._bucket(message_type))
+            if bucket is not None
+        ]
+        waits = [wait for wait in waits if wait is not None]
+        return max(waits, default=0.0)
@@ -0,0 +1,75 @@
+"""
+Tunables for the meeting websocket (REALTIME_SETTINGS).
+"""
+from django.conf import settings
+
+REALTIME_DEFAULTS = {
+    # Lifetime of a meeting's participant -> channel_name registry, refreshed on every join
+    'CHANNEL_REGISTRY_TTL': 60 * 60 * 12,
+    # Trickle-ICE candidates for the same peer pair arriving within this many
+    # seconds are sent as one ice_candidates message; 0 disables coalescing
+    'ICE_COALESCE_WINDOW': 0.01,
+    'ICE_COALESCE_MAX_BATCH': 32,
+    # Write-behind participant media/connection state (meetings/live_state.py)
+    'LIVE_STATE_TTL': 60 * 60 * 24,
+    'LIVE_STATE_FLUSH_INTERVAL': 5.0,
+    'LIVE_STATE_FLUSH_BATCH': 200,
+    # Room roster sent to joining sockets (meetings/roster.py)
+    'ROSTER_TTL': 60 * 60 * 24,
+    # Roster changes kept for delta sync of reconnecting sockets
+    'ROSTER_LOG_SIZE': 256,
+    # Per-socket outbound queue (meetings/outbound.py): frames queued before
+    # droppable ones are shed, and how long a socket may stay over that
+    # before it is disconnected
+    'OUTBOUND_QUEUE_MAX_DEPTH': 256,
+    'OUTBOUND_OVER_BUDGET_GRACE': 5.0,
+    # Token buckets for frames a socket sends (meetings/ratelimit.py), as
+    # (tokens per second, burst); '*' is shared by all message types
+    'RATE_LIMITS': {
+        '*': (50.0, 200),
+        'ping': (1.0, 5),
+        'join_room': (0.5, 5),
+        'resume': (0.5, 5),
+        'webrtc_offer': (5.0, 20),
+        'webrtc_answer': (5.0, 20),
+        'ice_candidate': (50.0, 200),
+        'media_control': (5.0, 20),
+        'screen_share': (1.0, 5),
+        'chat_message': (2.0, 10),
+        'connection_stats': (1.0, 5),
+    },
+    # Throttled frames a socket may send, same format, before it is disconnected
+    'RATE_LIMIT_VIOLATIONS': (1.0, 20),
+    # Heartbeat (meetings/presence.py): clients ping every HEARTBEAT_INTERVAL
+    # seconds, sockets silent for PRESENCE_TTL are reaped, REAPER_BATCH at a time
+    'HEARTBEAT_INTERVAL': 15,
+    'PRESENCE_TTL': 45,
+    'REAPER_INTERVAL': 5.0,
+    'REAPER_BATCH': 500,
+    # Worker shutdown (meetings/shutdown.py): seconds to let queued frames go
+    # out, and the window clients spread their reconnects over
+    'DRAIN_TIMEOUT': 10.0,
+    'DRAIN_RECONNECT_SPREAD': 5.0,
+    # Meeting -> node placement (meetings/placement.py); NODE_ID defaults to
+    # the hostname, NODE_ADDRESS is what the join response points clients at
+    'NODE_ID': '',
+    'NODE_ADDRESS': '',
+    'NODE_HEARTBEAT_INTERVAL': 5.0,
+    'NODE_TTL': 15,
+    'NODE_CACHE_TTL': 2.0,
+    # Session resume (meetings/presence.py): seconds a dropped socket's
+    # participant stays in the room for a reconnect to resume, 0 to leave
+    # at once, and how long after issue a resume token is accepted
+    'RESUME_GRACE': 30,
+    'RESUME_TOKEN_MAX_AGE': 60 * 60 * 12,
+    # Seconds between re-checks of the opaque tokens behind a worker's open
+    # sockets (meetings/sessions.py), 0 to only check at the handshake
+    'SESSION_RECHECK_INTERVAL': 300,
+}
+
+
+def get_realtime_settings():
+    """Return REALTIME_SETTINGS merged over the defaults"""
+    options = dict(REALTIME_DEFAULTS)
+    options.update(getattr(settings, 'REALTIME_SETTINGS', {}))
+    return options
@@ -0,0 +1,20 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+# redis.asyncio connections belong to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    Async Redis client for the running event loop, on the same REDIS_URL
+    as the cache and channel layer
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.from_url(settings.REDIS_URL)
+    return client
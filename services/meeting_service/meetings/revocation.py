@@ -0,0 +1,95 @@
+"""
+Listener for auth-service events (token revocation, user changes).
+
+Every worker process runs one daemon thread subscribed to the auth events
+channel and evicts matching entries from its token cache as soon as an
+event arrives. That is what makes long cache TTLs safe.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AuthEventListener(threading.Thread):
+    """
+    Daemon thread applying auth events to a VerifiedTokenCache
+    """
+
+    reconnect_delay = 1.0
+    max_reconnect_delay = 30.0
+
+    def __init__(self, token_cache):
+        super().__init__(name='auth-event-listener', daemon=True)
+        self.token_cache = token_cache
+        self.channel = token_cache.options['REVOCATION_CHANNEL']
+        self.connected = False
+
+    def run(self):
+        delay = self.reconnect_delay
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis.Redis.from_url(settings.REDIS_URL).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.connected = True
+                delay = self.reconnect_delay
+                logger.info(f"Listening for auth events on {self.channel}")
+                for message in pubsub.listen():
+                    self.handle_message(message)
+            except redis.RedisError as e:
+                logger.warning(f"Auth event listener disconnected: {e}")
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+            # Events may have been missed while disconnected, so the
+            # in-process tier can no longer be trusted
+            if self.connected:
+                self.connected = False
+                self.token_cache.local.clear()
+            metrics.incr('auth_events.reconnects')
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def handle_message(self, message):
+        try:
+            event = json.loads(message['data'])
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring malformed auth event: {message['data']!r}")
+            return
+
+        event_type = event.get('type')
+        if event_type == 'token_revoked':
+            self.token_cache.evict_hash(event['token_hash'])
+        elif event_type == 'user_changed':
+            self.token_cache.evict_user(event['user_id'])
+        else:
+            return
+        metrics.incr(f'auth_events.{event_type}')
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def ensure_auth_event_listener(token_cache):
+    """Start this process's listener thread if it is not running yet"""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid() and _listener is not None and _listener.is_alive():
+        return _listener
+    with _listener_lock:
+        if _listener_pid != os.getpid() or _listener is None or not _listener.is_alive():
+            _listener = AuthEventListener(token_cache)
+            _listener.start()
+            _listener_pid = os.getpid()
+    return _listener
@@ -0,0 +1,170 @@
+"""
+Live room roster per meeting.
+
+``meeting:<id>:roster`` is a Redis hash of participant id -> JSON entry
+(name, role, guest flag and media state). The consumer adds an entry when
+a socket joins and removes it when the socket leaves; media changes are
+merged in by the live state store. A joining socket receives the whole
+roster as one ``room_snapshot`` frame, without touching Postgres.
+
+Every change also bumps ``meeting:<id>:roster:version`` and appends
+``{version, op, ...}`` to the bounded change log ``meeting:<id>:roster:log``
+in the same script, so versions in the log are contiguous. A reconnecting
+socket that sends its last-seen version gets only the changes since then
+as a ``roster_delta`` frame, and a snapshot only when the log has already
+been trimmed past that version. Changes are whole-entry upserts and
+removals, so replaying one the client has already seen is harmless.
+"""
+import json
+
+from django_redis import get_redis_connection
+
+from .realtime import get_realtime_settings
+from .redis_client import get_async_redis
+
+ROSTER_MEDIA_FIELDS = ('audio_enabled', 'video_enabled', 'screen_sharing')
+
+# KEYS: roster, version, log. Shared tail of the scripts below: bump the
+# version, log the change and refresh the TTLs. ARGV[1] is always the log
+# size and ARGV[2] the TTL.
+_RECORD_CHANGE = """
+local function record(change)
+    local version = redis.call('INCR', KEYS[2])
+    change['version'] = version
+    redis.call('RPUSH', KEYS[3], cjson.encode(change))
+    redis.call('LTRIM', KEYS[3], -tonumber(ARGV[1]), -1)
+    for _, key in ipairs(KEYS) do
+        redis.call('EXPIRE', key, ARGV[2])
+    end
+    return version
+end
+"""
+
+# ARGV[3] participant id, ARGV[4] JSON entry
+_ADD_SCRIPT = _RECORD_CHANGE + """
+redis.call('HSET', KEYS[1], ARGV[3], ARGV[4])
+return record({op = 'upsert', participant = cjson.decode(ARGV[4])})
+"""
+
+# ARGV[3] participant id, ARGV[4] JSON changes. Participants not on the
+# roster are left alone.
+_MERGE_SCRIPT = _RECORD_CHANGE + """
+local entry = redis.call('HGET', KEYS[1], ARGV[3])
+if not entry then
+    return 0
+end
+local data = cjson.decode(entry)
+for field, value in pairs(cjson.decode(ARGV[4])) do
+    data[field] = value
+end
+redis.call('HSET', KEYS[1], ARGV[3], cjson.encode(data))
+return record({op = 'upsert', participant = data})
+"""
+
+# ARGV[3] participant id
+_REMOVE_SCRIPT = _RECORD_CHANGE + """
+if redis.call('HDEL', KEYS[1], ARGV[3]) == 0 then
+    return 0
+end
+return record({op = 'remove', participant_id = ARGV[3]})
+"""
+
+# Version and entries read together so they agree
+_SNAPSHOT_SCRIPT = """
+return {redis.call('GET', KEYS[2]), redis.call('HVALS', KEYS[1])}
+"""
+
+# ARGV[1] last version the client saw. Returns {version, changes}, with
+# changes false (nil) when the log no longer covers the gap.
+_CHANGES_SCRIPT = """
+local version = tonumber(redis.call('GET', KEYS[2]) or '0')
+local since = tonumber(ARGV[1])
+if since == version then
+    return {version, {}}
+end
+local oldest = redis.call('LINDEX', KEYS[3], 0)
+if since > version or not oldest then
+    return {version, false}
+end
+local first = cjson.decode(oldest)['version']
+if first > since + 1 then
+    return {version, false}
+end
+return {version, redis.call('LRANGE', KEYS[3], since + 1 - first, -1)}
+"""
+
+
+def roster_key(meeting_id):
+    return f'meeting:{meeting_id}:roster'
+
+
+def _keys(meeting_id):
+    key = roster_key(meeting_id)
+    return [key, f'{key}:version', f'{key}:log']
+
+
+def _change_args(meeting_id, *args):
+    options = get_realtime_settings()
+    return (3, *_keys(meeting_id), options['ROSTER_LOG_SIZE'], options['ROSTER_TTL'], *args)
+
+
+def roster_entry(participant):
+    """Roster entry for a participant given as a dict of MeetingParticipant values"""
+    return {
+        'participant_id': str(participant['id']),
+        'name': participant['name'],
+        'role': participant['role'],
+        'is_guest': participant['is_guest'],
+        'audio_enabled': participant['audio_enabled'],
+        'video_enabled': participant['video_enabled'],
+        'screen_sharing': participant['screen_sharing'],
+    }
+
+
+async def add_to_roster(meeting_id, entry):
+    """Add or replace a participant's entry; returns the new roster version"""
+    return await get_async_redis().eval(
+        _ADD_SCRIPT, *_change_args(meeting_id, entry['participant_id'], json.dumps(entry))
+    )
+
+
+async def remove_from_roster(meeting_id, participant_id):
+    """Remove a participant's entry; returns the new roster version, or 0 if it was not there"""
+    return await get_async_redis().eval(_REMOVE_SCRIPT, *_change_args(meeting_id, str(participant_id)))
+
+
+def remove_from_roster_sync(meeting_id, participant_id):
+    return get_redis_connection('default').eval(_REMOVE_SCRIPT, *_change_args(meeting_id, str(participant_id)))
+
+
+def queue_roster_update(pipe, meeting_id, participant_id, changes):
+    """Queue a merge of media changes into a participant's entry on a (sync or async) pipeline"""
+    pipe.eval(_MERGE_SCRIPT, *_change_args(meeting_id, participant_id, json.dumps(changes)))
+
+
+def queue_roster_removal(pipe, meeting_id, participant_id):
+    """remove_from_roster on a pipeline; its result is the new version, or 0"""
+    pipe.eval(_REMOVE_SCRIPT, *_change_args(meeting_id, str(participant_id)))
+
+
+async def get_roster(meeting_id):
+    """(version, all roster entries) of a meeting"""
+    version, entries = await get_async_redis().eval(_SNAPSHOT_SCRIPT, 2, *_keys(meeting_id)[:2])
+    return int(version or 0), [json.loads(entry) for entry in entries]
+
+
+async def get_roster_changes(meeting_id, since):
+    """
+    (version, changes) made after version `since`.
+
+    changes is None when the change log no longer reaches back that far
+    (or the roster was reset since), and the caller must send a snapshot.
+    """
+    version, changes = await get_async_redis().eval(_CHANGES_SCRIPT, 3, *_keys(meeting_id), since)
+    if changes is None:
+        return version, None
+    return version, [json.loads(change) for change in changes]
+
+
+def clear_roster(meeting_id):
+    get_redis_connection('default').delete(*_keys(meeting_id))
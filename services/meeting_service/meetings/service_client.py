@@ -0,0 +1,196 @@
+"""
+Shared HTTP client for calls from the meeting service to other services.
+
+One requests.Session per service and per process keeps connections alive in
+a bounded urllib3 pool. Connect and read timeouts are separate, idempotent
+requests are retried a bounded number of times with jittered backoff, and
+every call is recorded in the metrics registry. A circuit breaker per service
+makes callers fail fast while the service is down.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SERVICE_CLIENT_DEFAULTS = {
+    'BASE_URL': '',
+    'CONNECT_TIMEOUT': 1.0,
+    'READ_TIMEOUT': 3.0,
+    'MAX_RETRIES': 2,
+    'BACKOFF_BASE': 0.05,
+    'BACKOFF_MAX': 0.5,
+    'RETRY_STATUSES': (502, 503, 504),
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 32,
+    'HEADERS': {},
+    'CIRCUIT_BREAKER': {},
+}
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class ServiceClient:
+    """
+    Keep-alive HTTP client for a single downstream service
+    """
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.base_url = options['BASE_URL'].rstrip('/')
+        self.timeout = (options['CONNECT_TIMEOUT'], options['READ_TIMEOUT'])
+        self.adapter = HTTPAdapter(
+            pool_connections=options['POOL_CONNECTIONS'],
+            pool_maxsize=options['POOL_MAXSIZE'],
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers.update(options['HEADERS'])
+        self.breaker = CircuitBreaker(name, options['CIRCUIT_BREAKER'])
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _metric(self, suffix):
+        return f'service_client.{self.name}.{suffix}'
+
+    def _backoff(self, attempt):
+        """Full jitter: sleep a random time up to the capped exponential step"""
+        cap = min(self.options['BACKOFF_MAX'], self.options['BACKOFF_BASE'] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def request(self, method, path, retry=None, **kwargs):
+        """
+        Send a request to the service.
+
+        Connection errors, timeouts and RETRY_STATUSES responses are retried
+        up to MAX_RETRIES times for idempotent methods (or when retry=True).
+        The last response is returned, or the last exception re-raised.
+        While the circuit is open CircuitOpenError is raised without sending.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} service circuit is open")
+
+        try:
+            response = self._send(method, path, retry, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _send(self, method, path, retry, **kwargs):
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        max_retries = self.options['MAX_RETRIES'] if retry else 0
+        kwargs.setdefault('timeout', self.timeout)
+        url = f'{self.base_url}{path}'
+
+        attempt = 0
+        while True:
+            with self._lock:
+                self._in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.incr(self._metric('errors'))
+                if attempt >= max_retries:
+                    raise
+                logger.warning(f"{self.name} service {method} {path} failed ({e}), retrying")
+            else:
+                metrics.incr(self._metric(f'responses.{response.status_code // 100}xx'))
+                if response.status_code not in self.options['RETRY_STATUSES'] or attempt >= max_retries:
+                    return response
+                logger.warning(f"{self.name} service {method} {path} returned {response.status_code}, retrying")
+            finally:
+                metrics.observe(self._metric('latency'), time.perf_counter() - start)
+                metrics.incr(self._metric('requests'))
+                with self._lock:
+                    self._in_flight -= 1
+
+            attempt += 1
+            metrics.incr(self._metric('retries'))
+            time.sleep(self._backoff(attempt))
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def pool_stats(self):
+        """Connection pool usage for this client"""
+        container = self.adapter.poolmanager.pools
+        with container.lock:
+            pools = list(container._container.values())
+        return {
+            'pools': len(pools),
+            'connections_opened': sum(pool.num_connections for pool in pools),
+            'requests_sent': sum(pool.num_requests for pool in pools),
+            # The pool queue is pre-filled with None placeholders; real entries are idle sockets
+            'idle_connections': sum(
+                1 for pool in pools if pool.pool is not None for conn in list(pool.pool.queue) if conn
+            ),
+            'in_flight': self._in_flight,
+            'pool_maxsize': self.options['POOL_MAXSIZE'],
+            'circuit': self.breaker.stats(),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def get_service_options(name):
+    """Return SERVICE_CLIENTS[name] merged over the defaults"""
+    services = getattr(settings, 'SERVICE_CLIENTS', {})
+    if name not in services:
+        raise KeyError(f"No SERVICE_CLIENTS entry for service '{name}'")
+    options = dict(SERVICE_CLIENT_DEFAULTS)
+    options.update(services[name])
+    return options
+
+
+def get_service_client(name):
+    """
+    Process-wide client for the named service.
+
+    Clients are rebuilt after a fork so worker processes never share
+    pooled sockets with their parent.
+    """
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = ServiceClient(name, get_service_options(name))
+            metrics.register_collector('service_clients', _pool_stats)
+    return client
+
+
+def _pool_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.pool_stats() for client in clients}
@@ -0,0 +1,86 @@
+"""
+Periodic re-check of the sessions behind this worker's websockets.
+
+A websocket is authenticated once, at the handshake, so a token revoked or
+a user deactivated afterwards kept its open sockets. Every
+SESSION_RECHECK_INTERVAL seconds the worker re-verifies the opaque bearer
+tokens of its open sockets with verify_tokens_batch(): tokens still in the
+token cache are answered locally, revoked ones have been evicted from it
+(meetings/revocation.py) and go to the auth service in batched requests.
+Sockets whose token is no longer valid are closed with 4401. Signed access
+tokens and guest tokens are verified locally at the handshake and are left
+to their expiry.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+
+from .authentication import AuthServiceUnavailable, is_signed_token, verify_tokens_batch
+from .metrics import metrics
+from .middleware import get_scope_token
+from .realtime import get_realtime_settings
+from .shutdown import open_sockets
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code for a session that is no longer authenticated
+SESSION_INVALID_CLOSE_CODE = 4401
+
+
+def _session_token(consumer):
+    if not getattr(getattr(consumer, 'user', None), 'is_authenticated', False):
+        return None
+    token = get_scope_token(consumer.scope)
+    if token is None or is_signed_token(token):
+        return None
+    return token
+
+
+async def recheck_sessions():
+    """
+    Re-verify the opaque tokens of this worker's open sockets and close the
+    ones that are no longer valid.
+
+    Returns the number of sockets closed.
+    """
+    sockets = {}
+    for consumer in open_sockets():
+        token = _session_token(consumer)
+        if token is not None:
+            sockets.setdefault(token, []).append(consumer)
+    if not sockets:
+        return 0
+
+    try:
+        valid = await sync_to_async(verify_tokens_batch, thread_sensitive=False)(list(sockets))
+    except AuthServiceUnavailable as e:
+        # No verdict: keep every session until the next pass
+        metrics.incr('sessions.recheck_failures')
+        logger.warning(f"Session re-check skipped: {e}")
+        return 0
+
+    closed = 0
+    for token, consumers in sockets.items():
+        if token in valid:
+            continue
+        for consumer in consumers:
+            logger.info(f"Closing websocket of user {consumer.user.id}: token no longer valid")
+            await consumer.close(code=SESSION_INVALID_CLOSE_CODE)
+            closed += 1
+    metrics.incr('sessions.rechecked', sum(len(consumers) for consumers in sockets.values()))
+    metrics.incr('sessions.closed', closed)
+    return closed
+
+
+async def run_session_recheck():
+    """Re-check this worker's sessions until cancelled; a no-op when SESSION_RECHECK_INTERVAL is 0"""
+    interval = get_realtime_settings()['SESSION_RECHECK_INTERVAL']
+    if not interval:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await recheck_sessions()
+        except Exception as e:
+            logger.error(f"Session re-check failed: {e}")
@@ -0,0 +1,75 @@
+"""
+Graceful drain of a worker's websockets.
+
+On shutdown uvicorn closes every websocket at once with code 1012, which
+throws away frames still in outbound queues and has every client of the
+worker reconnect in the same instant. drain_sockets() runs first (see
+config/workers.py). It stops new sockets from being accepted, tells each
+open socket to reconnect after a random delay within DRAIN_RECONNECT_SPREAD,
+lets its queued frames go out for up to DRAIN_TIMEOUT seconds, and then
+closes it with 1012, so the normal disconnect cleanup runs for every socket.
+"""
+import asyncio
+import logging
+import weakref
+
+from .metrics import metrics
+from .realtime import get_realtime_settings
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code "Service Restart"
+SERVICE_RESTART_CLOSE_CODE = 1012
+
+_open_sockets = weakref.WeakSet()
+_draining = False
+
+
+def is_draining():
+    return _draining
+
+
+def track_socket(consumer):
+    _open_sockets.add(consumer)
+
+
+def untrack_socket(consumer):
+    _open_sockets.discard(consumer)
+
+
+def open_sockets():
+    return list(_open_sockets)
+
+
+def open_socket_count():
+    return len(_open_sockets)
+
+
+async def drain_sockets(timeout=None):
+    """
+    Drain every open socket of this process; consumers implement drain(reconnect_spread, deadline).
+
+    Returns the number of sockets drained.
+    """
+    global _draining
+    _draining = True
+    options = get_realtime_settings()
+    timeout = options['DRAIN_TIMEOUT'] if timeout is None else timeout
+    consumers = open_sockets()
+    if not consumers:
+        return 0
+
+    logger.info(f"Draining {len(consumers)} websockets")
+    deadline = asyncio.get_running_loop().time() + timeout
+    results = await asyncio.gather(
+        *(consumer.drain(options['DRAIN_RECONNECT_SPREAD'], deadline) for consumer in consumers),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to drain websocket: {result}")
+    metrics.incr('shutdown.sockets_drained', len(consumers))
+    return len(consumers)
+
+
+metrics.register_collector('sockets', lambda: {'open': open_socket_count(), 'draining': _draining})
@@ -1,3 +1,1017 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.core import signing
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from fakeredis import FakeRedis, FakeServer
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import AuthServiceUnavailable, GoogleOAuthBackend, GuestTokenAuthentication, verify_tokens_batch
+from .channel_layers import CHAT, HashRing, LocalFastPathChannelLayer, ShardedChannelLayer, frame_class
+from .channel_registry import registry_key
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .coalescing import IceCandidateCoalescer
+from .consumers import MeetingConsumer
+from .envelopes import encoded_frame, envelope
+from .live_state import _parse_state, end_meeting_state, save_participant_state
+from .models import Meeting, MeetingParticipant
+from .outbound import OutboundQueue, frame_policy
+from .placement import NODES_KEY, get_node_id, heartbeat_node, leave_placement, node_for_meeting, node_workers_key
+from .presence import claim_resume, touch_presence
+from .ratelimit import ALLOW, DISCONNECT, DROP, THROTTLE, ConnectionRateLimiter
+from .roster import roster_key
+from .sessions import SESSION_INVALID_CLOSE_CODE, recheck_sessions
+from .singleflight import SingleFlight
+from .token_cache import INVALID_TOKEN, TOKEN_CACHE_DEFAULTS, LocalLRUCache, VerifiedTokenCache, hash_token
+from .tokens import (
+    get_guest_token_max_age, issue_guest_token, issue_resume_token, verify_guest_token, verify_resume_token
+)
+from .wire import JSON, MSGPACK, encode_json
+
+
+class LocalDeliveryLaneTests(SimpleTestCase):
+
+    def setUp(self):
+        self.layer = LocalFastPathChannelLayer(hosts=['redis://localhost:6379/0'], capacity=100)
+        self.channel = f'specific.{self.layer.client_prefix}!consumer'
+
+    def chat(self, i):
+        return envelope({'type': 'chat_message', 'message': f'message {i}', 'meeting_id': 'abc-defg-hij'})
+
+    async def receive_buffered(self):
+        # receive() only goes to Redis once the channel's buffer is empty
+        messages = []
+        while not self.layer.receive_buffer[self.channel].empty():
+            messages.append(await self.layer.receive(self.channel))
+        return messages
+
+    async def test_chat_burst_does_not_evict_control(self):
+        self.layer._deliver_local(self.channel, {'type': 'meeting_status_change', 'status': 'ended'})
+        for i in range(150):
+            self.layer._deliver_local(self.channel, self.chat(i))
+
+        messages = await self.receive_buffered()
+
+        self.assertEqual(len(messages), 101)
+        self.assertEqual(messages[0]['type'], 'meeting_status_change')
+        # The chat lane kept its newest messages, in order
+        self.assertEqual(messages[1]['frame'], self.chat(50)['frame'])
+        self.assertEqual(messages[-1]['frame'], self.chat(149)['frame'])
+
+    async def test_control_delivered_before_earlier_chat(self):
+        for i in range(3):
+            self.layer._deliver_local(self.channel, self.chat(i))
+        self.layer._deliver_local(self.channel, {'type': 'participant_left', 'participant_id': 'p'})
+
+        messages = await self.receive_buffered()
+
+        self.assertEqual([message['type'] for message in messages], ['participant_left'] + ['relay_frame'] * 3)
+
+
+class HashRingTests(SimpleTestCase):
+
+    hosts = [f'redis://redis-{i}:6379/0' for i in range(4)]
+    keys = [f'meeting_{i}' for i in range(2000)]
+
+    def placement(self, hosts):
+        ring = HashRing(hosts)
+        return {key: hosts[ring.index_for(key)] for key in self.keys}
+
+    def test_keys_spread_over_every_shard(self):
+        counts = {}
+        for host in self.placement(self.hosts).values():
+            counts[host] = counts.get(host, 0) + 1
+
+        self.assertEqual(set(counts), set(self.hosts))
+        self.assertGreater(min(counts.values()), len(self.keys) / len(self.hosts) / 2)
+
+    def test_adding_a_shard_only_moves_keys_onto_it(self):
+        before = self.placement(self.hosts)
+        after = self.placement(self.hosts + ['redis://redis-4:6379/0'])
+
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == 'redis://redis-4:6379/0' for key in moved))
+        self.assertLess(len(moved), len(self.keys) / 3)
+
+    def test_removing_a_shard_only_moves_its_keys(self):
+        before = self.placement(self.hosts)
+        after = self.placement(self.hosts[:1] + self.hosts[2:])
+
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(all(before[key] == self.hosts[1] for key in moved))
+
+    def test_single_shard(self):
+        self.assertEqual(HashRing(self.hosts[:1]).index_for('meeting_1'), 0)
+
+
+class ShardedChannelLayerTests(SimpleTestCase):
+
+    hosts = ['redis://redis-0:6379/0', 'redis://redis-1:6379/0']
+
+    def setUp(self):
+        self.shards = [FakeAsyncRedis(server=FakeServer()) for _ in self.hosts]
+
+    def layer(self, layer_class=ShardedChannelLayer):
+        layer = layer_class(hosts=self.hosts)
+        layer.connection = lambda index: self.shards[index]
+        return layer
+
+    def layers_on_both_shards(self):
+        # A process's channels all live on the shard its client prefix hashes to
+        first = self.layer()
+        second = self.layer()
+        while second.consistent_hash(f'specific.{second.client_prefix}!') == \
+                first.consistent_hash(f'specific.{first.client_prefix}!'):
+            second = self.layer()
+        return first, second
+
+    async def backed_up(self):
+        return [key for shard in self.shards for key in await shard.keys('*$inflight')]
+
+    async def settle(self, layer):
+        await asyncio.gather(*layer.receive_cleaners)
+
+    async def test_send_then_receive(self):
+        layer = self.layer()
+        channel = await layer.new_channel()
+
+        await layer.send(channel, {'type': 'participant_joined', 'participant_id': 'p'})
+        message = await asyncio.wait_for(layer.receive(channel), 1)
+
+        self.assertEqual(message, {'type': 'participant_joined', 'participant_id': 'p'})
+        await self.settle(layer)
+        self.assertEqual(await self.backed_up(), [])
+
+    async def test_group_send_reaches_every_shard(self):
+        first, second = self.layers_on_both_shards()
+        channels = [await first.new_channel(), await second.new_channel()]
+        for layer, channel in zip((first, second), channels):
+            await layer.group_add('meeting_123456789', channel)
+
+        await first.group_send('meeting_123456789', {'type': 'participant_left', 'participant_id': 'p'})
+
+        for layer, channel in zip((first, second), channels):
+            message = await asyncio.wait_for(layer.receive(channel), 1)
+            self.assertEqual(message['participant_id'], 'p')
+            await self.settle(layer)
+        self.assertEqual(await self.backed_up(), [])
+
+    async def test_backup_of_an_unprocessed_message_is_delivered_again(self):
+        layer = self.layer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'participant_left', 'participant_id': 'p'})
+
+        # Popped into the backup queue, then the receive is abandoned
+        index = layer.consistent_hash(layer.non_local_name(channel))
+        lane_key = layer.prefix + layer.non_local_name(channel)
+        await layer._pop_lanes(index, [lane_key], 1)
+        self.assertEqual(len(await self.backed_up()), 1)
+
+        message = await asyncio.wait_for(layer.receive(channel), 1)
+        self.assertEqual(message['participant_id'], 'p')
+        await self.settle(layer)
+        self.assertEqual(await self.backed_up(), [])
+
+    async def test_local_delivery_wakes_the_consumer_waiting_on_redis(self):
+        layer = self.layer(LocalFastPathChannelLayer)
+        waiting, other = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add('meeting_123456789', waiting)
+        receive = asyncio.ensure_future(layer.receive(waiting))
+        await asyncio.sleep(0.05)
+
+        await layer.send(waiting, {'type': 'participant_left', 'participant_id': 'p'})
+        message = await asyncio.wait_for(receive, 1)
+        self.assertEqual(message['participant_id'], 'p')
+
+        # The Redis read it left running still serves the next consumer
+        await self.layer().send(other, {'type': 'participant_joined', 'participant_id': 'q'})
+        message = await asyncio.wait_for(layer.receive(other), 1)
+        self.assertEqual(message['participant_id'], 'q')
+        await layer.flush()
+
+
+class EnvelopeEncodingTests(SimpleTestCase):
+
+    def test_formats_encoded_on_first_use_and_shared(self):
+        frame = {'type': 'chat_message', 'message': 'hello', 'meeting_id': 'abc-defg-hij'}
+        event = envelope(frame)
+        self.assertEqual(event['encoded'], {})
+
+        # Local delivery hands each receiver a shallow copy
+        first, second = dict(event), dict(event)
+        self.assertEqual(encoded_frame(first, JSON), encode_json(frame))
+        self.assertIs(encoded_frame(second, JSON), encoded_frame(first, JSON))
+        self.assertNotIn(MSGPACK, event['encoded'])
+
+
+class FrozenClockTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.Mock(monotonic=lambda: self.now, time=lambda: self.now)
+        patcher = mock.patch('meetings.token_cache.time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class LocalLRUCacheTests(FrozenClockTestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LocalLRUCache(2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    def test_stale_entries_are_only_served_on_request(self):
+        cache = LocalLRUCache(10, ttl=60, stale_ttl=300)
+        cache.set('a', 1)
+
+        self.now += 61
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', allow_stale=True), 1)
+
+        self.now += 300
+        self.assertIsNone(cache.get('a', allow_stale=True))
+        self.assertEqual(len(cache), 0)
+
+
+class VerifiedTokenCacheTests(FrozenClockTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.options = dict(TOKEN_CACHE_DEFAULTS, LOCAL_TTL=60, SHARED_TTL=300, STALE_TTL=300, NEGATIVE_TTL=30)
+        self.redis = FakeRedis()
+        self.cache = VerifiedTokenCache(self.options)
+        self.cache._redis = lambda: self.redis
+
+    def shared_key(self, token):
+        return f"{self.options['KEY_PREFIX']}{hash_token(token)}"
+
+    def test_rejected_token_is_remembered_for_negative_ttl(self):
+        self.cache.set_invalid('bad')
+
+        self.assertIs(self.cache.get('bad'), INVALID_TOKEN)
+        self.assertIsNone(self.cache.get_stale('bad'))
+        self.assertLessEqual(self.redis.ttl(self.shared_key('bad')), 30)
+
+        # Another worker picks the verdict up from the shared tier
+        self.cache.local.clear()
+        self.assertIs(self.cache.get('bad'), INVALID_TOKEN)
+
+        self.now += 31
+        self.assertIsNone(self.cache.local.get(hash_token('bad')))
+
+    def test_stale_entry_is_only_served_through_get_stale(self):
+        self.cache.set('tok', {'id': '1'})
+        self.assertEqual(self.cache.get('tok'), {'id': '1'})
+        self.assertEqual(self.redis.ttl(self.shared_key('tok')), 600)
+
+        self.now += 301
+        self.assertIsNone(self.cache.get('tok'))
+        self.assertEqual(self.cache.get_stale('tok'), {'id': '1'})
+
+    def test_stale_entry_is_served_from_the_shared_tier(self):
+        self.cache.set('tok', {'id': '1'})
+        self.cache.local.clear()
+
+        self.now += 301
+        self.assertIsNone(self.cache.get('tok'))
+        self.assertEqual(self.cache.get_stale('tok'), {'id': '1'})
+
+    def test_shared_tier_outage_is_a_miss(self):
+        self.cache._redis = mock.Mock(side_effect=RedisConnectionError('down'))
+
+        self.assertIsNone(self.cache.get('tok'))
+        self.cache.set('tok', {'id': '1'})
+        self.assertEqual(self.cache.get('tok'), {'id': '1'})
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight('test')
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow(self, result):
+        def fn():
+            self.calls += 1
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return fn
+
+    def run_concurrently(self, fn, callers=5):
+        results = []
+
+        def call():
+            try:
+                results.append(self.flight.do('token', fn))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        threads[0].start()
+        while self.calls == 0:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to find the leader's call in flight
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_callers_share_one_execution(self):
+        results = self.run_concurrently(self.slow({'id': '1'}))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'id': '1'}] * 5)
+        self.assertEqual(self.flight._calls, {})
+
+    def test_error_is_raised_to_every_caller(self):
+        error = AuthServiceUnavailable('down')
+        results = self.run_concurrently(self.slow(error))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [error] * 5)
+
+    def test_later_call_runs_again(self):
+        self.release.set()
+        self.flight.do('token', self.slow(1))
+        self.flight.do('token', self.slow(2))
+
+        self.assertEqual(self.calls, 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('meetings.circuit_breaker.time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', {'FAILURE_THRESHOLD': 3, 'RESET_TIMEOUT': 10.0})
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_lets_one_probe_through(self):
+        self.trip()
+        self.now += 10
+
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.assertTrue(self.breaker.is_open())
+
+    def test_successful_probe_closes(self):
+        self.trip()
+        self.now += 10
+        self.breaker.allow_request()
+        self.breaker.record_success()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.now += 10
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 9
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_disabled_breaker_never_rejects(self):
+        breaker = CircuitBreaker('test', {'ENABLED': False, 'FAILURE_THRESHOLD': 1})
+        breaker.record_failure()
+
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+
+
+class FakeTokenCache:
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def get(self, token):
+        return self.entries.get(token)
+
+    def set(self, token, user_data):
+        self.entries[token] = user_data
+
+    def set_invalid(self, token):
+        self.entries[token] = INVALID_TOKEN
+
+
+def batch_response(tokens, invalid):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {
+        'results': {token: {'id': token} for token in tokens if token not in invalid},
+        'invalid': [token for token in tokens if token in invalid],
+    }
+    return response
+
+
+@override_settings(VERIFY_TOKEN_BATCH_SIZE=2)
+class VerifyTokensBatchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.token_cache = FakeTokenCache({'cached': {'id': 'cached'}, 'rejected': INVALID_TOKEN})
+        self.client = mock.Mock()
+        self.client.post.side_effect = lambda path, json, retry: batch_response(json['tokens'], {'revoked'})
+        patchers = [
+            mock.patch('meetings.authentication.get_token_cache', return_value=self.token_cache),
+            mock.patch('meetings.authentication.get_service_client', return_value=self.client),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_misses_are_sent_in_chunks(self):
+        results = verify_tokens_batch(['cached', 'a', 'b', 'a', 'revoked', 'c', 'rejected'])
+
+        sent = [call.kwargs['json']['tokens'] for call in self.client.post.call_args_list]
+        self.assertEqual(sent, [['a', 'b'], ['revoked', 'c']])
+        self.assertEqual(set(results), {'cached', 'a', 'b', 'c'})
+
+    def test_invalid_tokens_are_negatively_cached(self):
+        results = verify_tokens_batch(['a', 'revoked'])
+
+        self.assertNotIn('revoked', results)
+        self.assertIs(self.token_cache.entries['revoked'], INVALID_TOKEN)
+        self.assertEqual(self.token_cache.entries['a'], {'id': 'a'})
+
+    def test_no_request_when_everything_is_cached(self):
+        self.assertEqual(verify_tokens_batch(['cached', 'rejected']), {'cached': {'id': 'cached'}})
+        self.client.post.assert_not_called()
+
+    def test_error_status_raises_unavailable(self):
+        self.client.post.side_effect = None
+        self.client.post.return_value = mock.Mock(status_code=503)
+
+        with self.assertRaises(AuthServiceUnavailable):
+            verify_tokens_batch(['a'])
+        self.assertNotIn('a', self.token_cache.entries)
+
+
+def signed_token(**claims):
+    token = AccessToken()
+    for claim, value in claims.items():
+        token[claim] = value
+    return str(token)
+
+
+class SignedTokenBackendTests(SimpleTestCase):
+
+    def test_active_user_is_authenticated(self):
+        user = GoogleOAuthBackend().authenticate(None, token=signed_token(user_id='42', email='a@example.com'))
+
+        self.assertEqual(user.id, '42')
+        self.assertEqual(user.email, 'a@example.com')
+
+    def test_inactive_user_is_refused(self):
+        self.assertIsNone(GoogleOAuthBackend().authenticate(None, token=signed_token(user_id='42', is_active=False)))
+
+    def test_token_without_user_id_is_refused(self):
+        self.assertIsNone(GoogleOAuthBackend().authenticate(None, token=signed_token(email='a@example.com')))
+
+
+class FakeSocket:
+
+    def __init__(self, token, authenticated=True):
+        self.scope = {'query_string': f'token={token}'.encode(), 'subprotocols': []}
+        self.user = mock.Mock(id='user', is_authenticated=authenticated)
+        self.close = mock.AsyncMock()
+
+
+class RecheckSessionsTests(SimpleTestCase):
+
+    async def test_sockets_with_invalid_tokens_are_closed(self):
+        valid, revoked, signed = FakeSocket('valid'), FakeSocket('revoked'), FakeSocket('a.b.c')
+        sockets = [valid, revoked, FakeSocket('revoked'), signed, FakeSocket('anonymous', authenticated=False)]
+        with mock.patch('meetings.sessions.open_sockets', return_value=sockets), \
+                mock.patch('meetings.sessions.verify_tokens_batch', return_value={'valid': {}}) as verify:
+            closed = await recheck_sessions()
+
+        self.assertEqual(closed, 2)
+        self.assertCountEqual(verify.call_args.args[0], ['valid', 'revoked'])
+        valid.close.assert_not_called()
+        signed.close.assert_not_called()
+        revoked.close.assert_awaited_once_with(code=SESSION_INVALID_CLOSE_CODE)
+
+    async def test_auth_service_outage_closes_nothing(self):
+        socket = FakeSocket('revoked')
+        with mock.patch('meetings.sessions.open_sockets', return_value=[socket]), \
+                mock.patch('meetings.sessions.verify_tokens_batch', side_effect=AuthServiceUnavailable('Authentication service unavailable')):
+            self.assertEqual(await recheck_sessions(), 0)
+        socket.close.assert_not_called()
+
+
+def candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.{i} 5000{i} typ host', 'sdpMLineIndex': 0}
+
+
+class IceCandidateCoalescerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.flushed = []
+        self.coalescer = IceCandidateCoalescer(self.flush, window=0.02, max_batch=3)
+
+    async def flush(self, from_participant, to_participant, candidates):
+        self.flushed.append((from_participant, to_participant, list(candidates)))
+
+    async def test_candidates_within_window_are_sent_together(self):
+        await self.coalescer.add('a', 'b', candidate(1))
+        await self.coalescer.add('a', 'b', candidate(2))
+        await self.coalescer.add('a', 'c', candidate(3))
+        self.assertEqual(self.flushed, [])
+
+        await asyncio.sleep(0.05)
+
+        self.assertCountEqual(self.flushed, [('a', 'b', [candidate(1), candidate(2)]), ('a', 'c', [candidate(3)])])
+
+    async def test_full_batch_is_sent_at_once(self):
+        for i in range(4):
+            await self.coalescer.add('a', 'b', candidate(i))
+
+        self.assertEqual(self.flushed, [('a', 'b', [candidate(0), candidate(1), candidate(2)])])
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.flushed[1:], [('a', 'b', [candidate(3)])])
+
+    async def test_duplicates_are_dropped(self):
+        await self.coalescer.add('a', 'b', candidate(1))
+        await self.coalescer.add('a', 'b', dict(reversed(list(candidate(1).items()))))
+        await self.coalescer.flush_all()
+        await self.coalescer.add('a', 'b', candidate(1))
+        await self.coalescer.flush_all()
+
+        self.assertEqual(self.flushed, [('a', 'b', [candidate(1)])])
+
+        self.coalescer.forget('b')
+        await self.coalescer.add('a', 'b', candidate(1))
+        await self.coalescer.flush_all()
+        self.assertEqual(len(self.flushed), 2)
+
+    async def test_flush_to_only_sends_pairs_for_that_participant(self):
+        await self.coalescer.add('a', 'b', candidate(1))
+        await self.coalescer.add('a', 'c', candidate(2))
+
+        await self.coalescer.flush_to('b')
+        self.assertEqual(self.flushed, [('a', 'b', [candidate(1)])])
+
+        # The cancelled timer does not send the pair again
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.flushed[1:], [('a', 'c', [candidate(2)])])
+
+    async def test_no_window_sends_each_candidate(self):
+        coalescer = IceCandidateCoalescer(self.flush, window=0, max_batch=3)
+        await coalescer.add('a', 'b', candidate(1))
+
+        self.assertEqual(self.flushed, [('a', 'b', [candidate(1)])])
+
+
+class GuestTokenTests(SimpleTestCase):
+
+    def setUp(self):
+        self.participant = mock.Mock(id=uuid.uuid4(), meeting=mock.Mock(meeting_id='123456789'))
+        self.token = issue_guest_token(self.participant)
+
+    def authenticate(self, header):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=header)
+        return GuestTokenAuthentication().authenticate(request)
+
+    def test_token_names_participant_and_meeting(self):
+        identity = verify_guest_token(self.token)
+
+        self.assertEqual(identity.participant_id, str(self.participant.id))
+        self.assertEqual(identity.meeting_id, '123456789')
+        self.assertFalse(identity.is_authenticated)
+
+    def test_token_is_a_valid_subprotocol_value(self):
+        self.assertNotIn(':', self.token)
+
+    def test_tampered_token_is_refused(self):
+        other = issue_guest_token(mock.Mock(id=uuid.uuid4(), meeting=self.participant.meeting))
+        signature = self.token.rpartition('.')[2]
+        forged = f"{other.rpartition('.')[0]}.{signature}"
+
+        with self.assertRaises(signing.BadSignature):
+            verify_guest_token(forged)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(f'Guest {forged}')
+
+    def test_resume_token_is_not_a_guest_token(self):
+        resume_token = issue_resume_token('123456789', self.participant.id, 'specific.abc!def')
+
+        with self.assertRaises(signing.BadSignature):
+            verify_guest_token(resume_token)
+
+    def test_expired_token_is_refused(self):
+        later = time.time() + get_guest_token_max_age() + 1
+        with mock.patch('django.core.signing.time', mock.Mock(time=lambda: later)):
+            with self.assertRaises(signing.SignatureExpired):
+                verify_guest_token(self.token)
+            with self.assertRaisesMessage(AuthenticationFailed, 'Guest token expired'):
+                self.authenticate(f'Guest {self.token}')
+
+    def test_other_schemes_are_left_alone(self):
+        self.assertIsNone(self.authenticate(f'Bearer {self.token}'))
+        self.assertEqual(self.authenticate(f'Guest {self.token}')[0].participant_id, str(self.participant.id))
+
+
+class GuestJoinTests(TestCase):
+
+    def setUp(self):
+        self.meeting = Meeting.objects.create(
+            title='Standup', host_id=uuid.uuid4(), host_email='host@example.com', host_name='Host',
+            meeting_id='123456789', status='ongoing'
+        )
+        self.url = f'/api/meetings/{self.meeting.meeting_id}/join/'
+
+    def join(self, token=None, **data):
+        client = APIClient()
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f'Guest {token}')
+        response = client.post(self.url, {'name': 'Guest', **data}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_guests_without_email_get_their_own_participant(self):
+        first, second = self.join(), self.join()
+
+        self.assertNotEqual(first['participant']['id'], second['participant']['id'])
+        self.assertNotEqual(first['guest_token'], second['guest_token'])
+        self.assertEqual(verify_guest_token(first['guest_token']).participant_id, first['participant']['id'])
+        self.assertEqual(verify_guest_token(second['guest_token']).participant_id, second['participant']['id'])
+
+    def test_knowing_a_guests_email_does_not_bind_to_their_participant(self):
+        first = self.join(email='guest@example.com')
+        second = self.join(email='guest@example.com')
+
+        self.assertNotEqual(first['participant']['id'], second['participant']['id'])
+
+    def test_guest_token_rejoins_its_participant(self):
+        first = self.join()
+        again = self.join(token=first['guest_token'], name='Renamed')
+
+        self.assertEqual(again['participant']['id'], first['participant']['id'])
+        self.assertEqual(MeetingParticipant.objects.filter(meeting=self.meeting).count(), 1)
+
+    def test_leave_broadcasts_the_new_roster_version(self):
+        participant_id = self.join()['participant']['id']
+
+        with mock.patch('meetings.views.remove_from_roster_sync', return_value=7), \
+                mock.patch('meetings.views.channel_layer.group_send', new_callable=mock.AsyncMock) as group_send:
+            response = APIClient().post(f'/api/meetings/{self.meeting.meeting_id}/participants/{participant_id}/leave/')
+
+        self.assertEqual(response.status_code, 200)
+        event = group_send.call_args.args[1]
+        self.assertEqual(event['frame']['type'], 'participant_left')
+        self.assertEqual(event['frame']['roster_version'], 7)
+
+
+class LiveStateOutageTests(TestCase):
+
+    def setUp(self):
+        self.meeting = Meeting.objects.create(
+            title='Standup', host_id=uuid.uuid4(), host_email='host@example.com', host_name='Host',
+            meeting_id='123456789', status='ongoing'
+        )
+        self.participant = MeetingParticipant.objects.create(meeting=self.meeting, name='Guest', is_guest=True)
+        patcher = mock.patch('meetings.live_state.get_redis_connection', side_effect=RedisConnectionError('down'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_media_state_is_saved_directly_while_redis_is_down(self):
+        save_participant_state(self.meeting.meeting_id, self.participant, audio_enabled=False)
+
+        self.participant.refresh_from_db()
+        self.assertFalse(self.participant.audio_enabled)
+
+    def test_meeting_end_does_not_raise_while_redis_is_down(self):
+        end_meeting_state(self.meeting.meeting_id)
+
+    def test_malformed_participant_ids_are_skipped(self):
+        state = _parse_state({b'None:audio_enabled': b'1', f'{self.participant.id}:audio_enabled'.encode(): b'0'})
+
+        self.assertEqual(state, {str(self.participant.id): {'audio_enabled': False}})
+
+
+def stats_frame(participant_id, rtt_ms):
+    return {'type': 'connection_stats', 'participant_id': participant_id, 'stats': {'rtt_ms': rtt_ms}}
+
+
+class OutboundQueueTests(SimpleTestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.queue = OutboundQueue(self.send, max_depth=3, over_budget_grace=60.0)
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.sent.append(text_data)
+
+    def put(self, frame):
+        policy, key = frame_policy(frame)
+        return self.queue.put({'text_data': frame['type']}, policy, key, frame_class(frame))
+
+    async def drain(self):
+        self.queue.start()
+        self.assertTrue(await self.queue.wait_drained(asyncio.get_running_loop().time() + 1))
+        await self.queue.stop()
+
+    async def test_backlog_evicts_stats_before_control(self):
+        self.put(stats_frame('a', 10))
+        self.put({'type': 'participant_joined'})
+        self.put({'type': 'roster_delta'})
+        self.put({'type': 'meeting_status_change'})
+
+        self.assertEqual(len(self.queue), 3)
+        await self.drain()
+        self.assertEqual(self.sent, ['participant_joined', 'roster_delta', 'meeting_status_change'])
+
+    async def test_stats_are_dropped_rather_than_queued_over_budget(self):
+        for frame_type in ('participant_joined', 'roster_delta', 'meeting_status_change'):
+            self.put({'type': frame_type})
+        self.assertTrue(self.put(stats_frame('a', 10)))
+
+        self.assertEqual(len(self.queue), 3)
+        await self.drain()
+        self.assertNotIn('connection_stats', self.sent)
+
+    async def test_newer_stats_supersede_pending_ones(self):
+        self.put(stats_frame('a', 10))
+        self.put(stats_frame('b', 20))
+        self.queue.put({'text_data': 'latest a'}, *frame_policy(stats_frame('a', 30)), CHAT)
+
+        await self.drain()
+        self.assertEqual(self.sent, ['latest a', 'connection_stats'])
+
+    async def test_higher_priority_lanes_go_first(self):
+        self.put({'type': 'chat_message'})
+        self.put({'type': 'ice_candidates'})
+        self.put({'type': 'chat_message'})
+        self.put({'type': 'meeting_status_change'})
+        self.queue.max_depth = 10
+
+        await self.drain()
+        self.assertEqual(self.sent, ['meeting_status_change', 'ice_candidates', 'chat_message', 'chat_message'])
+
+    async def test_media_control_keeps_latest_value(self):
+        frame = {'type': 'media_control', 'participant_id': 'a', 'control_type': 'audio'}
+        self.queue.put({'text_data': 'muted'}, *frame_policy(frame))
+        self.queue.put({'text_data': 'unmuted'}, *frame_policy(frame))
+        self.queue.put({'text_data': 'video off'}, *frame_policy(dict(frame, control_type='video')))
+
+        await self.drain()
+        self.assertEqual(self.sent, ['unmuted', 'video off'])
+
+    async def test_socket_over_budget_past_grace_is_closed(self):
+        now = 1000.0
+        with mock.patch('meetings.outbound.time', mock.Mock(monotonic=lambda: now)):
+            for _ in range(4):
+                self.assertTrue(self.put({'type': 'participant_joined'}))
+
+            now += 59
+            self.assertTrue(self.put({'type': 'participant_joined'}))
+            now += 2
+            self.assertFalse(self.put({'type': 'participant_joined'}))
+
+    async def test_draining_under_budget_resets_grace(self):
+        now = 1000.0
+        with mock.patch('meetings.outbound.time', mock.Mock(monotonic=lambda: now)):
+            for _ in range(4):
+                self.put({'type': 'participant_joined'})
+            self.queue.start()
+            self.assertTrue(await self.queue.wait_drained(asyncio.get_running_loop().time() + 1))
+
+            now += 61
+            for _ in range(4):
+                self.assertTrue(self.put({'type': 'participant_joined'}))
+            await self.queue.stop()
+
+
+class ConnectionRateLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('meetings.ratelimit.time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = ConnectionRateLimiter({'*': (10, 10), 'chat_message': (1, 2)}, violations=(1, 3))
+
+    def test_throttle_is_reported_once_per_streak(self):
+        results = [self.limiter.check('chat_message') for _ in range(5)]
+
+        self.assertEqual(results, [ALLOW, ALLOW, THROTTLE, DROP, DROP])
+        self.assertEqual(self.limiter.retry_after('chat_message'), 1.0)
+
+        self.now += 1
+        self.assertEqual(self.limiter.check('chat_message'), ALLOW)
+        self.assertEqual(self.limiter.check('chat_message'), THROTTLE)
+
+    def test_throttled_type_does_not_hold_up_others(self):
+        for _ in range(3):
+            self.limiter.check('chat_message')
+
+        self.assertEqual(self.limiter.check('ice_candidate'), ALLOW)
+
+    def test_connection_wide_bucket_limits_unconfigured_types(self):
+        results = [self.limiter.check('ice_candidate') for _ in range(11)]
+
+        self.assertEqual(results, [ALLOW] * 10 + [THROTTLE])
+        self.assertEqual(self.limiter.check('chat_message'), THROTTLE)
+
+    def test_sustained_flood_disconnects(self):
+        results = [self.limiter.check('chat_message') for _ in range(6)]
+
+        self.assertEqual(results, [ALLOW, ALLOW, THROTTLE, DROP, DROP, DISCONNECT])
+
+
+class NodePlacementTests(SimpleTestCase):
+
+    def setUp(self):
+        self.redis = FakeAsyncRedis()
+        patcher = mock.patch('meetings.placement.get_async_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def heartbeat(self, pid):
+        with mock.patch('meetings.placement.os.getpid', return_value=pid):
+            await heartbeat_node()
+
+    async def leave(self, pid):
+        with mock.patch('meetings.placement.os.getpid', return_value=pid):
+            return await leave_placement()
+
+    async def test_node_stays_placed_until_its_last_worker_leaves(self):
+        await self.heartbeat(101)
+        await self.heartbeat(102)
+
+        self.assertFalse(await self.leave(101))
+        self.assertIsNotNone(await self.redis.zscore(NODES_KEY, get_node_id()))
+
+        self.assertTrue(await self.leave(102))
+        self.assertIsNone(await self.redis.zscore(NODES_KEY, get_node_id()))
+
+    async def test_workers_that_stopped_heartbeating_do_not_hold_the_node(self):
+        await self.heartbeat(101)
+        await self.redis.zadd(node_workers_key(get_node_id()), {102: 0})
+
+        self.assertTrue(await self.leave(101))
+
+    def test_rendezvous_placement_only_moves_meetings_of_a_new_node(self):
+        meetings = [f'{i:09d}' for i in range(2000)]
+        before = {meeting: node_for_meeting(meeting, ['a', 'b', 'c']) for meeting in meetings}
+        after = {meeting: node_for_meeting(meeting, ['a', 'b', 'c', 'd']) for meeting in meetings}
+
+        moved = [meeting for meeting in meetings if before[meeting] != after[meeting]]
+        self.assertTrue(all(after[meeting] == 'd' for meeting in moved))
+        self.assertAlmostEqual(len(moved) / len(meetings), 0.25, delta=0.05)
+
+
+@override_settings(REALTIME_SETTINGS={'RESUME_GRACE': 30})
+class ResumeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.redis = FakeAsyncRedis()
+        patcher = mock.patch('meetings.presence.get_async_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.participant_id = str(uuid.uuid4())
+
+    async def hold(self, channel_name='specific.abc!old'):
+        # What a joined socket leaves behind when it drops
+        await self.redis.hset(registry_key('123456789'), self.participant_id, channel_name)
+        await self.redis.hset(roster_key('123456789'), self.participant_id, '{}')
+        await touch_presence('123456789', self.participant_id, channel_name, ttl=30)
+
+    async def claim(self, channel_name):
+        return await claim_resume('123456789', self.participant_id, 'specific.abc!old', channel_name)
+
+    def test_resume_token_names_the_socket(self):
+        token = issue_resume_token('123456789', self.participant_id, 'specific.abc!old', user_id=42)
+
+        self.assertEqual(verify_resume_token(token), {
+            'meeting_id': '123456789',
+            'participant_id': self.participant_id,
+            'channel_name': 'specific.abc!old',
+            'user_id': '42',
+        })
+
+    def test_expired_resume_token_is_refused(self):
+        token = issue_resume_token('123456789', self.participant_id, 'specific.abc!old')
+        later = time.time() + 60 * 60 * 12 + 1
+
+        with mock.patch('django.core.signing.time', mock.Mock(time=lambda: later)):
+            with self.assertRaises(signing.SignatureExpired):
+                verify_resume_token(token)
+
+    async def test_held_participant_is_claimed_once(self):
+        await self.hold()
+
+        self.assertTrue(await self.claim('specific.abc!new'))
+        self.assertEqual(await self.redis.hget(registry_key('123456789'), self.participant_id), b'specific.abc!new')
+        self.assertFalse(await self.claim('specific.abc!other'))
+
+    async def test_claim_after_grace_fails(self):
+        await self.hold()
+        later = time.time() + 31
+
+        with mock.patch('meetings.presence.time', mock.Mock(time=lambda: later)):
+            self.assertFalse(await self.claim('specific.abc!new'))
+
+    async def test_claim_fails_once_participant_left(self):
+        await self.hold()
+        await self.redis.hdel(roster_key('123456789'), self.participant_id)
+
+        self.assertFalse(await self.claim('specific.abc!new'))
+
+    async def test_claim_fails_once_participant_joined_elsewhere(self):
+        await self.hold()
+        await self.redis.hset(registry_key('123456789'), self.participant_id, 'specific.abc!elsewhere')
+
+        self.assertFalse(await self.claim('specific.abc!new'))
+
+
+class DisconnectTests(SimpleTestCase):
+
+    def setUp(self):
+        self.consumer = MeetingConsumer()
+        self.consumer.meeting_id = '123456789'
+        self.consumer.room_group_name = 'meeting_123456789'
+        self.consumer.channel_name = 'specific.abc!def'
+        self.consumer.participant_id = str(uuid.uuid4())
+        self.consumer.leaving = False
+        self.consumer.outbound = mock.AsyncMock()
+        self.consumer.ice_coalescer = mock.AsyncMock()
+        self.consumer.channel_layer = mock.AsyncMock()
+        self.touch_presence = self.patch('touch_presence')
+        self.clear_presence = self.patch('clear_presence')
+        self.patch('unregister_channel', return_value=True)
+        self.patch('remove_from_roster', return_value=7)
+        self.patch('aset_participant_state')
+
+    def patch(self, name, **kwargs):
+        patcher = mock.patch(f'meetings.consumers.{name}', new_callable=mock.AsyncMock, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def left_events(self):
+        return [
+            call.args[1] for call in self.consumer.channel_layer.group_send.call_args_list
+            if call.args[1]['type'] == 'participant_left'
+        ]
+
+    async def test_dropped_socket_is_held_for_resume(self):
+        await self.consumer.disconnect(1006)
+
+        self.touch_presence.assert_awaited_once()
+        self.assertEqual(self.left_events(), [])
+
+    async def test_clean_close_leaves_at_once(self):
+        await self.consumer.disconnect(1000)
+
+        self.touch_presence.assert_not_awaited()
+        self.clear_presence.assert_awaited_once()
+        [event] = self.left_events()
+        self.assertEqual(event['frame']['roster_version'], 7)
+
+    async def test_leave_frame_leaves_at_once_whatever_the_close_code(self):
+        self.consumer.leaving = True
+
+        await self.consumer.disconnect(1001)
+
+        self.touch_presence.assert_not_awaited()
+        self.assertEqual(len(self.left_events()), 1)
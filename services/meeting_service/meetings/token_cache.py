@@ -0,0 +1,402 @@
+"""
+Two-tier cache of tokens verified by the auth service.
+
+Tier 1 is a bounded in-process LRU, tier 2 is the shared Redis instance
+configured in CACHES. Both tiers are keyed by a SHA-256 digest of the token,
+so raw credentials are never stored.
+
+Rejected tokens are remembered for NEGATIVE_TTL seconds so repeated attempts
+with a bad token do not reach the auth service. Verified entries outlive
+their freshness by STALE_TTL seconds; those stale entries are only served
+through get_stale(), when the auth service cannot be reached.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError, RedisError
+
+from .metrics import metrics
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'LOCAL_MAX_ENTRIES': 10000,
+    'LOCAL_TTL': 60,
+    'SHARED_TTL': 300,
+    'STALE_TTL': 300,
+    'NEGATIVE_TTL': 30,
+    'KEY_PREFIX': 'meetings:verified-token:',
+    'LISTEN_FOR_REVOCATIONS': True,
+    'REVOCATION_CHANNEL': 'prismeet:auth:events',
+    'FILL_LOCK_TTL': 5,
+    'FILL_LOCK_WAIT': 1.0,
+    'FILL_LOCK_POLL_INTERVAL': 0.025,
+}
+
+
+# Cached verdict for a token the auth service rejected
+INVALID_TOKEN = object()
+
+
+def get_token_cache_settings():
+    """Return TOKEN_CACHE_SETTINGS merged over the defaults"""
+    options = dict(TOKEN_CACHE_DEFAULTS)
+    options.update(getattr(settings, 'TOKEN_CACHE_SETTINGS', {}))
+    return options
+
+
+def hash_token(token):
+    """Digest used as the cache key for a token"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class LocalLRUCache:
+    """
+    Thread-safe LRU with a per-entry expiry.
+
+    An entry is fresh for ttl seconds and then kept as stale for another
+    stale_ttl seconds; stale entries are only returned with allow_stale=True.
+    """
+
+    def __init__(self, max_entries, ttl, stale_ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fresh_until, expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            if fresh_until <= now and not allow_stale:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, stale_ttl=None):
+        fresh_until = time.monotonic() + (self.ttl if ttl is None else ttl)
+        expires_at = fresh_until + (self.stale_ttl if stale_ttl is None else stale_ttl)
+        with self._lock:
+            self._entries[key] = (fresh_until, expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Delete every entry whose value matches; returns how many were removed"""
+        with self._lock:
+            keys = [key for key, (_, _, value) in self._entries.items() if predicate(value)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class VerifiedTokenCache:
+    """
+    Token -> user data cache in front of the auth service's verify-token endpoint
+    """
+
+    def __init__(self, options=None):
+        self.options = options or get_token_cache_settings()
+        self.enabled = self.options['ENABLED']
+        self.local = LocalLRUCache(
+            self.options['LOCAL_MAX_ENTRIES'], self.options['LOCAL_TTL'], self.options['STALE_TTL']
+        )
+
+    def _shared_key(self, token_hash):
+        return f"{self.options['KEY_PREFIX']}{token_hash}"
+
+    def _user_index_key(self, user_id):
+        return f"{self.options['KEY_PREFIX']}user:{user_id}"
+
+    def _redis(self):
+        return get_redis_connection('default')
+
+    def _decode_shared(self, token_hash, raw, allow_stale=False):
+        """
+        Turn a shared-tier value into user data or INVALID_TOKEN, copying it
+        into the in-process tier. Returns None for entries that are not usable.
+        """
+        entry = json.loads(raw)
+        if entry.get('invalid'):
+            self.local.set(token_hash, INVALID_TOKEN, ttl=self.options['NEGATIVE_TTL'], stale_ttl=0)
+            return INVALID_TOKEN
+
+        user_data = entry.get('user')
+        if user_data is None:
+            return None
+        fresh_for = entry['fresh_until'] - time.time()
+        if fresh_for <= 0 and not allow_stale:
+            return None
+        self.local.set(
+            token_hash,
+            user_data,
+            ttl=max(0, min(self.options['LOCAL_TTL'], fresh_for)),
+            stale_ttl=self.options['STALE_TTL'],
+        )
+        return user_data
+
+    def _count_lookup(self, tier, value):
+        if value is None:
+            metrics.incr('token_cache.misses')
+        elif value is INVALID_TOKEN:
+            metrics.incr('token_cache.negative_hits')
+        else:
+            metrics.incr(f'token_cache.{tier}_hits')
+        return value
+
+    def get(self, token):
+        """
+        Return fresh cached user data for the token, INVALID_TOKEN if the auth
+        service recently rejected it, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        token_hash = hash_token(token)
+        value = self.local.get(token_hash)
+        if value is not None:
+            return self._count_lookup('local', value)
+
+        try:
+            raw = self._redis().get(self._shared_key(token_hash))
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+            metrics.incr('token_cache.shared_errors')
+            raw = None
+
+        value = self._decode_shared(token_hash, raw) if raw is not None else None
+        return self._count_lookup('shared', value)
+
+    async def aget(self, token):
+        """
+        Event-loop friendly get(): the in-process tier is checked inline and
+        the shared tier through the async Redis client
+        """
+        if not self.enabled:
+            return None
+
+        token_hash = hash_token(token)
+        value = self.local.get(token_hash)
+        if value is not None:
+            return self._count_lookup('local', value)
+
+        try:
+            raw = await get_async_redis().get(self._shared_key(token_hash))
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+            metrics.incr('token_cache.shared_errors')
+            raw = None
+
+        value = self._decode_shared(token_hash, raw) if raw is not None else None
+        return self._count_lookup('shared', value)
+
+    def get_stale(self, token):
+        """
+        Return user data for the token even if it is past its freshness,
+        as long as it is within the STALE_TTL grace period. Meant for when
+        the auth service cannot be asked.
+        """
+        if not self.enabled:
+            return None
+
+        token_hash = hash_token(token)
+        value = self.local.get(token_hash, allow_stale=True)
+        if value is None:
+            try:
+                raw = self._redis().get(self._shared_key(token_hash))
+            except RedisError:
+                raw = None
+            if raw is not None:
+                value = self._decode_shared(token_hash, raw, allow_stale=True)
+        if value is None or value is INVALID_TOKEN:
+            return None
+        metrics.incr('token_cache.stale_hits')
+        return value
+
+    def set(self, token, user_data):
+        """Store verified user data in both tiers"""
+        if not self.enabled:
+            return
+
+        token_hash = hash_token(token)
+        self.local.set(token_hash, user_data)
+        entry = {'user': user_data, 'fresh_until': time.time() + self.options['SHARED_TTL']}
+        expires_in = self.options['SHARED_TTL'] + self.options['STALE_TTL']
+        try:
+            # Index the entry by user so a user change can evict all of their tokens
+            user_index_key = self._user_index_key(user_data.get('id'))
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.set(self._shared_key(token_hash), json.dumps(entry), ex=expires_in)
+            pipe.sadd(user_index_key, token_hash)
+            pipe.expire(user_index_key, expires_in)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+            metrics.incr('token_cache.shared_errors')
+
+    def set_invalid(self, token):
+        """Remember for NEGATIVE_TTL seconds that the auth service rejected the token"""
+        if not self.enabled:
+            return
+
+        token_hash = hash_token(token)
+        self.local.set(token_hash, INVALID_TOKEN, ttl=self.options['NEGATIVE_TTL'], stale_ttl=0)
+        try:
+            self._redis().set(
+                self._shared_key(token_hash),
+                json.dumps({'invalid': True}),
+                ex=self.options['NEGATIVE_TTL']
+            )
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+            metrics.incr('token_cache.shared_errors')
+
+    def get_shared(self, token):
+        """Look the token up in the shared tier only, without touching counters"""
+        token_hash = hash_token(token)
+        try:
+            raw = self._redis().get(self._shared_key(token_hash))
+        except RedisError:
+            return None
+        return self._decode_shared(token_hash, raw) if raw is not None else None
+
+    def acquire_fill_lock(self, token):
+        """
+        Take the short cross-process lock for verifying this token upstream.
+
+        Returns the held lock, or None when another process already holds it.
+        If Redis is unavailable a dummy lock is returned so the caller
+        verifies on its own.
+        """
+        if not self.enabled:
+            return _NoLock()
+        lock = self._redis().lock(
+            f"{self.options['KEY_PREFIX']}lock:{hash_token(token)}",
+            timeout=self.options['FILL_LOCK_TTL'],
+            blocking=False,
+        )
+        try:
+            return lock if lock.acquire() else None
+        except RedisError as e:
+            logger.warning(f"Token cache fill lock unavailable: {e}")
+            return _NoLock()
+
+    def release_fill_lock(self, lock):
+        try:
+            lock.release()
+        except (LockError, RedisError):
+            # Expired or Redis went away; the TTL cleans it up
+            pass
+
+    def wait_for_fill(self, token):
+        """
+        Poll the shared tier while another process verifies the token.
+
+        Returns the user data (or INVALID_TOKEN) it stored, or None if nothing
+        appeared within FILL_LOCK_WAIT seconds.
+        """
+        deadline = time.monotonic() + self.options['FILL_LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(self.options['FILL_LOCK_POLL_INTERVAL'])
+            value = self.get_shared(token)
+            if value is not None:
+                metrics.incr('token_cache.fill_waits')
+                return value
+        return None
+
+    def delete(self, token):
+        """Forget a token in both tiers"""
+        self.evict_hash(hash_token(token))
+
+    def evict_hash(self, token_hash):
+        """Forget a token, identified by its digest, in both tiers"""
+        self.local.delete(token_hash)
+        try:
+            self._redis().delete(self._shared_key(token_hash))
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+        metrics.incr('token_cache.evictions')
+
+    def evict_user(self, user_id):
+        """Forget every cached token of a user in both tiers"""
+        user_id = str(user_id)
+        evicted = self.local.delete_where(
+            lambda value: value is not INVALID_TOKEN and str(value.get('id')) == user_id
+        )
+        try:
+            redis = self._redis()
+            user_index_key = self._user_index_key(user_id)
+            token_hashes = [token_hash.decode() for token_hash in redis.smembers(user_index_key)]
+            redis.delete(user_index_key, *[self._shared_key(token_hash) for token_hash in token_hashes])
+            evicted += len(token_hashes)
+        except RedisError as e:
+            logger.warning(f"Token cache shared tier unavailable: {e}")
+        metrics.incr('token_cache.evictions', evicted)
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        local_hits = metrics.counter('token_cache.local_hits')
+        shared_hits = metrics.counter('token_cache.shared_hits')
+        negative_hits = metrics.counter('token_cache.negative_hits')
+        misses = metrics.counter('token_cache.misses')
+        lookups = local_hits + shared_hits + negative_hits + misses
+        return {
+            'enabled': self.enabled,
+            'local_entries': len(self.local),
+            'local_hits': local_hits,
+            'shared_hits': shared_hits,
+            'negative_hits': negative_hits,
+            'stale_hits': metrics.counter('token_cache.stale_hits'),
+            'misses': misses,
+            'hit_ratio': (local_hits + shared_hits + negative_hits) / lookups if lookups else 0.0,
+        }
+
+
+class _NoLock:
+    def release(self):
+        pass
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Process-wide VerifiedTokenCache instance"""
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = VerifiedTokenCache()
+                metrics.register_collector('token_cache', _token_cache.stats)
+    if _token_cache.options['LISTEN_FOR_REVOCATIONS']:
+        from .revocation import ensure_auth_event_listener
+        ensure_auth_event_listener(_token_cache)
+    return _token_cache
@@ -0,0 +1,97 @@
+"""
+Guest identity and session resume tokens.
+
+Guests have no auth-service account, so at join time the meeting service
+signs a compact token with its own SECRET_KEY that names the guest's
+MeetingParticipant and meeting. Verifying it is a local HMAC and timestamp
+check, with no database or auth-service round trip.
+
+A socket that joins a room gets a resume token the same way, naming the
+participant, the socket's channel and the identity it authenticated as.
+Presenting it on a new socket within RESUME_GRACE seconds of the old one
+dropping re-binds the participant without re-joining (see
+meetings/presence.py).
+"""
+from django.conf import settings
+from django.core import signing
+
+from .realtime import get_realtime_settings
+
+GUEST_TOKEN_SALT = 'meetings.guest-token'
+RESUME_TOKEN_SALT = 'meetings.resume-token'
+
+
+def _guest_signer():
+    # '.' rather than the default ':' so the token is a valid
+    # Sec-WebSocket-Protocol value for the guest.<token> subprotocol
+    return signing.TimestampSigner(salt=GUEST_TOKEN_SALT, sep='.')
+
+
+def get_guest_token_max_age():
+    """Seconds a guest token stays valid after it was issued"""
+    return settings.MEETING_SETTINGS['GUEST_TOKEN_MAX_AGE']
+
+
+class GuestIdentity:
+    """
+    Guest participant identified by a verified guest token
+    """
+    is_authenticated = False
+    is_anonymous = True
+    is_guest = True
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    id = None
+    email = None
+
+    def __init__(self, participant_id, meeting_id):
+        self.participant_id = participant_id
+        self.meeting_id = meeting_id
+
+    def __str__(self):
+        return f'guest:{self.participant_id}'
+
+
+def issue_guest_token(participant):
+    """Sign a guest token for a MeetingParticipant"""
+    return _guest_signer().sign_object({'p': str(participant.id), 'm': participant.meeting.meeting_id})
+
+
+def verify_guest_token(token):
+    """
+    Return the GuestIdentity carried by a guest token.
+
+    Raises signing.BadSignature (or its subclass SignatureExpired) for
+    tampered or expired tokens.
+    """
+    payload = _guest_signer().unsign_object(token, max_age=get_guest_token_max_age())
+    return GuestIdentity(payload['p'], payload['m'])
+
+
+def _resume_signer():
+    return signing.TimestampSigner(salt=RESUME_TOKEN_SALT)
+
+
+def issue_resume_token(meeting_id, participant_id, channel_name, user_id=None):
+    """Sign a resume token for the socket bound to a participant"""
+    return _resume_signer().sign_object(
+        {'m': meeting_id, 'p': str(participant_id), 'c': channel_name, 'u': str(user_id) if user_id else None},
+        compress=True,
+    )
+
+
+def verify_resume_token(token):
+    """
+    Return the meeting_id, participant_id, channel_name and user_id a resume token was issued for.
+
+    Raises signing.BadSignature (or its subclass SignatureExpired) for
+    tampered or expired tokens.
+    """
+    payload = _resume_signer().unsign_object(token, max_age=get_realtime_settings()['RESUME_TOKEN_MAX_AGE'])
+    return {
+        'meeting_id': payload['m'],
+        'participant_id': payload['p'],
+        'channel_name': payload['c'],
+        'user_id': payload['u'],
+    }
@@ -30,4 +30,7 @@ urlpatterns = [
 
     # Meeting statistics
     path('api/meetings/<str:meeting_id>/stats/', views.MeetingStatsView.as_view(), name='meeting-stats'),
+
+    # Process-local service metrics
+    path('api/internal/metrics/', views.ServiceMetricsView.as_view(), name='service-metrics'),
 ]
\ No newline at end of file
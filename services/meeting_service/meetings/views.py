@@ -23,6 +23,12 @@ from .serializers import (
 )
 from .utils import get_ice_servers, generate_peer_id
 from .authentication import OptionalAuthentication
+from .envelopes import envelope
+from .live_state import end_meeting_state, get_meeting_state, overlay_live_state, save_participant_state
+from .placement import placement_for
+from .roster import remove_from_roster_sync
+from .tokens import GuestIdentity, get_guest_token_max_age, issue_guest_token
+from .metrics import metrics
 
 logger = logging.getLogger(__name__)
 channel_layer = get_channel_layer()
@@ -102,6 +108,9 @@ class MeetingViewSet(viewsets.ModelViewSet):
             # Update analytics
             self.update_meeting_analytics(meeting)
 
+        # Persist the participants' live media state and drop it from Redis
+        end_meeting_state(meeting.meeting_id)
+
         # Notify all participants
         self.notify_meeting_status_change(meeting, 'ended')
 
@@ -112,7 +121,8 @@ class MeetingViewSet(viewsets.ModelViewSet):
     def participants(self, request, pk=None):
         """Get meeting participants"""
         meeting = self.get_object()
-        participants = meeting.participants.all()
+        # Media and connection state in the database lags the live state by up to one flush
+        participants = overlay_live_state(meeting.participants.all(), get_meeting_state(meeting.meeting_id))
         serializer = MeetingParticipantSerializer(participants, many=True)
         return Response(serializer.data)
 
@@ -149,12 +159,12 @@ class MeetingViewSet(viewsets.ModelViewSet):
         """Notify participants about meeting status changes"""
         async_to_sync(channel_layer.group_send)(
             f'meeting_{meeting.meeting_id}',
-            {
+            envelope({
                 'type': 'meeting_status_change',
                 'meeting_id': meeting.meeting_id,
                 'action': action,
                 'timestamp': timezone.now().isoformat()
-            }
+            })
         )
 
     def update_meeting_analytics(self, meeting):
@@ -176,12 +186,20 @@ class MeetingViewSet(viewsets.ModelViewSet):
             logger.error(f"Failed to update analytics for meeting {meeting.id}: {e}")
 
 
+def rejoining_guest(request, meeting):
+    """The guest participant of meeting whose guest token authenticated the request, if any"""
+    guest = request.user
+    if not isinstance(guest, GuestIdentity) or guest.meeting_id != meeting.meeting_id:
+        return None
+    return MeetingParticipant.objects.filter(id=guest.participant_id, meeting=meeting, is_guest=True).first()
+
+
 class JoinMeetingView(APIView):
     """
     Handle meeting join requests for both authenticated and guest users
     """
     authentication_classes = [OptionalAuthentication]
-    permission_classes = [AllowAny]
+    permission_classes = [permissions.AllowAny]
 
     def post(self, request, meeting_id):
         try:
@@ -223,13 +241,22 @@ class JoinMeetingView(APIView):
                     'role': 'participant'
                 }
 
-            # Create or update participant
-            participant, created = MeetingParticipant.objects.get_or_create(
-                meeting=meeting,
-                user_id=participant_data['user_id'],
-                email=participant_data['email'] if participant_data['is_guest'] else None,
-                defaults=participant_data
-            )
+            # Create or update participant. A guest only gets an existing row
+            # back by presenting its guest token; anything else (a name, an
+            # email) is not proof of identity, so every other guest join is a
+            # new participant.
+            if participant_data['is_guest']:
+                participant = rejoining_guest(request, meeting)
+                created = participant is None
+                if created:
+                    participant = MeetingParticipant.objects.create(**participant_data)
+            else:
+                participant, created = MeetingParticipant.objects.get_or_create(
+                    meeting=meeting,
+                    user_id=participant_data['user_id'],
+                    email=None,
+                    defaults=participant_data
+                )
 
             if not created:
                 # Update existing participant
@@ -241,11 +268,23 @@ class JoinMeetingView(APIView):
             participant.join_meeting()
 
             serializer = MeetingParticipantSerializer(participant)
-            return Response({
+            response_data = {
                 'participant': serializer.data,
                 'meeting': MeetingSerializer(meeting).data,
                 'join_url': meeting.get_join_url()
-            })
+            }
+            if participant.is_guest:
+                # Credential for the guest's later REST calls and websocket
+                response_data['guest_token'] = issue_guest_token(participant)
+                response_data['guest_token_expires_in'] = get_guest_token_max_age()
+
+            # Routing hint: the node whose sockets host this meeting
+            placement = placement_for(meeting.meeting_id)
+            response_data['websocket_node'] = placement
+            response = Response(response_data)
+            if placement is not None:
+                response['X-Meeting-Node'] = placement['node_id']
+            return response
 
         except Meeting.DoesNotExist:
             return Response(
@@ -275,15 +314,17 @@ class LeaveMeetingView(APIView):
         )
 
         participant.leave_meeting()
+        roster_version = remove_from_roster_sync(meeting.meeting_id, participant.id)
 
         # Notify other participants
         async_to_sync(channel_layer.group_send)(
             f'meeting_{meeting.meeting_id}',
-            {
+            envelope({
                 'type': 'participant_left',
                 'participant_id': str(participant.id),
-                'meeting_id': meeting.meeting_id
-            }
+                'meeting_id': meeting.meeting_id,
+                'roster_version': roster_version,
+            }, event_type='participant_left', participant_id=str(participant.id))
         )
 
         return Response({'message': 'Left meeting successfully'})
@@ -305,11 +346,11 @@ class WebRTCSignalingView(APIView):
         # Forward signaling message to target peer
         async_to_sync(channel_layer.group_send)(
             f'meeting_{meeting_id}',
-            {
+            envelope({
                 'type': 'webrtc_signaling',
                 'signaling_data': serializer.validated_data,
                 'meeting_id': meeting_id
-            }
+            })
         )
 
         return Response({'message': 'Signaling message sent'})
@@ -332,7 +373,10 @@ class MeetingControlView(APIView):
 
         # Get current participant
         participant = None
-        if request.user.is_authenticated:
+        if getattr(request.user, 'is_guest', False):
+            if request.user.meeting_id == meeting.meeting_id:
+                participant = meeting.participants.filter(id=request.user.participant_id).first()
+        elif request.user.is_authenticated:
             participant = meeting.participants.filter(user_id=request.user.id).first()
 
         if not participant:
@@ -341,18 +385,20 @@ class MeetingControlView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Handle different actions
+        overlay_live_state([participant], get_meeting_state(meeting_id))
+
+        # Handle different actions; media state is written behind via the live state store
         if action in ['mute_audio', 'unmute_audio']:
             participant.audio_enabled = action == 'unmute_audio'
-            participant.save()
+            save_participant_state(meeting_id, participant, audio_enabled=participant.audio_enabled)
 
         elif action in ['enable_video', 'disable_video']:
             participant.video_enabled = action == 'enable_video'
-            participant.save()
+            save_participant_state(meeting_id, participant, video_enabled=participant.video_enabled)
 
         elif action in ['start_screen_share', 'stop_screen_share']:
             participant.screen_sharing = action == 'start_screen_share'
-            participant.save()
+            save_participant_state(meeting_id, participant, screen_sharing=participant.screen_sharing)
 
         elif action == 'start_recording':
             if participant.role not in ['host', 'co_host']:
@@ -371,17 +417,18 @@ class MeetingControlView(APIView):
             meeting.status = 'ended'
             meeting.actual_end = timezone.now()
             meeting.save()
+            end_meeting_state(meeting.meeting_id)
 
         # Notify participants about the control action
         async_to_sync(channel_layer.group_send)(
             f'meeting_{meeting_id}',
-            {
+            envelope({
                 'type': 'meeting_control',
                 'action': action,
                 'participant_id': str(participant.id),
                 'target_participant_id': str(target_participant_id) if target_participant_id else None,
                 'meeting_id': meeting_id
-            }
+            })
         )
 
         return Response({
@@ -446,4 +493,15 @@ class PublicMeetingView(APIView):
             'max_participants': meeting.max_participants
         }
 
-        return Response(data)
\ No newline at end of file
+        return Response(data)
+
+
+class ServiceMetricsView(APIView):
+    """
+    Expose this worker's service metrics (token cache, inter-service calls)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Get a snapshot of the process-local metrics"""
+        return Response(metrics.snapshot())
@@ -0,0 +1,58 @@
+"""
+Wire formats for the meeting websocket.
+
+JSON text frames are the default. Clients that offer the
+``prismeet.msgpack.v1`` subprotocol get the same messages as MessagePack
+binary frames instead, which are smaller and cheaper to encode and decode,
+especially for SDP-heavy signaling.
+"""
+import json
+
+import msgpack
+
+MSGPACK_SUBPROTOCOL = 'prismeet.msgpack.v1'
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+
+class FrameDecodeError(ValueError):
+    """The client sent a frame that is not valid for its wire format"""
+
+
+def negotiate_codec(subprotocols):
+    """Codec for a socket given the subprotocols its client offered"""
+    return MSGPACK if MSGPACK_SUBPROTOCOL in subprotocols else JSON
+
+
+def encode_json(frame):
+    return json.dumps(frame)
+
+
+def encode_msgpack(frame):
+    return msgpack.packb(frame, use_bin_type=True)
+
+
+def encode_frame(codec, frame):
+    """Encode an outgoing frame in a socket's wire format"""
+    if codec == MSGPACK:
+        return encode_msgpack(frame)
+    return encode_json(frame)
+
+
+def decode_frame(codec, text_data=None, bytes_data=None):
+    """Decode an incoming frame into a message dict"""
+    try:
+        if codec == MSGPACK and bytes_data is not None:
+            message = msgpack.unpackb(bytes_data, raw=False)
+        elif text_data is not None:
+            # JSON stays accepted on binary sockets, e.g. from debugging tools
+            message = json.loads(text_data)
+        else:
+            raise FrameDecodeError('Binary frames need the msgpack subprotocol')
+    except (ValueError, msgpack.UnpackException) as e:
+        raise FrameDecodeError(str(e))
+
+    if not isinstance(message, dict):
+        raise FrameDecodeError('Frame is not an object')
+    return message